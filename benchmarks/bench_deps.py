@@ -0,0 +1,89 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Time the dependency closure on a synthetic index of deep dependency chains.
+
+The index, from synth.generate_chain_index, holds --chains chains of --depth
+eggs, each egg requiring the next one in its chain plus one of a few shared
+"base" eggs, over two python tags. The
+local index has every other chain head, so the closure walks the remaining
+chains in full. The indexed resolver is compared against resolving every
+requirement by scanning the remote index, on a reduced index for the scan.
+
+Usage:
+    python benchmarks/bench_deps.py [--chains N] [--depth N]
+"""
+import argparse
+import time
+
+from synth import generate_chain_index
+
+from brood_diff.deps import (
+    DependencyIndex, add_dependencies, dependency_closure, local_provides,
+    parse_requirement
+)
+
+
+class ScanningResolver(object):
+    """ Resolver scanning the whole index for every requirement."""
+
+    def __init__(self, index):
+        self.index = index
+
+    def resolve(self, requirement, python_tag=None):
+        name, version = parse_requirement(requirement)
+        for key, egg in self.index.items():
+            if (egg["name"] == name and egg["version"] == version and
+                    egg["python_tag"] == python_tag):
+                return key
+        return None
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--chains", type=int, default=2000)
+    parser.add_argument("--depth", type=int, default=100)
+    args = parser.parse_args()
+
+    remote_idx = dict(generate_chain_index(args.chains, args.depth))
+    local_names = [key for key, egg in remote_idx.items()
+                   if egg["name"].startswith("base") or
+                   (egg["name"].endswith("_0") and
+                    int(egg["name"][3:].split("_")[0]) % 2)]
+    roots = [key for key, egg in remote_idx.items()
+             if egg["name"].endswith("_0") and key not in local_names]
+    edges = sum(len(egg["packages"]) for egg in remote_idx.values())
+
+    build_time, dep_index = timed(lambda: DependencyIndex(remote_idx))
+    provides = local_provides(local_names)
+    closure_time, closure = timed(lambda: dependency_closure(
+        roots, remote_idx, dep_index, provides))
+    diff = {"missing": {key: remote_idx[key] for key in roots}}
+    total_time, _ = timed(lambda: add_dependencies(diff, remote_idx,
+                                                   local_names))
+    print("{} eggs, {} requirements, {} roots: closure of {} eggs".format(
+        len(remote_idx), edges, len(roots), len(closure["eggs"])))
+    print("{:<28}{:>10.3f} s".format("build DependencyIndex", build_time))
+    print("{:<28}{:>10.3f} s".format("dependency_closure", closure_time))
+    print("{:<28}{:>10.3f} s".format("add_dependencies (total)", total_time))
+
+    small = dict(generate_chain_index(max(args.chains // 50, 1), args.depth))
+    small_roots = [key for key, egg in small.items()
+                   if egg["name"].endswith("_0")]
+    for name, resolver in (("indexed", DependencyIndex(small)),
+                           ("scanning", ScanningResolver(small))):
+        elapsed, _ = timed(lambda: dependency_closure(
+            small_roots, small, resolver, set()))
+        print("{:<28}{:>10.3f} s  ({} eggs)".format(
+            "closure, " + name, elapsed, len(small)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Compare opening a snapshot against from_json_file on the same synthetic
+index, generated with synth.py.
+
+Reports the time to open each format, to look up 1000 eggs and to sum the
+sizes of every egg.
+
+Usage:
+    python benchmarks/bench_snapshot.py [--eggs N]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from synth import generate_index, write_index
+
+from brood_diff.diff import from_json_file
+from brood_diff.snapshot import Snapshot, write_snapshot
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--eggs", type=int, default=300_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "index.json")
+        snap_path = os.path.join(tmp, "index.snap")
+        write_index(json_path, generate_index(args.eggs))
+        build_time, _ = timed(
+            lambda: write_snapshot(from_json_file(json_path), snap_path))
+        print("{} eggs: json {:.1f} MB, snapshot {:.1f} MB, convert {:.2f} s"
+              .format(args.eggs, os.path.getsize(json_path) / 1e6,
+                      os.path.getsize(snap_path) / 1e6, build_time))
+
+        open_json, idx = timed(lambda: from_json_file(json_path))
+        open_snap, snapshot = timed(lambda: Snapshot(snap_path))
+        keys = random.Random(0).sample(sorted(idx), 1000)
+        lookup_json, _ = timed(lambda: [idx[key] for key in keys])
+        lookup_snap, _ = timed(lambda: [snapshot[key] for key in keys])
+        sum_json, _ = timed(lambda: sum(e["size"] for e in idx.values()))
+        sum_snap, _ = timed(lambda: sum(snapshot.sizes))
+
+        print("{:<20}{:>14}{:>14}".format("", "json (s)", "snapshot (s)"))
+        for name, json_time, snap_time in (
+                ("open", open_json, open_snap),
+                ("1000 lookups", lookup_json, lookup_snap),
+                ("sum sizes", sum_json, sum_snap)):
+            print("{:<20}{:>14.4f}{:>14.4f}".format(name, json_time,
+                                                    snap_time))
+        snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
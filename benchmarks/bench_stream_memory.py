@@ -0,0 +1,83 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Compare the peak RSS of from_json_file against the incremental and lazy
+readers.
+
+A synthetic remote index and a local index holding 99% of its eggs are
+generated with synth.py. Each loader then runs in a fresh subprocess, which
+reports its own peak RSS.
+
+Usage:
+    python benchmarks/bench_stream_memory.py [--eggs N]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from synth import write_index_pair
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+CASES = {
+    "from_json_file": (
+        "from brood_diff.diff import from_json_file\n"
+        "idx = from_json_file(REMOTE)\n"
+        "total = sum(egg['size'] for egg in idx.values())\n"),
+    "iter_json_index": (
+        "from brood_diff.jsonio import iter_json_index\n"
+        "total = sum(egg['size'] for _, egg in iter_json_index(REMOTE))\n"),
+    "gen-diff (dict)": (
+        "from brood_diff.diff import from_json_file, index_diff\n"
+        "diff = index_diff(from_json_file(LOCAL), from_json_file(REMOTE))\n"),
+    "gen-diff (streaming)": (
+        "from brood_diff.diff import index_diff\n"
+        "from brood_diff.jsonio import iter_json_index, iter_json_keys\n"
+        "diff = index_diff(iter_json_keys(LOCAL), iter_json_index(REMOTE))\n"),
+    "gen-diff (lazy)": (
+        "from brood_diff.diff import index_diff\n"
+        "from brood_diff.jsonio import LazyIndex\n"
+        "diff = index_diff(LazyIndex(LOCAL), LazyIndex(REMOTE))\n"),
+}
+
+FOOTER = (
+    "import resource\n"
+    "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n")
+
+
+def run_case(code, local, remote):
+    """ Run code in a subprocess, returning (seconds, peak RSS in MB)."""
+    script = "LOCAL = {!r}\nREMOTE = {!r}\n".format(local, remote) + code
+    start = time.perf_counter()
+    out = subprocess.check_output([sys.executable, "-c", script + FOOTER],
+                                  cwd=ROOT)
+    elapsed = time.perf_counter() - start
+    maxrss = int(out.split()[-1])
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return elapsed, maxrss / scale
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--eggs", type=int, default=300_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        remote = os.path.join(tmp, "remote.json")
+        local = os.path.join(tmp, "local.json")
+        write_index_pair(remote, local, args.eggs, overlap=0.99)
+        size_mb = os.path.getsize(remote) / 1e6
+        print("{} eggs, remote index {:.1f} MB".format(args.eggs, size_mb))
+        print("{:<24}{:>10}{:>16}".format("case", "time (s)", "peak RSS (MB)"))
+        for name, code in CASES.items():
+            elapsed, peak = run_case(code, local, remote)
+            print("{:<24}{:>10.2f}{:>16.1f}".format(name, elapsed, peak))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Load the fetch path against a local stand-in EDS server.
+
+Synthetic indices generated with synth.py are served by
+brood_diff.server.IndexServer for every repo/platform/version combination,
+with the given latency, bandwidth, error rate and 304 behaviour. Each
+scenario (gen_full_index, full_diff and the get-size function
+get_repo_size_by_platform) is then run for a number of rounds under
+--profile instrumentation. Reported per scenario:
+
+    round time      p50/p90/p99 and mean wall time of a round
+    throughput      requests and megabytes downloaded per second
+    latency         p50/p90/p99 and max time of a single request, as seen
+                    by the client including retries
+    statuses        count of each response status sent by the server
+
+With --cache every scenario shares an index cache across its rounds, so
+rounds after the first measure revalidation. --capacity makes the server
+fail the requests beyond that many at once, as an overloaded instance does,
+and --adaptive fetches through an AdaptiveLimiter with --jobs as its
+ceiling, reporting the limit it ended each scenario at. Results are written
+as json.
+
+Usage:
+    python benchmarks/load_harness.py [--eggs 10k] [--rounds N] [--jobs N]
+        [--latency S] [--bandwidth 10M] [--error-rate F] [--retries N]
+        [--no-conditional] [--cache] [--capacity N] [--adaptive]
+        [--scenarios name,...]
+        [--output load-results.json]
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+from collections import Counter
+from itertools import product
+
+from run_benchmarks import metadata, parse_size
+from synth import generate_index, write_index
+
+from brood_diff import profiling
+from brood_diff.cache import IndexCache
+from brood_diff.client import Client
+from brood_diff.diff import FetchError, full_diff, gen_full_index
+from brood_diff.limiter import AdaptiveLimiter
+from brood_diff.server import IndexServer
+from brood_diff.utils import get_repo_size_by_platform
+
+
+def run_gen_full_index(url, combos, client, jobs, paths):
+    gen_full_index(url, *combos, output=paths["output"], jobs=jobs,
+                   client=client)
+
+
+def run_full_diff(url, combos, client, jobs, paths):
+    full_diff(paths["local"], *combos, output=paths["output"],
+              remote_url=url, jobs=jobs, client=client)
+
+
+def run_get_size(url, combos, client, jobs, paths):
+    get_repo_size_by_platform(*combos, jobs=jobs, client=client, url=url)
+
+
+SCENARIOS = {"gen_full_index": run_gen_full_index,
+             "full_diff": run_full_diff,
+             "get-size": run_get_size}
+
+
+def percentile(values: list, fraction: float) -> float:
+    """ Nearest-rank percentile of values, 0.0 if there are none."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(fraction * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(rounds: list, latencies: list, statuses: Counter,
+              failed: int) -> dict:
+    wall = sum(r["seconds"] for r in rounds)
+    requests = sum(r["requests"] for r in rounds)
+    downloaded = sum(r["bytes"] for r in rounds)
+    return {"rounds": len(rounds),
+            "failed_rounds": failed,
+            "round_p50": percentile([r["seconds"] for r in rounds], 0.5),
+            "round_p90": percentile([r["seconds"] for r in rounds], 0.9),
+            "round_p99": percentile([r["seconds"] for r in rounds], 0.99),
+            "round_mean": wall / len(rounds),
+            "requests": requests,
+            "requests_per_second": requests / wall,
+            "megabytes_per_second": downloaded / 1e6 / wall,
+            "latency_p50": percentile(latencies, 0.5),
+            "latency_p90": percentile(latencies, 0.9),
+            "latency_p99": percentile(latencies, 0.99),
+            "latency_max": max(latencies, default=0.0),
+            "statuses": {str(status): count
+                         for status, count in sorted(statuses.items())}}
+
+
+def run_scenario(name, server, combos, args, paths) -> dict:
+    """ Run a scenario for args.rounds rounds and summarize them."""
+    cache = (IndexCache(tempfile.mkdtemp(dir=paths["tmp"]))
+             if args.cache else None)
+    rounds, latencies, statuses = [], [], Counter()
+    failed = 0
+    limiter = AdaptiveLimiter(args.jobs) if args.adaptive else None
+    with Client(pool_size=args.jobs, retries=args.retries,
+                backoff=args.backoff, cache=cache,
+                limiter=limiter) as client:
+        for _ in range(args.rounds):
+            seen = len(server.statuses)
+            profiling.start()
+            try:
+                # keep get_index's per-request progress lines out of the
+                # report
+                with contextlib.redirect_stdout(io.StringIO()):
+                    SCENARIOS[name](server.url, combos, client, args.jobs,
+                                    paths)
+            except FetchError:
+                failed += 1
+            report = profiling.finish()
+            statuses.update(server.statuses[seen:])
+            latencies.extend(r["seconds"] for r in report["resources"])
+            rounds.append({"seconds": report["wall_seconds"],
+                           "requests": len(report["resources"]),
+                           "bytes": report["bytes_downloaded"]})
+    result = summarize(rounds, latencies, statuses, failed)
+    if limiter is not None:
+        result["limiter"] = limiter.summary()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--eggs", default="10k",
+                        help="eggs per index, e.g. 10k")
+    parser.add_argument("--repos", default="enthought/free,enthought/gpl")
+    parser.add_argument("--platforms", default="rh6-x86_64,osx-x86_64")
+    parser.add_argument("--versions", default="cp27,cp36")
+    parser.add_argument("--overlap", type=float, default=0.9)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--jobs", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--bandwidth", default=None,
+                        help="bytes per second, e.g. 10M")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--retries", type=int, default=3)
+    parser.add_argument("--backoff", type=float, default=0.05)
+    parser.add_argument("--no-conditional", action="store_true")
+    parser.add_argument("--cache", action="store_true")
+    parser.add_argument("--capacity", type=int, default=None,
+                        help="requests the server serves at once")
+    parser.add_argument("--adaptive", action="store_true")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", default="load-results.json")
+    args = parser.parse_args()
+
+    scenarios = args.scenarios.split(",")
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error("Unknown scenarios: {}".format(", ".join(unknown)))
+    combos = tuple(tuple(value.split(",")) for value in
+                   (args.repos, args.platforms, args.versions))
+    n_eggs = parse_size(args.eggs)
+    bandwidth = parse_size(args.bandwidth) if args.bandwidth else None
+
+    server = IndexServer(latency=args.latency, bandwidth=bandwidth,
+                         error_rate=args.error_rate,
+                         conditional=not args.no_conditional,
+                         seed=args.seed, capacity=args.capacity)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, server:
+        paths = {"tmp": tmp, "local": os.path.join(tmp, "local.json"),
+                 "output": os.path.join(tmp, "output.json")}
+        start = time.perf_counter()
+        local = {}
+        for number, (org_repo, plat, ver) in enumerate(product(*combos)):
+            items = list(generate_index(n_eggs, seed=args.seed + number,
+                                        product=org_repo.split("/")[1],
+                                        python_tag=ver))
+            server.add_index(org_repo, plat, ver, dict(items))
+            local.update(items[:int(len(items) * args.overlap)])
+        write_index(paths["local"], local.items())
+        print("serving {} indices of {} eggs at {}, generated in "
+              "{:.1f} s".format(len(server.indices) // 2, n_eggs, server.url,
+                                time.perf_counter() - start))
+
+        print("{:<16}{:>9}{:>9}{:>10}{:>10}{:>10}{:>10}".format(
+            "scenario", "round", "req/s", "MB/s", "lat p50", "lat p90",
+            "lat p99"))
+        for name in scenarios:
+            result = run_scenario(name, server, combos, args, paths)
+            results[name] = result
+            print("{:<16}{:>9.3f}{:>9.1f}{:>10.1f}{:>10.4f}{:>10.4f}"
+                  "{:>10.4f}".format(
+                      name, result["round_p50"],
+                      result["requests_per_second"],
+                      result["megabytes_per_second"], result["latency_p50"],
+                      result["latency_p90"], result["latency_p99"]))
+
+    meta = metadata(args)
+    meta.update(eggs=n_eggs, rounds=args.rounds, jobs=args.jobs,
+                latency=args.latency, bandwidth=bandwidth,
+                error_rate=args.error_rate, retries=args.retries,
+                conditional=not args.no_conditional, cache=args.cache,
+                capacity=args.capacity, adaptive=args.adaptive)
+    with open(args.output, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=2)
+    print("results written to {}".format(args.output))
+
+
+if __name__ == "__main__":
+    main()
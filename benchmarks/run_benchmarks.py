@@ -0,0 +1,214 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Benchmark the load, write, diff, merge and size paths on synthetic indices.
+
+For each index size a remote index and a local index sharing --overlap of
+its eggs are generated with synth.py. Every operation then runs in a fresh
+subprocess, which reports the wall time of the operation itself and its peak
+RSS. Inputs an operation does not measure (e.g. the index written by
+to_json_file) are loaded before the clock starts; the RSS at that point is
+recorded as start_rss_mb.
+
+Results are written as json, with enough metadata to tell runs apart. Pass
+a previous results file with --compare to print the change of every
+measurement against it.
+
+Usage:
+    python benchmarks/run_benchmarks.py [--sizes 10k,100k,1M]
+        [--overlap F] [--seed N] [--ops op,...] [--output results.json]
+        [--compare old-results.json]
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from synth import generate_index, write_index, write_index_pair
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+PRELUDE = (
+    "import json, resource, sys, time\n"
+    "def rss_mb():\n"
+    "    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024\n"
+    "    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale\n")
+
+# Each operation sets up its inputs, then runs the code between the
+# "# start" and "# stop" markers, which is what gets timed.
+OPERATIONS = {
+    "from_json_file": (
+        "from brood_diff.diff import from_json_file\n"
+        "# start\n"
+        "idx = from_json_file(REMOTE)\n"
+        "# stop\n"),
+    "to_json_file": (
+        "from brood_diff.diff import from_json_file, to_json_file\n"
+        "idx = from_json_file(REMOTE)\n"
+        "# start\n"
+        "to_json_file(idx, OUTPUT, sort=True)\n"
+        "# stop\n"),
+    "index_diff": (
+        "from brood_diff.diff import from_json_file, index_diff\n"
+        "local, remote = from_json_file(LOCAL), from_json_file(REMOTE)\n"
+        "# start\n"
+        "diff = index_diff(local, remote, detect_changed=True)\n"
+        "# stop\n"),
+    "gen-diff": (
+        "from click.testing import CliRunner\n"
+        "from brood_diff.diff import cli\n"
+        "# start\n"
+        "result = CliRunner().invoke(\n"
+        "    cli, ['gen-diff', '-l', LOCAL, '-r', REMOTE, '-o', OUTPUT])\n"
+        "assert result.exit_code == 0, result.output\n"
+        "# stop\n"),
+    "merge_json": (
+        "from brood_diff.diff import merge_json\n"
+        "# start\n"
+        "merge_json([LOCAL, SECOND], OUTPUT)\n"
+        "# stop\n"),
+    "get_repo_size_by_platform": (
+        "import threading\n"
+        "from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer\n"
+        "from brood_diff.utils import get_repo_size_by_platform\n"
+        "with open(REMOTE, 'rb') as f:\n"
+        "    BODY = f.read()\n"
+        "class Handler(BaseHTTPRequestHandler):\n"
+        "    protocol_version = 'HTTP/1.1'\n"
+        "    def do_GET(self):\n"
+        "        self.send_response(200)\n"
+        "        self.send_header('Content-Length', str(len(BODY)))\n"
+        "        self.end_headers()\n"
+        "        self.wfile.write(BODY)\n"
+        "    def log_message(self, *args):\n"
+        "        pass\n"
+        "httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)\n"
+        "threading.Thread(target=httpd.serve_forever, daemon=True).start()\n"
+        "url = 'http://127.0.0.1:{}'.format(httpd.server_port)\n"
+        "# start\n"
+        "get_repo_size_by_platform(('enthought/free',), ('rh6-x86_64',),\n"
+        "                          ('cp36',), url=url)\n"
+        "# stop\n"),
+}
+
+
+def parse_size(text: str) -> int:
+    """ Egg count from e.g. 10k or 1M."""
+    text = text.strip().lower()
+    scale = {"k": 10 ** 3, "m": 10 ** 6}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+
+def operation_script(code: str, paths: dict) -> str:
+    """ Script running an operation and printing its measurements."""
+    setup, rest = code.split("# start\n")
+    timed_code, teardown = rest.split("# stop\n")
+    lines = [PRELUDE]
+    lines.extend("{} = {!r}\n".format(name, path)
+                 for name, path in paths.items())
+    lines.append(setup)
+    lines.append("start_rss = rss_mb()\nstart = time.perf_counter()\n")
+    lines.append(timed_code)
+    lines.append("seconds = time.perf_counter() - start\n")
+    lines.append(teardown)
+    lines.append("print(json.dumps({'seconds': seconds, "
+                 "'start_rss_mb': start_rss, 'peak_rss_mb': rss_mb()}))\n")
+    return "".join(lines)
+
+
+def run_operation(code: str, paths: dict) -> dict:
+    """ Run an operation in a fresh interpreter and return its
+    measurements."""
+    out = subprocess.check_output(
+        [sys.executable, "-c", operation_script(code, paths)], cwd=ROOT)
+    return json.loads(out.decode().splitlines()[-1])
+
+
+def metadata(args) -> dict:
+    try:
+        revision = subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+            stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {"date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "revision": revision,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "seed": args.seed,
+            "overlap": args.overlap}
+
+
+def compare(results: list, baseline_path: str) -> None:
+    """ Print the change of every measurement against a previous run."""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    previous = {(r["operation"], r["eggs"]): r for r in baseline["results"]}
+    print("\nchange against {} (revision {})".format(
+        baseline_path, baseline["meta"].get("revision")))
+    print("{:<28}{:>10}{:>12}{:>14}".format(
+        "operation", "eggs", "time", "peak RSS"))
+    for result in results:
+        old = previous.get((result["operation"], result["eggs"]))
+        if old is None:
+            continue
+        print("{:<28}{:>10}{:>+11.1%}{:>+14.1%}".format(
+            result["operation"], result["eggs"],
+            result["seconds"] / old["seconds"] - 1,
+            result["peak_rss_mb"] / old["peak_rss_mb"] - 1))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", default="10k,100k,1M")
+    parser.add_argument("--overlap", type=float, default=0.9)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--ops", default=",".join(OPERATIONS))
+    parser.add_argument("--output", default="benchmark-results.json")
+    parser.add_argument("--compare", default=None)
+    args = parser.parse_args()
+
+    operations = args.ops.split(",")
+    unknown = set(operations) - set(OPERATIONS)
+    if unknown:
+        parser.error("Unknown operations: {}".format(", ".join(unknown)))
+
+    results = []
+    print("{:<28}{:>10}{:>12}{:>14}".format(
+        "operation", "eggs", "time (s)", "peak RSS (MB)"))
+    for size in (parse_size(text) for text in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            paths = {name: os.path.join(tmp, name.lower() + ".json")
+                     for name in ("REMOTE", "LOCAL", "SECOND", "OUTPUT")}
+            start = time.perf_counter()
+            write_index_pair(paths["REMOTE"], paths["LOCAL"], size,
+                             args.overlap, seed=args.seed)
+            write_index(paths["SECOND"], generate_index(
+                size // 10, seed=args.seed + 2, product="gpl"))
+            print("generated {} eggs in {:.1f} s".format(
+                size, time.perf_counter() - start))
+            for operation in operations:
+                result = run_operation(OPERATIONS[operation], paths)
+                result.update(operation=operation, eggs=size,
+                              index_mb=os.path.getsize(paths["REMOTE"]) / 1e6)
+                results.append(result)
+                print("{:<28}{:>10}{:>12.3f}{:>14.1f}".format(
+                    operation, size, result["seconds"],
+                    result["peak_rss_mb"]))
+
+    with open(args.output, "w") as f:
+        json.dump({"meta": metadata(args), "results": results}, f, indent=2)
+    print("results written to {}".format(args.output))
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Seeded generator of realistic synthetic EDS indices.
+
+Records follow the schema of test_data/idx-e-free-rh6-36.json: every field
+of a real record is present, egg names are "<Name>-<version>-<build>.egg"
+with the occasional capitalized project name, sizes are log-normally
+distributed around the same median, most eggs carry a python tag and the
+packages lists have the same spread of lengths, each requirement naming an
+egg generated earlier so that requirements resolve within the index.
+
+The same seed and arguments always produce the same index. An index pair
+for diff benchmarks shares a controllable fraction of eggs between the
+local and remote sides. generate_chain_index builds the deep dependency
+chains the dependency and sharding benchmarks walk, with records of the
+same schema.
+
+Usage:
+    python benchmarks/synth.py --eggs N [--overlap F] [--changed F]
+                               [--seed N] remote.json [local.json]
+"""
+import argparse
+import json
+import random
+import string
+from typing import Iterator, Tuple
+
+# Number of requirements of an egg, weighted as in the sample index.
+PACKAGE_COUNTS = (0, 1, 2, 3, 4, 5, 6, 7, 8, 10, 15)
+PACKAGE_WEIGHTS = (27, 17, 16, 11, 8, 3, 6, 2, 2, 3, 5)
+
+MTIME_START = 1388534400.0  # 2014-01-01
+MTIME_END = 1546300800.0  # 2019-01-01
+
+
+def generate_index(n_eggs: int, seed: int = 0, product: str = "free",
+                   python_tag: str = "cp36"
+                   ) -> Iterator[Tuple[str, dict]]:
+    """ Yield the (egg_name, metadata) pairs of an index of n_eggs eggs.
+
+    Eggs come in projects of a few versions and builds each. About one egg
+    in twenty has no python tag.
+    """
+    rng = random.Random(seed)
+    projects = []
+    produced = []
+    count = 0
+    while count < n_eggs:
+        name = _project_name(rng, len(projects))
+        key_name = name.capitalize() if rng.random() < 0.1 else name
+        projects.append(name)
+        tag = python_tag if rng.random() > 0.05 else None
+        for version in _versions(rng):
+            for build in range(1, rng.choice((1, 1, 1, 2, 3)) + 1):
+                if count == n_eggs:
+                    break
+                full_version = "{}-{}".format(version, build)
+                n_packages = rng.choices(PACKAGE_COUNTS, PACKAGE_WEIGHTS)[0]
+                packages = []
+                for _ in range(min(n_packages, len(produced))):
+                    # Favour recent projects, as a real index mostly
+                    # requires its own current stack.
+                    dep = produced[-1 - int(rng.expovariate(0.01)) %
+                                   len(produced)]
+                    packages.append("{} {}".format(*dep))
+                record = _record(rng, name, version, build, packages,
+                                 product, tag)
+                yield "{}-{}.egg".format(key_name, full_version), record
+                count += 1
+            produced.append((name, version))
+
+
+def generate_chain_index(chains: int, depth: int,
+                         tags: Tuple[str, ...] = ("cp27", "cp36"),
+                         bases: int = 5, seed: int = 0, product: str = "free"
+                         ) -> Iterator[Tuple[str, dict]]:
+    """ Yield the (egg_name, metadata) pairs of an index of deep dependency
+    chains, for the dependency closure and sharding benchmarks.
+
+    For every python tag there are bases "base<b>" eggs and chains chains of
+    depth "pkg<c>_<d>" eggs, each requiring the next egg of its chain and
+    one of the base eggs. Every egg is version 1.0, with the python tag's
+    position in tags as build number.
+    """
+    rng = random.Random(seed)
+    for build, tag in enumerate(tags, 1):
+        for b in range(bases):
+            name = "base{}".format(b)
+            yield "{}-1.0-{}.egg".format(name, build), _record(
+                rng, name, "1.0", build, [], product, tag)
+        for c in range(chains):
+            for d in range(depth):
+                name = "pkg{}_{}".format(c, d)
+                packages = ["base{} 1.0".format((c + d) % bases)]
+                if d + 1 < depth:
+                    packages.append("pkg{}_{} 1.0".format(c, d + 1))
+                yield "{}-1.0-{}.egg".format(name, build), _record(
+                    rng, name, "1.0", build, packages, product, tag)
+
+
+def _record(rng: random.Random, name: str, version: str, build: int,
+            packages: list, product: str, python_tag: str) -> dict:
+    """ An egg record with every field of a real one, its digests, mtime
+    and size drawn from rng."""
+    return {"available": True,
+            "build": build,
+            "full_version": "{}-{}".format(version, build),
+            "md5": "%032x" % rng.getrandbits(128),
+            "mtime": float(int(rng.uniform(MTIME_START, MTIME_END))),
+            "name": name,
+            "packages": sorted(set(packages)),
+            "platform_abi": "gnu",
+            "product": product,
+            "python_tag": python_tag,
+            "sha256": "%064x" % rng.getrandbits(256),
+            "size": _size(rng),
+            "type": "egg",
+            "version": version}
+
+
+def _project_name(rng: random.Random, number: int) -> str:
+    """ A pronounceable-ish project name, unique by its number suffix."""
+    stem = "".join(rng.choice(string.ascii_lowercase)
+                   for _ in range(rng.randint(3, 9)))
+    separator = rng.choice(("", "", "", "_", "."))
+    return "{}{}{}".format(stem, separator, _base26(number))
+
+
+def _base26(number: int) -> str:
+    letters = []
+    while True:
+        number, digit = divmod(number, 26)
+        letters.append(string.ascii_lowercase[digit])
+        if not number:
+            return "".join(reversed(letters))
+
+
+def _versions(rng: random.Random) -> list:
+    major, minor = rng.randint(0, 5), rng.randint(0, 20)
+    versions = []
+    for _ in range(rng.choice((1, 1, 2, 2, 3, 4, 6))):
+        versions.append("{}.{}.{}".format(major, minor, rng.randint(0, 9)))
+        minor += 1
+    return versions
+
+
+def _size(rng: random.Random) -> int:
+    """ Egg size in bytes, log-normal with the sample index's median of
+    about 340 KB."""
+    return max(700, min(int(rng.lognormvariate(12.7, 2.0)), 500_000_000))
+
+
+def write_index(path: str, items: Iterator[Tuple[str, dict]]) -> int:
+    """ Write (egg_name, metadata) pairs as a json index one entry at a
+    time. Returns the number of eggs written."""
+    count = 0
+    with open(path, "w") as f:
+        f.write("{")
+        for key, record in items:
+            if count:
+                f.write(", ")
+            f.write(json.dumps(key) + ": " + json.dumps(record))
+            count += 1
+        f.write("}")
+    return count
+
+
+def write_index_pair(remote_path: str, local_path: str, n_eggs: int,
+                     overlap: float = 0.9, changed: float = 0.0,
+                     seed: int = 0) -> Tuple[int, int]:
+    """ Write a remote index of n_eggs eggs and a local index holding a
+    fraction overlap of them, of which a fraction changed have a different
+    sha256, md5 and size. Returns the egg counts of both sides."""
+    rng = random.Random(seed + 1)
+    n_remote = n_local = 0
+    with open(remote_path, "w") as remote, open(local_path, "w") as local:
+        remote.write("{")
+        local.write("{")
+        for key, record in generate_index(n_eggs, seed):
+            entry = json.dumps(key) + ": "
+            remote.write((", " if n_remote else "") + entry +
+                         json.dumps(record))
+            n_remote += 1
+            if rng.random() >= overlap:
+                continue
+            if rng.random() < changed:
+                record = dict(record,
+                              md5="%032x" % rng.getrandbits(128),
+                              sha256="%064x" % rng.getrandbits(256),
+                              size=_size(rng))
+            local.write((", " if n_local else "") + entry +
+                        json.dumps(record))
+            n_local += 1
+        remote.write("}")
+        local.write("}")
+    return n_remote, n_local
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("remote")
+    parser.add_argument("local", nargs="?")
+    parser.add_argument("--eggs", type=int, default=10_000)
+    parser.add_argument("--overlap", type=float, default=0.9)
+    parser.add_argument("--changed", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.local:
+        counts = write_index_pair(args.remote, args.local, args.eggs,
+                                  args.overlap, args.changed, args.seed)
+        print("remote: {} eggs, local: {} eggs".format(*counts))
+    else:
+        count = write_index(args.remote, generate_index(args.eggs, args.seed))
+        print("{} eggs".format(count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Diffs of many customer indices against the same remote index, for the
+batch-diff command.
+
+The remote index is converted to a snapshot once and memory-mapped by every
+diff, so it is parsed a single time however many customers are diffed, and
+the diffs run on a pool of processes.
+"""
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Mapping, Tuple, Union
+
+from brood_diff import profiling
+from brood_diff.indices import (
+    index_diff, iter_index, open_index, to_json_file, write_diff
+)
+from brood_diff.snapshot import Snapshot, is_snapshot, write_snapshot
+
+
+# File name suffixes of the local indices read by batch-diff.
+INDEX_SUFFIXES = (".json.gz", ".json.xz", ".json", ".snap")
+# Diff of the eggs missing for every customer, written by batch-diff.
+COMMON_MISSING = "common-missing.json"
+
+
+def local_index_files(directory: str) -> Dict[str, str]:
+    """ Map customer names to the index files in directory, named after the
+    file without its .json, .json.gz, .json.xz or .snap suffix. Hidden files
+    and subdirectories are skipped. Raises ValueError if two files give the
+    same name or a name is reserved for batch_diff output."""
+    paths = {}
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if filename.startswith(".") or not os.path.isfile(path):
+            continue
+        name = next((filename[:-len(suffix)] for suffix in INDEX_SUFFIXES
+                     if filename.endswith(suffix)), filename)
+        if name + ".json" == COMMON_MISSING:
+            raise ValueError("{} is a reserved customer name".format(name))
+        if name in paths:
+            raise ValueError("{} and {} are both indices of {}".format(
+                os.path.basename(paths[name]), filename, name))
+        paths[name] = path
+    return paths
+
+
+def batch_diff(local_paths: Mapping, remote: Union[str, Mapping],
+               output_dir: str, processes: int = 1,
+               detect_changed: bool = False, sort: bool = True) -> dict:
+    """ Diff several local indices against the same remote index.
+
+    local_paths maps customer names to local index files, json or
+    snapshots, and the diff of each is written to <customer>.json in
+    output_dir. remote is an index file or a mapping. Unless it is already
+    a snapshot it is written once to a temporary snapshot which every diff
+    maps, so the remote side is parsed once and shared between the pool of
+    processes computing the diffs. COMMON_MISSING is written alongside, a
+    diff of the eggs missing for every customer, e.g. to prebuild a shared
+    transfer bundle.
+
+    Returns {"customers": {name: {"missing": n, "changed": n}},
+    "common_missing": n, "failures": {name: exception}}; a customer whose
+    index cannot be read is reported in failures and left out of the
+    common eggs.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        if isinstance(remote, str) and is_snapshot(remote):
+            snapshot_path = remote
+        else:
+            snapshot_path = os.path.join(tmp, "remote.snap")
+            with profiling.phase("load"):
+                write_snapshot(iter_index(remote)
+                               if isinstance(remote, str) else remote,
+                               snapshot_path)
+
+        tasks = [(name, path, os.path.join(output_dir, name + ".json"))
+                 for name, path in local_paths.items()]
+        args = (snapshot_path, detect_changed, sort)
+        with profiling.phase("diff"):
+            if processes > 1 and len(tasks) > 1:
+                with ProcessPoolExecutor(
+                        max_workers=min(processes, len(tasks))) as executor:
+                    futures = [executor.submit(_batch_customer, path, output,
+                                               *args)
+                               for _, path, output in tasks]
+                outcomes = [_outcome(future.result) for future in futures]
+            else:
+                outcomes = [_outcome(_batch_customer, path, output, *args)
+                            for _, path, output in tasks]
+
+        report = {"customers": {}, "failures": {}}
+        common = None
+        for (name, _, _), (result, exc) in zip(tasks, outcomes):
+            if exc is not None:
+                report["failures"][name] = exc
+                continue
+            missing, changed = result
+            report["customers"][name] = {"missing": len(missing),
+                                         "changed": changed}
+            common = set(missing) if common is None else common & set(missing)
+        with Snapshot(snapshot_path) as snapshot:
+            common_missing = {key: snapshot[key] for key in common or ()}
+        report["common_missing"] = len(common_missing)
+        to_json_file({"missing": common_missing},
+                     os.path.join(output_dir, COMMON_MISSING), sort=sort)
+    profiling.count("customers", len(report["customers"]))
+    return report
+
+
+def _batch_customer(local_path: str, output: str, snapshot_path: str,
+                    detect_changed: bool, sort: bool) -> Tuple[list, int]:
+    """ Diff one local index against the remote snapshot and write it,
+    returning the missing egg names and the number of changed eggs."""
+    with open_index(local_path) as local_idx, \
+            Snapshot(snapshot_path) as remote_idx:
+        diff = index_diff(local_idx, remote_idx,
+                          detect_changed=detect_changed)
+    write_diff(diff, output, sort=sort)
+    return list(diff["missing"]), len(diff.get("changed", ()))
+
+
+def _outcome(func, *args) -> tuple:
+    """ (result, None) of func(*args), or (None, exception) if reading or
+    writing an index failed."""
+    try:
+        return func(*args), None
+    except (OSError, ValueError) as e:
+        return None, e
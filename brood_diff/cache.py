@@ -0,0 +1,232 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Persistent on-disk cache for fetched EDS indices.
+
+Entries are keyed by the resource URL and store the response body together
+with its ETag/Last-Modified headers, so that a later request can be made
+conditional and a 304 Not Modified served from disk. v1 and legacy v0 routes
+are kept in separate subdirectories. The cache is bounded in size; the least
+recently used entries are evicted first.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from typing import Callable, List, Mapping, Optional, Tuple
+
+import click
+
+from brood_diff import valid
+
+
+DEFAULT_CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME",
+                   os.path.join(os.path.expanduser("~"), ".cache")),
+    "brood_diff")
+DEFAULT_MAX_CACHE_SIZE = 1_000_000_000
+
+BODY_SUFFIX = ".body"
+META_SUFFIX = ".meta"
+
+
+class IndexCache(object):
+    """ Size-bounded LRU cache of index responses on disk.
+
+    An entry is a pair of files, <key>.body holding the raw response and
+    <key>.meta holding the url and validators. Every store or hit updates the
+    body's mtime, which is what eviction orders by.
+
+    The size of the cache is measured on the first store and then kept up
+    to date by each store, so the cache directory is only walked again when
+    a store takes it over max_size. Eviction measures it afresh, which
+    accounts for other processes sharing the directory.
+    """
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR,
+                 max_size: int = DEFAULT_MAX_CACHE_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # Bytes in the cache, None until measured.
+        self._size = None
+        self._lock = threading.Lock()
+
+    def conditional_headers(self, resource: str) -> dict:
+        """ If-None-Match/If-Modified-Since headers for a cached resource."""
+        meta = self._read_meta(resource)
+        if meta is None:
+            return {}
+        return validator_headers(meta)
+
+    def load(self, resource: str) -> Optional[bytes]:
+        """ Cached body for resource, or None if it is not cached."""
+        body_path = self._path(resource) + BODY_SUFFIX
+        try:
+            with open(body_path, "rb") as f:
+                body = f.read()
+            os.utime(body_path)
+        except FileNotFoundError:
+            return None
+        return body
+
+    def store(self, resource: str, body: bytes,
+              headers: Mapping[str, str]) -> None:
+        """ Store a 200 response if it carries a validator to revalidate
+        it with, then evict down to max_size if it no longer fits."""
+        meta = response_validators(headers)
+        if not (meta["etag"] or meta["last_modified"]):
+            return
+        path = self._path(resource)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        meta["url"] = resource
+        meta_data = json.dumps(meta).encode()
+        replaced = _entry_size(path)
+        atomic_write(path + BODY_SUFFIX, body)
+        atomic_write(path + META_SUFFIX, meta_data)
+        with self._lock:
+            if self._size is None:
+                self._size = self._entries()[1]
+            else:
+                self._size += len(body) + len(meta_data) - replaced
+            full = self._size > self.max_size
+        if full:
+            self.evict()
+
+    def evict(self) -> None:
+        """ Remove least recently used entries until the cache fits."""
+        with self._lock:
+            entries, total = self._entries()
+            entries.sort()
+            for _, size, base in entries:
+                if total <= self.max_size:
+                    break
+                for suffix in (META_SUFFIX, BODY_SUFFIX):
+                    try:
+                        os.remove(base + suffix)
+                    except FileNotFoundError:
+                        pass
+                total -= size
+            self._size = total
+
+    def clear(self) -> None:
+        """ Remove every cached entry."""
+        max_size, self.max_size = self.max_size, -1
+        try:
+            self.evict()
+        finally:
+            self.max_size = max_size
+
+    def _entries(self) -> Tuple[List[Tuple[float, int, str]], int]:
+        """ (mtime, size, path without suffix) of every entry, and their
+        total size."""
+        entries = []
+        total = 0
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for name in filenames:
+                if not name.endswith(BODY_SUFFIX):
+                    continue
+                base = os.path.join(dirpath, name[:-len(BODY_SUFFIX)])
+                try:
+                    st = os.stat(base + BODY_SUFFIX)
+                    size = st.st_size + os.path.getsize(base + META_SUFFIX)
+                except FileNotFoundError:
+                    continue
+                entries.append((st.st_mtime, size, base))
+                total += size
+        return entries, total
+
+    def _path(self, resource: str) -> str:
+        """ Path of an entry without suffix, under its route subdirectory."""
+        key = hashlib.sha256(resource.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, _route_dir(resource), key[:2], key)
+
+    def _read_meta(self, resource: str) -> Optional[dict]:
+        path = self._path(resource)
+        try:
+            with open(path + META_SUFFIX, "rb") as f:
+                meta = json.loads(f.read().decode("utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        if meta.get("url") != resource or not os.path.exists(
+                path + BODY_SUFFIX):
+            return None
+        return meta
+
+
+def response_validators(headers: Mapping[str, str]) -> dict:
+    """ The ETag and Last-Modified validators of a response."""
+    return {"etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified")}
+
+
+def validator_headers(validators: Mapping[str, str]) -> dict:
+    """ If-None-Match/If-Modified-Since headers for stored validators."""
+    headers = {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+    return headers
+
+
+def _route_dir(resource: str) -> str:
+    """ Subdirectory for a resource, one per EDS api version."""
+    for route in ("v0", "v1"):
+        if "/api/{}/".format(route) in resource:
+            return route
+    return "other"
+
+
+def _entry_size(path: str) -> int:
+    """ Bytes of the entry at path (without suffix), 0 if there is none."""
+    try:
+        return (os.path.getsize(path + BODY_SUFFIX) +
+                os.path.getsize(path + META_SUFFIX))
+    except FileNotFoundError:
+        return 0
+
+
+def atomic_write(path: str, data: bytes) -> None:
+    """ Write data to path via a temporary file and rename."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path),
+                                    suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def cache_from_options(cache_dir: str, no_cache: bool,
+                       max_cache_size: int) -> Optional[IndexCache]:
+    """ IndexCache for the --cache-dir/--no-cache/--max-cache-size CLI
+    options, or None if caching is disabled."""
+    if no_cache:
+        return None
+    return IndexCache(cache_dir, max_cache_size)
+
+
+def cache_options(f: Callable) -> Callable:
+    """ Decorator adding the --cache-dir, --no-cache and --max-cache-size
+    CLI options, see cache_from_options."""
+    options = [
+        click.option('--cache-dir', type=click.Path(file_okay=False),
+                     default=DEFAULT_CACHE_DIR,
+                     help=("<path> Directory of the on-disk index cache."
+                           "\nDefault: {}".format(DEFAULT_CACHE_DIR))),
+        click.option('--no-cache', is_flag=True, default=False,
+                     help=("Fetch every index in full without using the "
+                           "cache.")),
+        click.option('--max-cache-size', type=str,
+                     callback=valid.validate_size,
+                     default=str(DEFAULT_MAX_CACHE_SIZE),
+                     help=("<size> Maximum size of the index cache, e.g. "
+                           "500MB.\nDefault: 1GB")),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
@@ -0,0 +1,177 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Shared HTTP client used for every EDS index request.
+
+A Client wraps a single requests.Session so that connections are pooled and
+kept alive across requests, applies a timeout to every request and retries
+429 and 50* responses with jittered exponential backoff. A client may also
+be given an AdaptiveLimiter, through which every request is admitted (see
+limiter).
+"""
+import random
+import threading
+import time
+from typing import Callable, Optional, Tuple, Union
+
+import click
+import requests
+from requests.adapters import HTTPAdapter
+
+from brood_diff.cache import IndexCache
+from brood_diff.limiter import AdaptiveLimiter
+
+
+# HTTP statuses worth retrying: rate limiting and Brood internal errors.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_POOL_SIZE = 8
+# Default number of concurrent requests used by the fan-out commands.
+DEFAULT_JOBS = 8
+DEFAULT_TIMEOUT = 60.0
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_BACKOFF_MAX = 30.0
+
+
+class Client(object):
+    """ Pooled, keep-alive HTTP client with retry and backoff.
+
+    pool_size should match the number of concurrent requests so that no
+    connection is discarded when the pool is full. timeout is in seconds and
+    may be a (connect, read) tuple. A retried request waits a random delay
+    between 0 and min(backoff_max, backoff * 2 ** attempt), or the server's
+    Retry-After if that is longer.
+
+    cache, if given, is the IndexCache get_index uses to make its requests
+    conditional. limiter, if given, admits every request, retries included,
+    and is told how it went.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+                 retries: int = DEFAULT_RETRIES,
+                 backoff: float = DEFAULT_BACKOFF,
+                 backoff_max: float = DEFAULT_BACKOFF_MAX,
+                 cache: Optional[IndexCache] = None,
+                 limiter: Optional[AdaptiveLimiter] = None):
+        self.timeout = timeout
+        self.cache = cache
+        self.limiter = limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, resource: str, headers: Optional[dict] = None,
+            stream: bool = False) -> requests.Response:
+        """ GET resource, retrying 429/50* responses.
+
+        The last response is returned once it is not retryable or the
+        retries are exhausted; status handling is left to the caller. With
+        stream the body is left to be read from the response.
+        """
+        attempt = 0
+        while True:
+            r = self._send(resource, headers, stream)
+            if r.status_code not in RETRY_STATUSES or attempt >= self.retries:
+                return r
+            delay = self.backoff_delay(attempt, r)
+            r.close()
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self, resource: str, headers: Optional[dict],
+              stream: bool) -> requests.Response:
+        """ A single GET of resource, admitted by the limiter if any."""
+        if self.limiter is None:
+            return self.session.get(resource, headers=headers,
+                                    timeout=self.timeout, stream=stream)
+        permit = self.limiter.acquire(resource)
+        status = None
+        try:
+            r = self.session.get(resource, headers=headers,
+                                 timeout=self.timeout, stream=stream)
+            status = r.status_code
+            return r
+        finally:
+            self.limiter.release(permit, status)
+
+    def backoff_delay(self, attempt: int,
+                      response: Optional[requests.Response] = None) -> float:
+        """ Seconds to wait before retry number attempt + 1."""
+        delay = random.uniform(0, min(self.backoff_max,
+                                      self.backoff * 2 ** attempt))
+        retry_after = _retry_after(response)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max))
+        return delay
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _retry_after(response: Optional[requests.Response]) -> Optional[float]:
+    """ Retry-After header in seconds, if given as a number."""
+    if response is None:
+        return None
+    try:
+        return float(response.headers["Retry-After"])
+    except (KeyError, ValueError):
+        return None
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def default_client() -> Client:
+    """ Process-wide Client used when a caller does not supply one."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = Client()
+        return _default_client
+
+
+def client_options(jobs_help: Optional[str] = (
+                       "Number of index requests to run concurrently."),
+                   retries_help: str = (
+                       "Number of times to retry a request after a 429 or "
+                       "50* response.")) -> Callable:
+    """ Decorator adding the --jobs, --timeout and --retries CLI options of
+    a command talking to an EDS instance. --jobs is left out if jobs_help is
+    None."""
+    options = [
+        click.option('--timeout', type=click.FloatRange(min=0,
+                                                        min_open=True),
+                     default=DEFAULT_TIMEOUT,
+                     help=("Seconds to wait on the EDS instance per request."
+                           "\nDefault: {}".format(DEFAULT_TIMEOUT))),
+        click.option('--retries', type=click.IntRange(min=0),
+                     default=DEFAULT_RETRIES,
+                     help=(retries_help +
+                           "\nDefault: {}".format(DEFAULT_RETRIES))),
+    ]
+    if jobs_help is not None:
+        options.insert(0, click.option(
+            '--jobs', '-j', type=click.IntRange(min=1),
+            default=DEFAULT_JOBS,
+            help=(jobs_help + "\nDefault: {}".format(DEFAULT_JOBS))))
+
+    def decorator(f):
+        for option in reversed(options):
+            f = option(f)
+        return f
+    return decorator
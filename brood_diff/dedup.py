@@ -0,0 +1,192 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Content-addressed view of the eggs of a diff.
+
+The same egg binary, with the same sha256, is often listed at several
+locations of a diff: under each org/repo, platform and python tag of a
+qualified diff (see qualified.QualifiedIndex), or under different names.
+A transfer built from the diff as it is would carry it once per location.
+
+ContentIndex records every blob once, keyed by its sha256, along with all
+the (org_repo, platform, python_tag, egg_name) locations that reference it.
+The org/repo and platform of the eggs of a flat diff are unknown and None,
+and their python tag is that of their record. Eggs without a sha256 cannot
+be matched and are each counted as a blob of their own.
+
+The logical size of a diff counts an egg at each of its locations, the
+unique size once per blob. unique_diff is the diff with every blob at its
+first location only; it has the layout of the original diff, so it can be
+sized, sharded and fetched as any other, and the content index tells where
+each blob goes once it has arrived. dedup_diff, the driver of the dedup-diff
+command, writes both for a diff file.
+"""
+from collections.abc import Mapping
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from brood_diff import profiling
+from brood_diff.indices import from_json_file, to_json_file, write_diff
+from brood_diff.qualified import QualifiedIndex, as_qualified, is_qualified
+from brood_diff.shard import PACKED_SECTIONS, egg_size
+
+
+Location = Tuple[Optional[str], Optional[str], Optional[str], str]
+
+
+class ContentIndex(object):
+    """ Blobs of a diff keyed by sha256, with the locations referencing
+    them."""
+
+    def __init__(self):
+        # {sha256: metadata of the first location}
+        self.blobs = {}
+        # {sha256: [location, ...]}
+        self.locations = {}
+        # {location: metadata} of the eggs without a sha256
+        self.undigested = {}
+        self.logical_size = 0
+        self.unique_size = 0
+
+    @classmethod
+    def from_diff(cls, diff: Mapping,
+                  sections: Iterable[str] = PACKED_SECTIONS
+                  ) -> "ContentIndex":
+        """ Content index of the given sections of a flat or qualified
+        diff."""
+        content = cls()
+        for _, location, egg in iter_locations(diff, sections):
+            content.add(location, egg)
+        return content
+
+    def add(self, location: Location, egg: Mapping) -> bool:
+        """ Add an egg at location. Returns whether it is a new blob."""
+        size = egg_size(egg)
+        self.logical_size += size
+        sha256 = egg.get("sha256")
+        if not sha256:
+            self.undigested[location] = egg
+            self.unique_size += size
+            return True
+        locations = self.locations.get(sha256)
+        if locations is None:
+            self.blobs[sha256] = egg
+            self.locations[sha256] = [location]
+            self.unique_size += size
+            return True
+        locations.append(location)
+        return False
+
+    @property
+    def saved_size(self) -> int:
+        """ Bytes a transfer of the unique blobs saves."""
+        return self.logical_size - self.unique_size
+
+    def summary(self) -> dict:
+        """ Counts and byte totals of the logical and unique views."""
+        return {"locations": (sum(len(locations) for locations
+                                  in self.locations.values()) +
+                              len(self.undigested)),
+                "blobs": len(self.blobs) + len(self.undigested),
+                "undigested": len(self.undigested),
+                "logical_bytes": self.logical_size,
+                "unique_bytes": self.unique_size,
+                "saved_bytes": self.saved_size}
+
+    def duplicates(self) -> Iterator[Tuple[str, List[Location]]]:
+        """ Yield (sha256, locations) of the blobs found at several
+        locations."""
+        for sha256, locations in self.locations.items():
+            if len(locations) > 1:
+                yield sha256, locations
+
+    def to_json(self) -> dict:
+        """ json layout of the content index: its summary and, for each
+        blob, its metadata and locations."""
+        return {"summary": self.summary(),
+                "blobs": {sha256: {"egg": self.blobs[sha256],
+                                   "locations": [list(location)
+                                                 for location in locations]}
+                          for sha256, locations in self.locations.items()},
+                "undigested": [{"egg": egg, "location": list(location)}
+                               for location, egg in self.undigested.items()]}
+
+
+def iter_locations(diff: Mapping, sections: Iterable[str] = PACKED_SECTIONS
+                   ) -> Iterator[Tuple[str, Location, Mapping]]:
+    """ Yield (section, location, metadata) of every egg in the given
+    sections of a flat or qualified diff, sections in the given order."""
+    for section in sections:
+        eggs = diff.get(section)
+        if not isinstance(eggs, Mapping):
+            continue
+        if is_qualified(eggs):
+            for key, egg in as_qualified(eggs).items():
+                yield section, key, egg
+        else:
+            for egg_name, egg in eggs.items():
+                yield section, (None, None, egg.get("python_tag"),
+                                egg_name), egg
+
+
+def unique_diff(diff: Mapping, sections: Iterable[str] = PACKED_SECTIONS
+                ) -> dict:
+    """ The diff with every blob of the given sections kept at its first
+    location only. Sections of a qualified diff stay qualified; the other
+    sections are kept as they are."""
+    sections = tuple(section for section in sections if section in diff)
+    seen = set()
+    unique = {section: ({} if not is_qualified(diff[section])
+                        else QualifiedIndex())
+              for section in sections}
+    for section, location, egg in iter_locations(diff, sections):
+        if not is_new_blob(egg, seen):
+            continue
+        if isinstance(unique[section], QualifiedIndex):
+            unique[section].add(location[:3], {location[3]: egg})
+        else:
+            unique[section][location[3]] = egg
+    result = dict(diff)
+    result.update(unique)
+    return result
+
+
+def is_new_blob(egg: Mapping, seen: Set[str]) -> bool:
+    """ Whether the sha256 of egg is not in seen, adding it. Eggs without a
+    sha256 are always new."""
+    sha256 = egg.get("sha256")
+    if not sha256:
+        return True
+    if sha256 in seen:
+        return False
+    seen.add(sha256)
+    return True
+
+
+def unique_eggs(eggs: Iterable[Tuple[str, Mapping]], seen: Set[str]
+                ) -> Iterator[Tuple[str, Mapping]]:
+    """ Filter (egg_name, metadata) pairs down to the blobs not in seen,
+    see is_new_blob."""
+    for key, egg in eggs:
+        if is_new_blob(egg, seen):
+            yield key, egg
+
+
+def dedup_diff(diff_path: str, output: str,
+               unique_output: Optional[str] = None,
+               shard_size: Optional[int] = None) -> dict:
+    """ Write the content index of the missing and changed eggs of a diff
+    file to output (see ContentIndex) and, if unique_output is given,
+    the diff with every blob at its first location only, as shards if
+    shard_size is given. Returns the summary of the content index.
+    """
+    with profiling.phase("load"):
+        diff = from_json_file(diff_path)
+    with profiling.phase("dedup"):
+        content = ContentIndex.from_diff(diff)
+        unique = unique_diff(diff) if unique_output else None
+    profiling.count("unique blobs", len(content.blobs))
+    if unique is not None:
+        write_diff(unique, unique_output, sort=True, shard_size=shard_size)
+    to_json_file(content.to_json(), output, sort=True)
+    return content.summary()
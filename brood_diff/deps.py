@@ -0,0 +1,192 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Transitive dependency closure of the eggs in a diff.
+
+Each egg record lists its runtime requirements in "packages" as
+"<name> <version>" strings. DependencyIndex is built in one pass over the
+remote index and maps (name, version) to the egg providing it, so resolving a
+requirement is a dict lookup rather than a scan. dependency_closure then walks
+the requirement graph breadth first from a set of root eggs, visiting each egg
+and each edge once, which keeps the closure linear in the size of the graph.
+
+A requirement is satisfied locally when the local index has an egg of the
+same name and version, whatever its build.
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Mapping, Optional, Set, Tuple
+
+
+class DependencyIndex(object):
+    """ (name, version) lookup over an index.
+
+    Names are compared case-insensitively and a version matches either the
+    version or the full_version (version-build) of an egg. When several eggs
+    provide the same name and version, the one with the requiring egg's
+    python_tag is preferred, then the highest build.
+    """
+
+    def __init__(self, index: Mapping[str, dict]):
+        self._index = index
+        # (name, version) -> {python_tag: (build, egg_name)}
+        self._eggs = self._lookup("version")
+        # Built on first use: requirements pinning a full version, or none.
+        self._by_full_version = None
+        self._by_name = None
+        # (requirement, python_tag) -> egg_name, requirements repeat a lot.
+        self._resolved = {}
+
+    def _lookup(self, field: Optional[str]) -> dict:
+        """ (name, egg[field]) -> {python_tag: (build, egg_name)} over the
+        index, or name alone if field is None."""
+        lookup = {}
+        for key, egg in self._index.items():
+            name = egg.get("name")
+            if not isinstance(name, str):
+                continue
+            name = name.lower()
+            if field is not None:
+                value = egg.get(field)
+                if not isinstance(value, str):
+                    continue
+                name = (name, value)
+            build = egg.get("build")
+            entry = (build if isinstance(build, int) else -1, key)
+            tag = egg.get("python_tag")
+            by_tag = lookup.get(name)
+            if by_tag is None:
+                lookup[name] = {tag: entry}
+            elif tag not in by_tag or by_tag[tag] < entry:
+                by_tag[tag] = entry
+        return lookup
+
+    def resolve(self, requirement: str,
+                python_tag: Optional[str] = None) -> Optional[str]:
+        """ Name of the egg providing requirement, or None."""
+        try:
+            return self._resolved[requirement, python_tag]
+        except KeyError:
+            pass
+        name, version = parse_requirement(requirement)
+        if version is None:
+            if self._by_name is None:
+                self._by_name = self._lookup(None)
+            by_tag = self._by_name.get(name)
+        else:
+            by_tag = self._eggs.get((name, version))
+            if by_tag is None and "-" in version:
+                if self._by_full_version is None:
+                    self._by_full_version = self._lookup("full_version")
+                by_tag = self._by_full_version.get((name, version))
+        egg_name = None
+        if by_tag:
+            for tag in (python_tag, None):
+                if tag in by_tag:
+                    egg_name = by_tag[tag][1]
+                    break
+            else:
+                egg_name = max(by_tag.values())[1]
+        self._resolved[requirement, python_tag] = egg_name
+        return egg_name
+
+
+def parse_requirement(requirement: str) -> Tuple[str, Optional[str]]:
+    """ (lowercased name, version) of a "<name> <version>" requirement. The
+    version is None if the requirement does not pin one."""
+    parts = requirement.split()
+    if not parts:
+        return ("", None)
+    return (parts[0].lower(), parts[1] if len(parts) > 1 else None)
+
+
+def split_egg_name(egg_name: str) -> Optional[Tuple[str, str, str]]:
+    """ (name, version, build) of a "<name>-<version>-<build>.egg" file
+    name, or None if it does not have that form."""
+    if not egg_name.endswith(".egg"):
+        return None
+    parts = egg_name[:-len(".egg")].rsplit("-", 2)
+    if len(parts) != 3:
+        return None
+    return parts[0], parts[1], parts[2]
+
+
+def local_provides(egg_names: Iterable[str]) -> Set[Tuple[str, str]]:
+    """ The (name, version) pairs satisfied by a local index, read from its
+    egg names. Each egg provides its bare version, its full version and any
+    version at all."""
+    provides = set()
+    for egg_name in egg_names:
+        parts = split_egg_name(egg_name)
+        if parts is None:
+            continue
+        name, version, build = parts
+        name = name.lower()
+        provides.update(((name, version), (name, None),
+                         (name, "{}-{}".format(version, build))))
+    return provides
+
+
+def dependency_closure(roots: Iterable[str],
+                       remote_index: Mapping[str, dict],
+                       dep_index: DependencyIndex,
+                       provides: Set[Tuple[str, str]]) -> dict:
+    """ Transitive closure of the requirements of roots not satisfied by
+    provides (see local_provides).
+
+    Returns {"eggs": [...], "dependencies": {...}, "unresolved": {...}}:
+    the remote eggs reached from roots that are not roots themselves, the
+    remote dependencies of every visited egg that has any, and the
+    requirements of every visited egg that neither the local nor the remote
+    index satisfies.
+    """
+    seen = set()
+    queue = deque()
+    for root in roots:
+        if root not in seen:
+            seen.add(root)
+            queue.append(root)
+
+    eggs: List[str] = []
+    dependencies: Dict[str, List[str]] = {}
+    unresolved: Dict[str, List[str]] = {}
+    while queue:
+        key = queue.popleft()
+        egg = remote_index[key]
+        tag = egg.get("python_tag")
+        for requirement in egg.get("packages") or ():
+            if parse_requirement(requirement) in provides:
+                continue
+            dep = dep_index.resolve(requirement, tag)
+            if dep is None:
+                unresolved.setdefault(key, []).append(requirement)
+                continue
+            dependencies.setdefault(key, []).append(dep)
+            if dep not in seen:
+                seen.add(dep)
+                queue.append(dep)
+                eggs.append(dep)
+    return {"eggs": eggs, "dependencies": dependencies,
+            "unresolved": unresolved}
+
+
+def add_dependencies(diff: dict, remote_index: Mapping[str, dict],
+                     local_egg_names: Iterable[str]) -> dict:
+    """ Extend an index_diff result with the dependency closure of its
+    missing (and changed) eggs.
+
+    Eggs reached only through requirements are added to "missing", and the
+    "dependencies" and "unresolved" sections of dependency_closure are added
+    to the diff, which is returned.
+    """
+    roots = list(diff["missing"])
+    roots.extend(diff.get("changed", ()))
+    closure = dependency_closure(roots, remote_index,
+                                 DependencyIndex(remote_index),
+                                 local_provides(local_egg_names))
+    missing = diff["missing"]
+    for key in closure["eggs"]:
+        missing.setdefault(key, remote_index[key])
+    diff["dependencies"] = closure["dependencies"]
+    diff["unresolved"] = closure["unresolved"]
+    return diff
@@ -25,26 +25,65 @@ Usage:
                             -o <path-to-output-file>
 
 """
-import json
-import sys
-from typing import Iterable, NoReturn, Tuple, Union
+import os
+from contextlib import ExitStack
+from typing import Optional
 
 import click
-import requests
 
-from brood_diff import valid
-
-
-INDEX_ROUTE = "api/v1/json/indices"
-LEGACY_INDEX_ROUTE = "api/v0/json/indices"
+from brood_diff import profiling, valid
+from brood_diff.batch import COMMON_MISSING, batch_diff, local_index_files
+from brood_diff.cache import (
+    DEFAULT_CACHE_DIR, DEFAULT_MAX_CACHE_SIZE, cache_from_options,
+    cache_options
+)
+from brood_diff.client import (
+    Client, DEFAULT_JOBS, DEFAULT_RETRIES, DEFAULT_TIMEOUT, client_options
+)
+from brood_diff.dedup import dedup_diff
+from brood_diff.deps import add_dependencies
+from brood_diff.download import (
+    DEFAULT_SECTIONS, DEFAULT_URL_TEMPLATE, UnknownLocation, fetch_missing
+)
+from brood_diff.indices import (  # noqa: F401
+    DIGEST_FIELDS, FetchError, INDEX_ROUTE, LEGACY_INDEX_ROUTE, egg_changed,
+    egg_digests, fetch_indices, from_json_file, full_diff, gen_full_index,
+    get_index, index_diff, index_resource, is_qualified_file, iter_index,
+    load_compact_index, load_index, merge_indices, merge_json, open_index,
+    open_qualified_index, to_json_file, write_diff
+)
+from brood_diff.jsonio import iter_json_index
+from brood_diff.limiter import (
+    AdaptiveLimiter, format_trajectory, limiter_from_options, limiter_options
+)
+from brood_diff.merge import CONFLICT_POLICIES
+from brood_diff.merkle import DEFAULT_BUCKETS, build_digest, digest_diff
+from brood_diff.records import compact_index
+from brood_diff.scan import (
+    DuplicateEgg, default_scan_cache, scan_directory
+)
+from brood_diff.sizes import GB
+from brood_diff.snapshot import Snapshot, is_snapshot, write_snapshot
+from brood_diff.syncstate import sync_index
+from brood_diff.watch import DEFAULT_WATCH_INTERVAL, watch_diff
 
 
 @click.group()
-def cli():
+@click.option('--profile', 'profile_path', type=str, default=None,
+              help=("<path> Write a json report of the time spent per phase "
+                    "and per fetched index, bytes downloaded, entries "
+                    "processed and peak memory to this file at exit."))
+@click.option('--cprofile', 'cprofile_path', type=str, default=None,
+              help=("<path> Also run the command under cProfile and dump "
+                    "its stats to this file."))
+@click.pass_context
+def cli(ctx, profile_path, cprofile_path):
     """ Brood diff is a CLI tool for calculating the difference between
     two different EDS indices.
     """
-    pass
+    if profile_path or cprofile_path:
+        profiling.start(profile_path, cprofile_path)
+        ctx.call_on_close(profiling.finish)
 
 
 # CLI wrappers #
@@ -70,19 +109,26 @@ def cli():
               help=("Use --legacy for the legacy v0 api version. Note, this "
                     "should be used only in special circumstances."
                     "\nDefault: --no-legacy"))
-def cli_get_index(url, repository, platform, version, output, sort, legacy):
+@client_options(jobs_help=None)
+@cache_options
+def cli_get_index(url, repository, platform, version, output, sort, legacy,
+                  timeout, retries, cache_dir, no_cache, max_cache_size):
     """ Get index for a given repo/platform/python-tag from EDS instance
     located at url specified by -u/--url and write output to file
     specified by -o/--output."""
 
     org, repo = repository.split("/")
 
-    idx = get_index(url,
-                    org,
-                    repo,
-                    platform,
-                    version,
-                    legacy)
+    cache = cache_from_options(cache_dir, no_cache, max_cache_size)
+    with Client(pool_size=1, timeout=timeout, retries=retries,
+                cache=cache) as client:
+        idx = get_index(url,
+                        org,
+                        repo,
+                        platform,
+                        version,
+                        legacy,
+                        client=client)
     click.echo("Writing output to json sort={} ...".format(sort))
     to_json_file(idx, output, sort=sort)
 
@@ -110,20 +156,43 @@ def cli_get_index(url, repository, platform, version, output, sort, legacy):
               help=("Use --legacy for the legacy v0 api version. Note, this "
                     "should be used only in special circumstances."
                     "\nDefault: --no-legacy"))
+@client_options()
+@cache_options
+@click.option('--qualified/--no-qualified', default=False,
+              help=("Keep the eggs of every org/repo, platform and python "
+                    "version apart, nested in that order, instead of "
+                    "merging them into one index where eggs of the same "
+                    "name overwrite each other.\nDefault: --no-qualified"))
+@limiter_options
 def cli_get_full_index(url, repository, platform, version, output, sort,
-                       legacy):
+                       legacy, jobs, timeout, retries, cache_dir, no_cache,
+                       max_cache_size, qualified, adaptive, rate,
+                       latency_target, verbose):
     """ Get full json representation of multiple EDS indices from an EDS
     instance specified by -u/--url for potentially multiple platforms,
     repositories, and python versions, and output the full index as a single
     json file specified by -o/--output."""
 
-    gen_full_index(url,
-                   repository,
-                   platform,
-                   version,
-                   output,
-                   sort,
-                   legacy)
+    cache = cache_from_options(cache_dir, no_cache, max_cache_size)
+    limiter = limiter_from_options(adaptive, jobs, rate, latency_target)
+    client = Client(pool_size=jobs, timeout=timeout, retries=retries,
+                    cache=cache, limiter=limiter)
+    try:
+        gen_full_index(url,
+                       repository,
+                       platform,
+                       version,
+                       output,
+                       sort,
+                       legacy,
+                       jobs,
+                       client,
+                       qualified=qualified)
+    except FetchError as e:
+        raise click.ClickException(str(e))
+    finally:
+        client.close()
+        report_limiter(limiter, verbose)
 
 
 @cli.command(name="gen-diff")
@@ -133,7 +202,23 @@ def cli_get_full_index(url, repository, platform, version, output, sort,
               help="<path> Full path to json file for remote index")
 @click.option('--output', '-o', type=str,
               help="<path> Full path to output json file")
-def cli_gen_diff(local, remote, output):
+@click.option('--detect-changed/--no-detect-changed', default=False,
+              help=("Also report eggs present on both sides whose sha256 "
+                    "(or md5/size) differs, in a \"changed\" section."
+                    "\nDefault: --no-detect-changed"))
+@click.option('--with-deps/--no-with-deps', default=False,
+              help=("Add the remote eggs required, directly or transitively, "
+                    "by the missing eggs and not present locally, with "
+                    "\"dependencies\" and \"unresolved\" sections."
+                    "\nDefault: --no-with-deps"))
+@click.option('--shard-size', type=str, callback=valid.validate_size,
+              default=None,
+              help=("<size> Split the diff into numbered shards of at most "
+                    "this many bytes, e.g. 4GB, written next to the output, "
+                    "which becomes a manifest of the shards."
+                    "\nDefault: a single output file"))
+def cli_gen_diff(local, remote, output, detect_changed, with_deps,
+                 shard_size):
     """ Calculate the difference between two EDS indices and output the
     result as a json file.
 
@@ -152,11 +237,51 @@ def cli_gen_diff(local, remote, output):
 
     Finally run python diff.py gen-diff -l local.json -r remote.json -o
     output_file.json
+
+    Both indices are opened lazily: a json index is scanned once for the
+    offsets of its records, and only the records of the eggs in the diff
+    (and, with --detect-changed, of the eggs on both sides) are decoded.
+    Either index may be a json file or a snapshot written by convert. With
+    --with-deps the remote index is held in memory as compact records to
+    resolve requirements against.
+
+    With --shard-size the missing (and changed) eggs are packed into shards
+    of at most that size, dependencies in the same or an earlier shard.
+
+    Indices written by full-index --qualified are diffed on their
+    org/repo, platform and python version as well as the egg name, see
+    full-diff. They are read whole. --with-deps resolves requirements
+    against a single flat remote index and cannot be used with them;
+    --shard-size packs their eggs by qualified key.
     """
-    local_index = from_json_file(local)
-    remote_index = from_json_file(remote)
-    diff = index_diff(local_index, remote_index)
-    to_json_file(diff, output)
+    if shard_size is not None and shard_size <= 0:
+        raise click.BadParameter("Shard size must be positive",
+                                 param_hint="--shard-size")
+    qualified = [path for path in (local, remote) if is_qualified_file(path)]
+    if qualified and with_deps:
+        raise click.BadParameter(
+            "{} is a qualified index, which is not supported with "
+            "--with-deps".format(qualified[0]))
+    with ExitStack() as stack:
+        with profiling.phase("load"):
+            if local in qualified:
+                local_index = open_qualified_index(local)
+            else:
+                local_index = stack.enter_context(open_index(local))
+            if remote in qualified:
+                remote_index = open_qualified_index(remote)
+            elif with_deps:
+                remote_index = compact_index(iter_index(remote))
+            else:
+                remote_index = stack.enter_context(open_index(remote))
+        with profiling.phase("diff"):
+            diff = index_diff(local_index, remote_index,
+                              detect_changed=detect_changed)
+        if with_deps:
+            with profiling.phase("dependencies"):
+                add_dependencies(diff, remote_index, local_index)
+    profiling.count("missing eggs", len(diff["missing"]))
+    write_diff(diff, output, sort=False, shard_size=shard_size)
 
 
 @cli.command(name="full-diff")
@@ -182,21 +307,555 @@ def cli_gen_diff(local, remote, output):
               help=("Use --legacy for the legacy v0 api version. Note, this "
                     "should be used only in special circumstances."
                     "\nDefault: --no-legacy"))
+@client_options()
+@cache_options
+@click.option('--detect-changed/--no-detect-changed', default=False,
+              help=("Also report eggs present on both sides whose sha256 "
+                    "(or md5/size) differs, in a \"changed\" section."
+                    "\nDefault: --no-detect-changed"))
+@click.option('--with-deps/--no-with-deps', default=False,
+              help=("Add the remote eggs required, directly or transitively, "
+                    "by the missing eggs and not present locally, with "
+                    "\"dependencies\" and \"unresolved\" sections."
+                    "\nDefault: --no-with-deps"))
+@click.option('--shard-size', type=str, callback=valid.validate_size,
+              default=None,
+              help=("<size> Split the diff into numbered shards of at most "
+                    "this many bytes, e.g. 4GB, written next to the output, "
+                    "which becomes a manifest of the shards."
+                    "\nDefault: a single output file"))
+@click.option('--qualified/--no-qualified', default=False,
+              help=("Keep the eggs of every org/repo, platform and python "
+                    "version apart in the diff, nested in that order, "
+                    "instead of merging them into one index where eggs of "
+                    "the same name overwrite each other. Not supported "
+                    "with --with-deps, which resolves requirements against "
+                    "one merged remote index."
+                    "\nDefault: --no-qualified"))
+@limiter_options
 def cli_full_diff(local, repository, platform,
-                  version, output, sort, legacy=False):
+                  version, output, sort, legacy=False, jobs=DEFAULT_JOBS,
+                  timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES,
+                  cache_dir=DEFAULT_CACHE_DIR, no_cache=False,
+                  max_cache_size=DEFAULT_MAX_CACHE_SIZE,
+                  detect_changed=False, with_deps=False, shard_size=None,
+                  qualified=False, adaptive=False, rate=None,
+                  latency_target=None, verbose=False):
     """ Given a local index son file, calculate the difference between that
     index and the Enthought production EDS repos specified by the repo,
     platform, and version options.
 
-    The output is a single json file containing the missing packages.
+    The output is a single json file containing the missing packages, or
+    with --shard-size a manifest of numbered shards (see gen-diff). With
+    --qualified the missing packages are nested by org/repo, platform and
+    python version, as written by full-index --qualified.
+    """
+    if shard_size is not None and shard_size <= 0:
+        raise click.BadParameter("Shard size must be positive",
+                                 param_hint="--shard-size")
+    if qualified and with_deps:
+        raise click.BadParameter("Not supported with --with-deps",
+                                 param_hint="--qualified")
+    cache = cache_from_options(cache_dir, no_cache, max_cache_size)
+    limiter = limiter_from_options(adaptive, jobs, rate, latency_target)
+    client = Client(pool_size=jobs, timeout=timeout, retries=retries,
+                    cache=cache, limiter=limiter)
+    try:
+        full_diff(local,
+                  repository,
+                  platform,
+                  version,
+                  output,
+                  sort,
+                  legacy,
+                  jobs=jobs,
+                  client=client,
+                  detect_changed=detect_changed,
+                  with_deps=with_deps,
+                  shard_size=shard_size,
+                  qualified=qualified)
+    except FetchError as e:
+        raise click.ClickException(str(e))
+    finally:
+        client.close()
+        report_limiter(limiter, verbose)
+
+
+@cli.command(name="batch-diff")
+@click.option('--local-dir', '-d', type=click.Path(exists=True,
+                                                   file_okay=False),
+              required=True,
+              help=("<path> Directory of customer local indices, one json "
+                    "or snapshot file per customer"))
+@click.option('--output-dir', '-o', type=str, required=True,
+              help=("<path> Directory to write <customer>.json diffs and "
+                    "{} into".format(COMMON_MISSING)))
+@click.option('--remote', '-R', 'remote_path', type=str, default=None,
+              help=("<path> Remote index json or snapshot file, instead of "
+                    "fetching the -r/-p/-v indices"))
+@click.option('--url', '-u', type=str,
+              default="https://packages.enthought.com",
+              help=("<EDS URL> Must include http or https as needed"
+                    "\nDefault: https://packages.enthought.com"))
+@click.option('--repository', '-r', multiple=True, type=str,
+              callback=valid.validate_org_repos,
+              help=("<org/repo> Must be in EDS/Hatcher format: `org/repo`"
+                    "\ne.g. enthought/free"))
+@click.option('--platform', '-p', multiple=True, type=str,
+              callback=valid.validate_platforms,
+              help="<platform> See list-platforms for supported platforms")
+@click.option('--version', '-v', multiple=True, type=str,
+              callback=valid.validate_versions,
+              help=("<python-version> See list-versions for "
+                    "supported python version tags"))
+@click.option('--processes', '-P', type=click.IntRange(min=1),
+              default=os.cpu_count() or 1,
+              help=("Number of worker processes computing customer diffs."
+                    "\nDefault: the number of CPUs"))
+@click.option('--sort/--no-sort', default=True,
+              help=("Set whether the output should be sorted."
+                    "\nDefault: --sort"))
+@click.option('--legacy/--no-legacy', default=False,
+              help=("Use --legacy for the legacy v0 api version. Note, this "
+                    "should be used only in special circumstances."
+                    "\nDefault: --no-legacy"))
+@client_options()
+@cache_options
+@click.option('--detect-changed/--no-detect-changed', default=False,
+              help=("Also report eggs present on both sides whose sha256 "
+                    "(or md5/size) differs, in a \"changed\" section."
+                    "\nDefault: --no-detect-changed"))
+def cli_batch_diff(local_dir, output_dir, remote_path, url, repository,
+                   platform, version, processes, sort, legacy, jobs, timeout,
+                   retries, cache_dir, no_cache, max_cache_size,
+                   detect_changed):
+    """ Diff every customer local index in -d/--local-dir against the same
+    remote index, fetched and parsed once.
+
+    The remote index is either the Enthought production EDS repos given by
+    the repo, platform, and version options or a file given with -R. One
+    diff per customer, named after its local index file, is written to
+    -o/--output-dir along with common-missing.json, the eggs missing for
+    every customer.
+    """
+    if remote_path is None and not (repository and platform and version):
+        raise click.UsageError(
+            "Give the remote index as -R <path> or as -r/-p/-v options")
+    if remote_path is not None and (repository or platform or version):
+        raise click.UsageError("-R cannot be combined with -r/-p/-v")
+    if os.path.realpath(output_dir) == os.path.realpath(local_dir):
+        raise click.BadParameter(
+            "The output directory must differ from the local directory",
+            param_hint="--output-dir")
+    try:
+        local_paths = local_index_files(local_dir)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--local-dir")
+
+    failures = {}
+    if remote_path is None:
+        cache = cache_from_options(cache_dir, no_cache, max_cache_size)
+        with Client(pool_size=jobs, timeout=timeout, retries=retries,
+                    cache=cache) as client:
+            indices, failures = fetch_indices(url, repository, platform,
+                                              version, legacy, jobs, client,
+                                              compact=True)
+        remote = merge_indices(indices)
+        del indices
+    else:
+        remote = remote_path
+    report = batch_diff(local_paths, remote, output_dir,
+                        processes=processes, detect_changed=detect_changed,
+                        sort=sort)
+
+    for name, counts in report["customers"].items():
+        click.echo("{}: {} missing{}".format(
+            name, counts["missing"],
+            ", {} changed".format(counts["changed"])
+            if detect_changed else ""))
+    click.echo("{} eggs missing for every customer".format(
+        report["common_missing"]))
+    errors = ["{}: {}".format(name, exc)
+              for name, exc in report["failures"].items()]
+    if failures:
+        errors.insert(0, str(FetchError(failures)))
+    if errors:
+        raise click.ClickException("\n".join(errors))
+
+
+@cli.command(name="sync")
+@click.option('--state-dir', '-s', type=click.Path(file_okay=False),
+              help="<path> Directory holding the sync state")
+@click.option('--repository', '-r', multiple=True, type=str,
+              callback=valid.validate_org_repos,
+              help=("<org/repo> Must be in EDS/Hatcher format: `org/repo`"
+                    "\ne.g. enthought/free"))
+@click.option('--platform', '-p', multiple=True, type=str,
+              callback=valid.validate_platforms,
+              help="<platform> See list-platforms for supported platforms")
+@click.option('--version', '-v', multiple=True, type=str,
+              callback=valid.validate_versions,
+              help=("<python-version> See list-versions for "
+                    "supported python version tags"))
+@click.option('--output', '-o', type=str,
+              help="<path> Full path to output json file")
+@click.option('--local', '-l', type=str, default=None,
+              help=("<path> Local index used to seed repos that have no sync "
+                    "state yet. Without it their full index is emitted."))
+@click.option('--commit/--no-commit', default=True,
+              help=("Roll the sync state forward after writing the output."
+                    "\nDefault: --commit"))
+@click.option('--legacy/--no-legacy', default=False,
+              help=("Use --legacy for the legacy v0 api version. Note, this "
+                    "should be used only in special circumstances."
+                    "\nDefault: --no-legacy"))
+@client_options()
+def cli_sync(state_dir, repository, platform, version, output, local, commit,
+             legacy, jobs, timeout, retries):
+    """ Incrementally diff the Enthought production EDS repos against the
+    sync state stored in -s/--state-dir by the previous sync.
+
+    Only the eggs that are new or changed since the previous sync are
+    written to -o/--output, in the same layout as full-diff. Indices that
+    have not changed since then cost a single conditional request. The sync
+    state is then rolled forward unless --no-commit is given.
+    """
+    client = Client(pool_size=jobs, timeout=timeout, retries=retries)
+    try:
+        status = sync_index(state_dir,
+                            repository,
+                            platform,
+                            version,
+                            output,
+                            local_idx_json=local,
+                            commit=commit,
+                            legacy=legacy,
+                            jobs=jobs,
+                            client=client)
+    except FetchError as e:
+        raise click.ClickException(str(e))
+    finally:
+        client.close()
+    for (org_repo, plat, ver), state in status.items():
+        click.echo("{} {} {}: {}".format(org_repo, plat, ver, state))
+
+
+@cli.command(name="watch")
+@click.option('--local', '-l', type=str, required=True,
+              help="<path> Full path to json file for local index")
+@click.option('--repository', '-r', multiple=True, type=str,
+              callback=valid.validate_org_repos,
+              help=("<org/repo> Must be in EDS/Hatcher format: `org/repo`"
+                    "\ne.g. enthought/free"))
+@click.option('--platform', '-p', multiple=True, type=str,
+              callback=valid.validate_platforms,
+              help="<platform> See list-platforms for supported platforms")
+@click.option('--version', '-v', multiple=True, type=str,
+              callback=valid.validate_versions,
+              help=("<python-version> See list-versions for "
+                    "supported python version tags"))
+@click.option('--output', '-o', type=str, required=True,
+              help="<path> Full path to output json file")
+@click.option('--url', '-u', type=str,
+              default="https://packages.enthought.com",
+              help=("<EDS URL> Must include http or https as needed"
+                    "\nDefault: https://packages.enthought.com"))
+@click.option('--interval', type=click.FloatRange(min=0),
+              default=DEFAULT_WATCH_INTERVAL,
+              help=("Seconds between polls of the indices."
+                    "\nDefault: {}".format(DEFAULT_WATCH_INTERVAL)))
+@click.option('--polls', type=click.IntRange(min=1), default=None,
+              help="Stop after this many polls.\nDefault: run until stopped")
+@click.option('--sort/--no-sort', default=True,
+              help=("Set whether the output should be sorted."
+                    "\nDefault: --sort"))
+@click.option('--legacy/--no-legacy', default=False,
+              help=("Use --legacy for the legacy v0 api version. Note, this "
+                    "should be used only in special circumstances."
+                    "\nDefault: --no-legacy"))
+@client_options()
+@click.option('--detect-changed/--no-detect-changed', default=False,
+              help=("Also report eggs present on both sides whose sha256 "
+                    "(or md5/size) differs, in a \"changed\" section."
+                    "\nDefault: --no-detect-changed"))
+def cli_watch(local, repository, platform, version, output, url, interval,
+              polls, sort, legacy, jobs, timeout, retries, detect_changed):
+    """ Keep a full-diff output up to date in a long-running process.
+
+    The indices are polled every --interval seconds with conditional
+    requests and only the eggs that changed in an updated index are diffed
+    again, as are all eggs when the local index file changes. The output is
+    rewritten atomically, and only when the diff changes, once every index
+    has been fetched. A failed fetch keeps the previous version of that
+    index until the next poll.
+    """
+    def report(poll):
+        line = "poll {}: {} updated, {} diff entries modified".format(
+            poll["poll"], len(poll["updated"]), poll["modified"])
+        if poll["written"]:
+            line += ", diff written"
+        for (org_repo, plat, ver), exc in poll["failures"].items():
+            line += "\n  failed {} {} {}: {}".format(org_repo, plat, ver, exc)
+        click.echo(line)
+
+    if not (repository and platform and version):
+        raise click.UsageError("Give at least one each of -r, -p and -v")
+    client = Client(pool_size=jobs, timeout=timeout, retries=retries)
+    try:
+        watch_diff(local, repository, platform, version, output,
+                   interval=interval, polls=polls, sort=sort, legacy=legacy,
+                   remote_url=url, jobs=jobs, client=client,
+                   detect_changed=detect_changed, report=report)
+    except KeyboardInterrupt:
+        click.echo("Stopped")
+    finally:
+        client.close()
+
+
+@cli.command(name="digest")
+@click.option('--input', '-i', 'input_path', type=str,
+              help="<path> Full path to json index or snapshot file")
+@click.option('--output', '-o', type=str,
+              help="<path> Full path to output digest json file")
+@click.option('--buckets', '-b', type=click.IntRange(min=1),
+              default=DEFAULT_BUCKETS,
+              help=("Number of buckets to hash eggs into. More buckets give "
+                    "a larger digest file and a tighter digest-diff."
+                    "\nDefault: {}".format(DEFAULT_BUCKETS)))
+def cli_digest(input_path, output, buckets):
+    """ Summarize an index as a small bucketed digest file.
+
+    Run this on the air-gapped side and carry the digest file out instead of
+    the full local index, then run digest-diff against the remote index.
+    """
+    to_json_file(build_digest(iter_index(input_path), buckets), output)
+
+
+@cli.command(name="digest-diff")
+@click.option('--digest', '-d', 'digest_path', type=str,
+              help="<path> Full path to digest json file of the local index")
+@click.option('--remote', '-r', type=str,
+              help="<path> Full path to json file for remote index")
+@click.option('--output', '-o', type=str,
+              help="<path> Full path to output json file")
+def cli_digest_diff(digest_path, remote, output):
+    """ Calculate the eggs of the remote index in buckets whose digest
+    differs from the local digest file made by digest.
+
+    The output lists the differing buckets and, under "missing", the remote
+    eggs in them. That is a superset of the eggs missing or changed locally;
+    gen-diff against the local index narrows it down exactly.
+    """
+    try:
+        diff = digest_diff(from_json_file(digest_path),
+                           load_index(remote))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    to_json_file(diff, output, sort=True)
+
+
+@cli.command(name="convert")
+@click.option('--input', '-i', 'input_path', type=str,
+              help="<path> Full path to json index or snapshot file")
+@click.option('--output', '-o', type=str,
+              help="<path> Full path to output file")
+def cli_convert(input_path, output):
+    """ Convert a json index, as written by get-index or full-index, to a
+    binary snapshot that gen-diff, merge_json and get-size open near
+    instantly. Converting a snapshot writes it back out as sorted json,
+    streamed from the snapshot without loading it.
+    """
+    if is_snapshot(input_path):
+        with Snapshot(input_path) as snapshot:
+            to_json_file(snapshot, output, sort=True)
+    else:
+        write_snapshot(iter_json_index(input_path), output)
+
+
+@cli.command(name="merge-json")
+@click.option('--input', '-i', 'input_paths', multiple=True, type=str,
+              required=True,
+              help=("<path> json index or snapshot to merge. May be given "
+                    "multiple times."))
+@click.option('--output', '-o', type=str,
+              help="<path> Full path to output json file")
+@click.option('--on-conflict', type=click.Choice(CONFLICT_POLICIES),
+              default="last",
+              help=("Entry kept when several inputs hold the same egg: the "
+                    "last input's, an error, or the one with the newest "
+                    "mtime.\nDefault: last"))
+@click.option('--assume-sorted/--no-assume-sorted', default=False,
+              help=("Fail the merge on a json input not sorted by egg name "
+                    "instead of sorting it and merging again."
+                    "\nDefault: --no-assume-sorted"))
+def cli_merge_json(input_paths, output, on_conflict, assume_sorted):
+    """ Merge json indices and snapshots into one sorted json index.
+
+    Inputs sorted by egg name, such as snapshots and the output of
+    get-index and full-index, are merged as streams; other json inputs are
+    sorted through a temporary snapshot first.
     """
-    full_diff(local,
-              repository,
-              platform,
-              version,
-              output,
-              sort,
-              legacy)
+    try:
+        merge_json(input_paths, output, on_conflict, assume_sorted)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+
+
+@cli.command(name="fetch-missing")
+@click.option('--diff', '-d', 'diff_path', type=str, required=True,
+              help="<path> Full path to a diff json file")
+@click.option('--output-dir', '-o', type=str, required=True,
+              help="<path> Directory to download the eggs into")
+@click.option('--url', '-u', type=str,
+              default="https://packages.enthought.com",
+              help=("<EDS URL> Must include http or https as needed"
+                    "\nDefault: https://packages.enthought.com"))
+@click.option('--repository', '-r', type=str, default=None,
+              callback=valid.validate_org_repo,
+              help=("<org/repo> Must be in EDS/Hatcher format: `org/repo`"
+                    "\ne.g. enthought/free. Not needed for a qualified "
+                    "diff, whose eggs are fetched from their own org/repo, "
+                    "platform and python version."))
+@click.option('--platform', '-p', type=str, default=None,
+              callback=valid.validate_platform,
+              help=("<platform> See list-platforms for supported platforms."
+                    " Not needed for a qualified diff."))
+@click.option('--version', '-v', type=str, default=None,
+              callback=valid.validate_version,
+              help=("<python-version> See list-versions for "
+                    "supported python version tags. Not needed for a "
+                    "qualified diff."))
+@client_options(
+    jobs_help="Number of eggs to download concurrently.",
+    retries_help=("Number of times to retry a request after a 429 or 50* "
+                  "response or a dropped connection."))
+@click.option('--include-changed/--no-include-changed', default=False,
+              help=("Also download the eggs of the \"changed\" section."
+                    "\nDefault: --no-include-changed"))
+@click.option('--url-template', type=str, default=DEFAULT_URL_TEMPLATE,
+              help=("Download URL of an egg, with the fields {url}, "
+                    "{org_repo}, {platform}, {python_tag} and {egg}."
+                    "\nDefault: " + DEFAULT_URL_TEMPLATE))
+def cli_fetch_missing(diff_path, output_dir, url, repository, platform,
+                      version, jobs, timeout, retries, include_changed,
+                      url_template):
+    """ Download the missing eggs of a diff from the repo/platform/
+    python-tag given by the -r, -p and -v options into a directory.
+
+    The eggs of a qualified diff, e.g. written by full-diff --qualified or
+    dedup-diff --unique, are fetched from the org/repo, platform and python
+    version they are listed under, into <org>/<repo>/<platform>/<version>
+    subdirectories.
+
+    Partial downloads are resumed, every egg is checked against the size
+    and sha256 of its record and eggs already in the directory are skipped.
+    """
+    sections = DEFAULT_SECTIONS + (("changed",) if include_changed else ())
+    with Client(pool_size=jobs, timeout=timeout,
+                retries=retries) as client:
+        try:
+            summary = fetch_missing(diff_path, output_dir, url, repository,
+                                    platform, version, jobs=jobs,
+                                    client=client, sections=sections,
+                                    url_template=url_template)
+        except UnknownLocation as e:
+            raise click.UsageError("{}: pass -r, -p and -v".format(e))
+    click.echo("Downloaded {} eggs ({} resumed), {} already present, {} "
+               "failed".format(
+                   len(summary["downloaded"]) + len(summary["resumed"]),
+                   len(summary["resumed"]), len(summary["present"]),
+                   len(summary["failures"])))
+    click.echo("{:.1f} MB in {:.1f} s ({:.2f} MB/s)".format(
+        summary["bytes"] / 1e6, summary["seconds"],
+        summary["throughput"] / 1e6))
+    if summary["failures"]:
+        raise click.ClickException("\n".join(
+            "{}: {}".format(egg_name, error)
+            for egg_name, error in sorted(summary["failures"].items())))
+
+
+@cli.command(name="dedup-diff")
+@click.option('--diff', '-d', 'diff_path', type=str, required=True,
+              help="<path> Full path to a diff json file")
+@click.option('--output', '-o', type=str, required=True,
+              help=("<path> Full path to the output json content index, "
+                    "listing every blob once with its locations"))
+@click.option('--unique', 'unique_output', type=str, default=None,
+              help=("<path> Also write the diff with every blob at its "
+                    "first location only, to size, shard or fetch."))
+@click.option('--shard-size', type=str, callback=valid.validate_size,
+              default=None,
+              help=("<size> Split the --unique diff into numbered shards "
+                    "of at most this many bytes (see gen-diff)."
+                    "\nDefault: a single output file"))
+def cli_dedup_diff(diff_path, output, unique_output, shard_size):
+    """ Index the missing and changed eggs of a diff by sha256 and report
+    the bytes a transfer of the unique blobs saves over one of every egg.
+
+    The same egg binary is often listed at several locations, e.g. under
+    several platforms or python versions of a diff written by full-diff
+    --qualified. The content index records each blob once with all the
+    org/repo, platform, python version and egg name locations referencing
+    it, so a transfer of the --unique diff can be fanned out to every
+    location once it has arrived.
+    """
+    if shard_size is not None and shard_size <= 0:
+        raise click.BadParameter("Shard size must be positive",
+                                 param_hint="--shard-size")
+    if shard_size is not None and unique_output is None:
+        raise click.BadParameter("Shards are only written with --unique",
+                                 param_hint="--shard-size")
+    try:
+        summary = dedup_diff(diff_path, output, unique_output, shard_size)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo("{} eggs in {} unique blobs: {:.3f} Gb logical, {:.3f} Gb "
+               "deduplicated, {:.3f} Gb saved".format(
+                   summary["locations"], summary["blobs"],
+                   summary["logical_bytes"] / GB,
+                   summary["unique_bytes"] / GB,
+                   summary["saved_bytes"] / GB))
+
+
+@cli.command(name="scan-index")
+@click.option('--directory', '-d', type=click.Path(exists=True,
+                                                   file_okay=False),
+              required=True,
+              help="<path> Directory of egg files, searched recursively")
+@click.option('--output', '-o', type=str, required=True,
+              help="<path> Full path to output json file")
+@click.option('--jobs', '-j', type=click.IntRange(min=1),
+              default=os.cpu_count() or 1,
+              help=("Number of processes hashing eggs."
+                    "\nDefault: the number of CPUs"))
+@click.option('--scan-cache', type=str, default=None,
+              help=("<path> Sidecar cache of the records of earlier scans, "
+                    "keyed on each file's path, size and mtime."
+                    "\nDefault: a file under the index cache directory"))
+@click.option('--no-scan-cache', is_flag=True, default=False,
+              help="Hash every egg without reading or writing the cache.")
+@click.option('--sort/--no-sort', default=True,
+              help=("Set whether the output should be sorted."
+                    "\nDefault: --sort"))
+def cli_scan_index(directory, output, jobs, scan_cache, no_scan_cache, sort):
+    """ Build a local index from a directory of egg files instead of
+    querying a Brood instance, for use as the local side of a diff.
+
+    Only eggs added or changed since the previous scan are hashed. Eggs of
+    the same file name in different subdirectories are an error.
+    """
+    if no_scan_cache:
+        scan_cache = None
+    elif scan_cache is None:
+        scan_cache = default_scan_cache(directory)
+    try:
+        index, stats = scan_directory(directory, jobs=jobs,
+                                      cache_path=scan_cache)
+    except DuplicateEgg as e:
+        raise click.ClickException(str(e))
+    click.echo("Scanned {} eggs: {} hashed, {} unchanged".format(
+        len(index), stats["hashed"], stats["cached"]))
+    to_json_file(index, output, sort=sort)
 
 
 @cli.command(name="list-platforms")
@@ -215,126 +874,12 @@ def list_versions():
         click.echo(ver)
 
 
-# tested functions #
-
-
-def get_index(url: str, org: str, repo: str, plat: str, pyver: str,
-              legacy: bool = False) -> Union[dict, NoReturn]:
-    """ Fetch index for a given repo/platform/python-tag."""
-    if legacy:
-        resource = "/".join((url, LEGACY_INDEX_ROUTE,
-                             org, repo, plat, pyver, "eggs"))
-    else:
-        resource = "/".join((url, INDEX_ROUTE, org, repo, plat, pyver, "eggs"))
-    print("Requesting {} ...".format(resource))
-    r = requests.get(resource)
-    if r.status_code == 200:
-        return r.json()
-    elif r.status_code in (400, 404):
-        # incorrect base url raises ConnectionError and plat and ver get
-        # validated via CLI - thus 404 likely indicates problem with org/repo.
-        print("HTTP 404 Error: Please double check your Repository settings.")
-        print("Repository must be a valid org/repo combination.")
-        r.raise_for_status()
-        sys.exit()
-    elif r.status_code in (500, 502, 503, 504):  # Brood internal errors
-        msg = "HTTP 50* Error: Please verify that the EDS instance is up at {}"
-        print(msg.format(url))
-        r.raise_for_status()
-        sys.exit()
-
-
-def gen_full_index(url: str, org_repos: Tuple[str], plats: Tuple[str],
-                   pyvers: Tuple[str], output: str, sort: bool = True,
-                   legacy: bool = False) -> None:
-    """ Given a set of org/repo, platforms, and versions, generate a single
-    json file containing the entirety of the index representing these repos.
-
-    The most common usecase would be to collect the full index of the
-    end-user's enthought/free + enthought/gpl and potentially also
-    enthought/lgpl repos.
-    """
-    full_index = {}
-    for org_repo in org_repos:
-        org, repo = org_repo.split("/")
-        for plat in plats:
-            for ver in pyvers:
-                full_index.update(get_index(url,
-                                            org,
-                                            repo,
-                                            plat,
-                                            ver,
-                                            legacy))
-    to_json_file(full_index, output, sort=sort)
-
-
-def index_diff(local_index: dict, remote_index: dict) -> dict:
-    """ Calculate the difference between two json brood indices.
-    Adapted from brood/brood/sync/egg_sync.py
-
-    Remove calculations for eggs to delete:
-    Unless user specifically requests that we remove unused or outdated eggs
-    we should make minimal changes to their local EDS instance.
-
-    Likewise, remove calculations for eggs to move
-    """
-    local_index_set = set(local_index)
-    remote_index_set = set(remote_index)
-
-    missing_egg_names = remote_index_set - local_index_set
-    missing_egg_index = {key: remote_index[key]
-                         for key in missing_egg_names}
-
-    return {"missing": missing_egg_index}
-
-
-def full_diff(local_idx_json: str, org_repos: Tuple[str],
-              plats: Tuple[str], vers: Tuple[str],
-              output: str,
-              sort: bool = True,
-              legacy: bool = False,
-              remote_url: str = "https://packages.enthought.com"):
-    """ Given set of org/repo/plat/ver, a local index file and remote EDS host,
-    calculate the full index diff and write to json file specified by the
-    parameter, output.
-
-    remote_url is left as an internally available parameter but not exposed
-    via the cli - in general we will target the enthought production url.
-    """
-    local_idx = from_json_file(local_idx_json)
-    remote_idx = {}
-    for org_repo in org_repos:
-        for plat in plats:
-            for ver in vers:
-                org, repo = org_repo.split("/")
-                remote_idx.update(get_index(remote_url,
-                                            org,
-                                            repo,
-                                            plat,
-                                            ver,
-                                            legacy))
-    diff = index_diff(local_idx, remote_idx)
-    to_json_file(diff, output, sort=sort)
-
-
-def to_json_file(idx: dict, path: str, sort: bool = False) -> None:
-    """ Write index to file as json."""
-    with open(path, 'w') as f:
-        json.dump(idx, f, sort_keys=sort)
-
-
-def from_json_file(path: str) -> dict:
-    """ Read index from json file."""
-    with open(path, 'r') as f:
-        return json.loads(f.read())
-
-
-def merge_json(input_paths: Iterable[str], output) -> None:
-    """ Given list of paths to json indices, merge into one json file."""
-    index = {}
-    for path in input_paths:
-        index.update(from_json_file(path))
-    to_json_file(index, output, sort=True)
+def report_limiter(limiter: Optional[AdaptiveLimiter],
+                   verbose: bool) -> None:
+    """ Echo the concurrency trajectory of limiter if verbose."""
+    if verbose and limiter is not None:
+        for line in format_trajectory(limiter):
+            click.echo(line)
 
 
 if __name__ == '__main__':
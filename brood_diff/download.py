@@ -0,0 +1,278 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Concurrent, resumable download of the eggs listed in a diff.
+
+Each egg is written to <name>.part in the target directory and renamed into
+place once complete. Its sha256 is computed from the chunks as they are
+written, so a download is verified without reading the file back. An
+interrupted download leaves its .part file behind and the next attempt
+resumes it with a Range request; only the partial prefix is read again, to
+seed the digest. A server that ignores the Range header restarts the egg
+from scratch.
+
+The eggs of a qualified diff (see qualified) are fetched from the org/repo,
+platform and python tag they are listed under, each into a subdirectory of
+its own.
+
+Eggs already in the target directory with the size and sha256 of their
+record are skipped. Records without a sha256 are checked by size alone.
+"""
+import hashlib
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Mapping, Optional
+
+import requests
+
+from brood_diff import profiling
+from brood_diff.client import Client
+from brood_diff.jsonio import iter_json_index
+from brood_diff.qualified import is_qualified, iter_nested
+
+
+EGG_ROUTE = "api/v0/json/data"
+DEFAULT_URL_TEMPLATE = ("{url}/" + EGG_ROUTE +
+                        "/{org_repo}/{platform}/{python_tag}/eggs/{egg}")
+DEFAULT_SECTIONS = ("missing",)
+CHUNK_SIZE = 256 * 1024
+PART_SUFFIX = ".part"
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-\d+/(\d+|\*)")
+
+
+class ChecksumError(ValueError):
+    """ Raised when a downloaded egg does not match its record."""
+
+
+class UnknownLocation(ValueError):
+    """ Raised when the eggs of a flat diff are fetched without an
+    org/repo, platform and python tag."""
+
+
+def egg_url(template: str, url: str, org_repo: str, plat: str, pyver: str,
+            egg_name: str) -> str:
+    """ Download URL of an egg, from a template with the fields url,
+    org_repo, platform, python_tag and egg."""
+    return template.format(url=url, org_repo=org_repo, platform=plat,
+                           python_tag=pyver, egg=egg_name)
+
+
+def file_matches(path: str, egg: Mapping) -> bool:
+    """ Whether the file at path has the size and sha256 of egg."""
+    try:
+        size = os.path.getsize(path)
+    except OSError:
+        return False
+    if isinstance(egg.get("size"), int) and size != egg["size"]:
+        return False
+    if not egg.get("sha256"):
+        return True
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest() == egg["sha256"]
+
+
+def download_egg(client: Client, resource: str, path: str,
+                 egg: Mapping) -> dict:
+    """ Download an egg to path unless it is already there, resuming a
+    partial download. Connection errors part way through are resumed up
+    to client.retries times.
+
+    Returns {"status": "present", "downloaded" or "resumed", "bytes": bytes
+    received}. Raises ChecksumError if the egg does not match its record,
+    after removing the partial file, and requests.RequestException if it
+    cannot be fetched.
+    """
+    if file_matches(path, egg):
+        return {"status": "present", "bytes": 0}
+    part = path + PART_SUFFIX
+    received = 0
+    resumed = False
+    attempt = 0
+    while True:
+        try:
+            offset, digest = _resume_state(part, egg)
+            count, digest, appended = _fetch_to_part(client, resource, part,
+                                                     offset, digest)
+            resumed = resumed or appended
+            received += count
+            break
+        except (requests.ConnectionError,
+                requests.exceptions.ChunkedEncodingError):
+            if attempt >= client.retries:
+                raise
+            attempt += 1
+            time.sleep(client.backoff_delay(attempt - 1))
+
+    size = os.path.getsize(part)
+    if ((isinstance(egg.get("size"), int) and size != egg["size"]) or
+            (egg.get("sha256") and digest.hexdigest() != egg["sha256"])):
+        os.remove(part)
+        raise ChecksumError("{} does not match its size and sha256".format(
+            os.path.basename(path)))
+    os.replace(part, path)
+    return {"status": "resumed" if resumed else "downloaded",
+            "bytes": received}
+
+
+def _resume_state(part: str, egg: Mapping):
+    """ (offset, sha256 of the bytes before it) to resume part from. A part
+    file longer than the egg is discarded."""
+    digest = hashlib.sha256()
+    try:
+        offset = os.path.getsize(part)
+    except OSError:
+        return 0, digest
+    size = egg.get("size")
+    if isinstance(size, int) and offset > size:
+        os.remove(part)
+        return 0, digest
+    with open(part, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return offset, digest
+
+
+def _fetch_to_part(client: Client, resource: str, part: str, offset: int,
+                   digest) -> tuple:
+    """ Append the egg from offset to part, updating digest with every
+    chunk written. Returns the number of bytes received, the digest of the
+    whole part file and whether the part file was resumed rather than
+    started over."""
+    headers = {"Range": "bytes={}-".format(offset)} if offset else None
+    r = client.get(resource, headers=headers, stream=True)
+    try:
+        if r.status_code == 416 and offset:
+            # the part file already holds the whole egg
+            return 0, digest, True
+        if r.status_code == 206 and offset:
+            match = _CONTENT_RANGE_RE.match(r.headers.get("Content-Range", ""))
+            if match is None or int(match.group(1)) != offset:
+                raise requests.HTTPError(
+                    "Unexpected Content-Range for {}".format(resource),
+                    response=r)
+            mode = "ab"
+        elif r.status_code == 200:
+            # no range support: start over
+            digest = hashlib.sha256()
+            mode = "wb"
+        else:
+            r.raise_for_status()
+            raise requests.HTTPError(
+                "Unexpected HTTP {} response for {}".format(
+                    r.status_code, resource), response=r)
+        received = 0
+        with open(part, mode) as f:
+            for chunk in r.iter_content(CHUNK_SIZE):
+                f.write(chunk)
+                digest.update(chunk)
+                received += len(chunk)
+        return received, digest, mode == "ab"
+    finally:
+        r.close()
+
+
+def fetch_missing(diff_path: str, output_dir: str, url: str,
+                  org_repo: Optional[str], plat: Optional[str],
+                  pyver: Optional[str], jobs: int = 4,
+                  client: Optional[Client] = None,
+                  sections: Iterable[str] = DEFAULT_SECTIONS,
+                  url_template: str = DEFAULT_URL_TEMPLATE) -> dict:
+    """ Download the eggs of the given sections of a diff file into
+    output_dir, up to jobs at a time.
+
+    The eggs of a flat diff are fetched from org_repo, plat and pyver into
+    output_dir itself. The eggs of a qualified diff are fetched from the
+    org/repo, platform and python tag of their location, into
+    output_dir/<org>/<repo>/<platform>/<python_tag>, and org_repo, plat and
+    pyver may be None.
+
+    Returns a summary: the eggs downloaded, resumed and already present,
+    failures mapping each egg that could not be fetched or verified to its
+    error, the bytes received, the elapsed seconds and the throughput in
+    bytes per second. Eggs are named by file name, or for a qualified diff
+    by "<org/repo>/<platform>/<python_tag>/<egg_name>".
+
+    Raises UnknownLocation if the diff is flat and org_repo, plat or pyver
+    is None.
+    """
+    # {(combo, egg_name): metadata}, combo None for the eggs of a flat diff
+    eggs = {}
+    for key, value in iter_json_index(diff_path):
+        if key not in sections or not isinstance(value, Mapping):
+            continue
+        if is_qualified(value):
+            for combo, index in iter_nested(value):
+                for egg_name, egg in index.items():
+                    eggs[combo, egg_name] = egg
+        elif value:
+            if None in (org_repo, plat, pyver):
+                raise UnknownLocation(
+                    "The eggs of a flat diff need an org/repo, platform "
+                    "and python tag to be fetched from")
+            for egg_name, egg in value.items():
+                eggs[None, egg_name] = egg
+    os.makedirs(output_dir, exist_ok=True)
+    own_client = client is None
+    if own_client:
+        client = Client(pool_size=jobs)
+
+    def fetch(combo, egg_name, egg):
+        _check_name(egg_name, "egg file name")
+        directory = output_dir
+        if combo is not None:
+            parts = combo[0].split("/") + list(combo[1:])
+            for part in parts:
+                _check_name(part, "location")
+            directory = os.path.join(output_dir, *parts)
+        resource = egg_url(url_template, url,
+                           *(combo or (org_repo, plat, pyver)), egg_name)
+        os.makedirs(directory, exist_ok=True)
+        with profiling.fetch(resource) as fetched:
+            result = download_egg(client, resource,
+                                  os.path.join(directory, egg_name), egg)
+            fetched.update(status=result["status"], bytes=result["bytes"])
+        return result
+
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            futures = [(_label(combo, egg_name),
+                        executor.submit(fetch, combo, egg_name, egg))
+                       for (combo, egg_name), egg in eggs.items()]
+    finally:
+        if own_client:
+            client.close()
+    seconds = time.perf_counter() - start
+
+    summary = {"downloaded": [], "resumed": [], "present": [],
+               "failures": {}, "bytes": 0, "seconds": seconds}
+    for egg_name, future in futures:
+        try:
+            result = future.result()
+        except (requests.RequestException, OSError, ValueError) as e:
+            summary["failures"][egg_name] = e
+            continue
+        summary[result["status"]].append(egg_name)
+        summary["bytes"] += result["bytes"]
+    summary["throughput"] = summary["bytes"] / seconds if seconds else 0.0
+    profiling.count("downloaded eggs",
+                    len(summary["downloaded"]) + len(summary["resumed"]))
+    return summary
+
+
+def _check_name(name: str, what: str) -> None:
+    """ Raise ValueError unless name is a single path component."""
+    if name in ("", ".", "..") or os.path.basename(name) != name:
+        raise ValueError("Unsafe {} {!r}".format(what, name))
+
+
+def _label(combo: Optional[tuple], egg_name: str) -> str:
+    """ Name of an egg in a fetch_missing summary."""
+    return egg_name if combo is None else "/".join(combo + (egg_name,))
@@ -0,0 +1,495 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Fetching, diffing, reading and writing of EDS indices.
+
+The library behind the diff CLI: get_index and fetch_indices fetch indices
+from an EDS instance, concurrently and through a shared Client, index_diff
+and full_diff compute the diff of a local index against them, and the
+*_json_file, *_index helpers read and write index files in every format
+the CLI accepts (json, compressed json, snapshots, the qualified layout).
+"""
+import json
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import Dict, Iterable, Optional, Tuple, Union
+
+import requests
+
+from brood_diff import profiling
+from brood_diff.cache import response_validators, validator_headers
+from brood_diff.client import Client, DEFAULT_JOBS, default_client
+from brood_diff.deps import add_dependencies
+from brood_diff.jsonio import (
+    LazyIndex, first_json_key, iter_json_index, open_json, write_json
+)
+from brood_diff.merge import merge_files
+from brood_diff.qualified import (
+    QualifiedIndex, is_qualified_key, iter_nested
+)
+from brood_diff.records import compact_index
+from brood_diff.shard import write_shards
+from brood_diff.snapshot import Snapshot, is_snapshot
+
+
+INDEX_ROUTE = "api/v1/json/indices"
+LEGACY_INDEX_ROUTE = "api/v0/json/indices"
+
+
+class FetchError(Exception):
+    """ Raised when one or more index fetches of a fan-out fail.
+
+    failures maps each failed (org/repo, platform, python-tag) combination to
+    the exception raised while fetching it.
+    """
+
+    def __init__(self, failures: dict):
+        self.failures = failures
+        lines = ["Failed to fetch {} index(es):".format(len(failures))]
+        for (org_repo, plat, ver), exc in failures.items():
+            lines.append("  {} {} {}: {}".format(org_repo, plat, ver, exc))
+        super().__init__("\n".join(lines))
+
+
+def get_index(url: str, org: str, repo: str, plat: str, pyver: str,
+              legacy: bool = False, client: Optional[Client] = None) -> dict:
+    """ Fetch index for a given repo/platform/python-tag.
+
+    The request goes through client, or the shared default client, which
+    retries 429/50* responses before giving up. If the client has a cache
+    the request is conditional and a 304 is served from the cache. Raises
+    requests.HTTPError for any other response that is not a 200.
+    """
+    if client is None:
+        client = default_client()
+    resource = index_resource(url, org, repo, plat, pyver, legacy)
+    print("Requesting {} ...".format(resource))
+    cache = client.cache
+    headers = cache.conditional_headers(resource) if cache else None
+    with profiling.fetch(resource) as fetched:
+        r = client.get(resource, headers=headers)
+        body = None
+        if r.status_code == 304 and cache is not None:
+            body = cache.load(resource)
+            if body is None:
+                # evicted since the conditional request was made
+                r = client.get(resource)
+        fetched.update(status=r.status_code, bytes=len(r.content),
+                       cached=body is not None)
+    if body is not None:
+        with profiling.phase("decode"):
+            return json.loads(body.decode("utf-8"))
+    if r.status_code == 200 and cache is not None:
+        cache.store(resource, r.content, r.headers)
+    with profiling.phase("decode"):
+        return _index_from_response(r, url, resource)
+
+
+def index_resource(url: str, org: str, repo: str, plat: str, pyver: str,
+                   legacy: bool = False) -> str:
+    """ URL of the index for a given repo/platform/python-tag."""
+    route = LEGACY_INDEX_ROUTE if legacy else INDEX_ROUTE
+    return "/".join((url, route, org, repo, plat, pyver, "eggs"))
+
+
+def _index_from_response(r: requests.Response, url: str,
+                         resource: str) -> dict:
+    """ Decode an index response, raising requests.HTTPError unless it is
+    a 200."""
+    if r.status_code == 200:
+        return r.json()
+    elif r.status_code in (400, 404):
+        # incorrect base url raises ConnectionError and plat and ver get
+        # validated via CLI - thus 404 likely indicates problem with org/repo.
+        print("HTTP 404 Error: Please double check your Repository settings.")
+        print("Repository must be a valid org/repo combination.")
+    elif r.status_code == 429:
+        print("HTTP 429 Error: EDS instance at {} is rate limiting "
+              "requests".format(url))
+    elif r.status_code in (500, 502, 503, 504):  # Brood internal errors
+        msg = "HTTP 50* Error: Please verify that the EDS instance is up at {}"
+        print(msg.format(url))
+    r.raise_for_status()
+    raise requests.HTTPError(
+        "Unexpected HTTP {} response for {}".format(r.status_code, resource),
+        response=r)
+
+
+def fetch_indices(url: str, org_repos: Tuple[str], plats: Tuple[str],
+                  pyvers: Tuple[str], legacy: bool = False,
+                  jobs: int = DEFAULT_JOBS,
+                  client: Optional[Client] = None,
+                  compact: bool = False) -> Tuple[
+                      Dict[tuple, dict], Dict[tuple, Exception]]:
+    """ Fetch the index of every org/repo, platform and python-tag
+    combination, running up to `jobs` requests concurrently.
+
+    Returns a tuple (indices, failures). indices maps each successfully
+    fetched (org/repo, platform, python-tag) combination to its index and is
+    ordered as the sequential org/repo -> platform -> python-tag loop would
+    be. failures maps each combination that raised to its exception; a
+    failure does not cancel the rest of the fan-out.
+
+    If no client is given, one with a connection pool of `jobs` connections
+    is used for the fan-out. If compact is True each index is converted to
+    EggRecords (see records.compact_index) as soon as it is fetched.
+    """
+    combos = list(product(org_repos, plats, pyvers))
+    return fan_out(combos, _fetch_combo, jobs, client, url=url,
+                   legacy=legacy, compact=compact)
+
+
+def fan_out(combos: list, fetch, jobs: int, client: Optional[Client],
+            **kwargs) -> Tuple[Dict[tuple, object], Dict[tuple, Exception]]:
+    """ Call fetch(combo=combo, client=client, **kwargs) for every combo on
+    a pool of up to `jobs` threads, returning (results, failures) ordered as
+    combos."""
+    workers = max(1, min(jobs, len(combos)))
+    own_client = client is None
+    if own_client:
+        client = Client(pool_size=workers)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(fetch, combo=combo, client=client,
+                                       **kwargs)
+                       for combo in combos]
+    finally:
+        if own_client:
+            client.close()
+
+    results, failures = {}, {}
+    for combo, future in zip(combos, futures):
+        try:
+            results[combo] = future.result()
+        except Exception as e:
+            failures[combo] = e
+    return results, failures
+
+
+def _fetch_combo(url: str, combo: tuple, legacy: bool,
+                 client: Client, compact: bool = False) -> dict:
+    """ Fetch a single (org/repo, platform, python-tag) index."""
+    org_repo, plat, ver = combo
+    org, repo = org_repo.split("/")
+    idx = get_index(url, org, repo, plat, ver, legacy, client=client)
+    profiling.count("remote eggs", len(idx))
+    if not compact:
+        return idx
+    with profiling.phase("compact"):
+        return compact_index(idx)
+
+
+def fetch_combo_since(url: str, combo: tuple, legacy: bool,
+                      client: Client, state) -> tuple:
+    """ Fetch a single index unless it still validates against the
+    validators stored for it in state, a syncstate.SyncState or
+    watch.WatchState. Returns (index or None if unchanged, validators)."""
+    org_repo, plat, ver = combo
+    org, repo = org_repo.split("/")
+    resource = index_resource(url, org, repo, plat, ver, legacy)
+    validators = state.validators(combo)
+    print("Requesting {} ...".format(resource))
+    with profiling.fetch(resource) as fetched:
+        r = client.get(resource, headers=validator_headers(validators))
+        fetched.update(status=r.status_code, bytes=len(r.content))
+    if r.status_code == 304 and validators:
+        return None, validators
+    with profiling.phase("decode"):
+        idx = compact_index(_index_from_response(r, url, resource))
+    profiling.count("remote eggs", len(idx))
+    return idx, response_validators(r.headers)
+
+
+def merge_indices(indices: Dict[tuple, dict]) -> dict:
+    """ Merge fetched indices into one, later combinations taking
+    precedence over earlier ones as in the sequential loop."""
+    full_index = {}
+    for idx in indices.values():
+        full_index.update(idx)
+    return full_index
+
+
+def gen_full_index(url: str, org_repos: Tuple[str], plats: Tuple[str],
+                   pyvers: Tuple[str], output: str, sort: bool = True,
+                   legacy: bool = False, jobs: int = DEFAULT_JOBS,
+                   client: Optional[Client] = None,
+                   qualified: bool = False) -> None:
+    """ Given a set of org/repo, platforms, and versions, generate a single
+    json file containing the entirety of the index representing these repos.
+
+    The most common usecase would be to collect the full index of the
+    end-user's enthought/free + enthought/gpl and potentially also
+    enthought/lgpl repos.
+
+    Eggs of the same name in several combinations overwrite each other
+    unless qualified is True, in which case the index is written in the
+    nested layout of a qualified.QualifiedIndex.
+
+    Indices are fetched concurrently (see fetch_indices). If any combination
+    fails, the indices that were fetched are still written to output before
+    a FetchError listing the failures is raised.
+    """
+    indices, failures = fetch_indices(url, org_repos, plats, pyvers,
+                                      legacy, jobs, client)
+    full_index = (QualifiedIndex(indices) if qualified
+                  else merge_indices(indices))
+    to_json_file(full_index, output, sort=sort)
+    if failures:
+        raise FetchError(failures)
+
+
+def index_diff(local_index: Iterable[str],
+               remote_index: Union[dict, Iterable[Tuple[str, dict]]],
+               detect_changed: bool = False) -> dict:
+    """ Calculate the difference between two json brood indices.
+    Adapted from brood/brood/sync/egg_sync.py
+
+    Remove calculations for eggs to delete:
+    Unless user specifically requests that we remove unused or outdated eggs
+    we should make minimal changes to their local EDS instance.
+
+    Likewise, remove calculations for eggs to move
+
+    Besides dicts, local_index may be any iterable of egg names and
+    remote_index any iterable of (egg_name, metadata) pairs, such as those
+    yielded by jsonio.iter_json_index, so neither index has to be fully
+    loaded. Without detect_changed only the missing records of a mapping
+    remote_index are accessed, so a jsonio.LazyIndex is only decoded for
+    the eggs in the diff.
+
+    If detect_changed is True, local_index must map egg names to metadata
+    (or to the subset returned by egg_digests) and the result also has a
+    "changed" section holding the remote metadata of eggs present on both
+    sides whose contents differ (see egg_changed). Both sections are built in
+    a single pass over remote_index.
+
+    If remote_index is a qualified.QualifiedIndex the diff is computed on
+    the qualified keys, one combination at a time against the same
+    combination of a qualified local_index, or against the whole of a flat
+    one, and its sections are QualifiedIndexes. A qualified local_index
+    diffed against a flat remote_index holds an egg if any of its
+    combinations does.
+    """
+    if isinstance(remote_index, QualifiedIndex):
+        return _qualified_diff(local_index, remote_index, detect_changed)
+    if isinstance(local_index, QualifiedIndex):
+        local_index = local_index.flat()
+
+    if not detect_changed:
+        if not isinstance(local_index, (Mapping, set, frozenset)):
+            local_index = set(local_index)
+        if isinstance(remote_index, Mapping):
+            # only the missing records are read, which matters for indices
+            # that decode on access such as jsonio.LazyIndex
+            missing_egg_index = {key: remote_index[key]
+                                 for key in remote_index
+                                 if key not in local_index}
+        else:
+            missing_egg_index = {key: value for key, value in remote_index
+                                 if key not in local_index}
+        return {"missing": missing_egg_index}
+
+    if isinstance(remote_index, Mapping):
+        remote_index = remote_index.items()
+
+    missing_egg_index, changed_egg_index = {}, {}
+    for key, value in remote_index:
+        local_value = local_index.get(key)
+        if local_value is None:
+            missing_egg_index[key] = value
+        elif egg_changed(local_value, value):
+            changed_egg_index[key] = value
+
+    return {"missing": missing_egg_index, "changed": changed_egg_index}
+
+
+def _qualified_diff(local_index, remote_index: QualifiedIndex,
+                    detect_changed: bool) -> dict:
+    """ index_diff of a qualified remote index, see index_diff."""
+    if not isinstance(local_index, (Mapping, set, frozenset)):
+        local_index = set(local_index)
+    diff = {"missing": QualifiedIndex()}
+    if detect_changed:
+        diff["changed"] = QualifiedIndex()
+    for combo in remote_index.combos():
+        local = (local_index.index(combo)
+                 if isinstance(local_index, QualifiedIndex) else local_index)
+        combo_diff = index_diff(local, remote_index.index(combo),
+                                detect_changed=detect_changed)
+        for section, eggs in combo_diff.items():
+            if eggs:
+                diff[section].add(combo, eggs)
+    return diff
+
+
+# Metadata compared to detect a changed egg, in order of preference.
+DIGEST_FIELDS = ("sha256", "md5", "size")
+
+
+def egg_changed(local_egg: dict, remote_egg: dict) -> bool:
+    """ Whether two records of the same egg name differ in content.
+
+    Compares sha256, falling back to md5 and then size when a digest is
+    missing from either record. Records with none of these in common are
+    not considered changed.
+    """
+    for field in DIGEST_FIELDS:
+        local_value = local_egg.get(field)
+        remote_value = remote_egg.get(field)
+        if local_value is not None and remote_value is not None:
+            return local_value != remote_value
+    return False
+
+
+def egg_digests(egg: dict) -> dict:
+    """ The subset of an egg record used by egg_changed."""
+    return {field: egg[field] for field in DIGEST_FIELDS if field in egg}
+
+
+def full_diff(local_idx_json: str, org_repos: Tuple[str],
+              plats: Tuple[str], vers: Tuple[str],
+              output: str,
+              sort: bool = True,
+              legacy: bool = False,
+              remote_url: str = "https://packages.enthought.com",
+              jobs: int = DEFAULT_JOBS,
+              client: Optional[Client] = None,
+              detect_changed: bool = False,
+              with_deps: bool = False,
+              shard_size: Optional[int] = None,
+              qualified: bool = False):
+    """ Given set of org/repo/plat/ver, a local index file and remote EDS host,
+    calculate the full index diff and write to json file specified by the
+    parameter, output.
+
+    detect_changed adds the "changed" section described in index_diff and
+    with_deps the dependency closure described in deps.add_dependencies,
+    resolved against the merged remote index. If shard_size is given the
+    diff is written as shards, see write_diff.
+
+    remote_url is left as an internally available parameter but not exposed
+    via the cli - in general we will target the enthought production url.
+
+    As with gen_full_index, a failed fetch still writes the diff against the
+    indices that were fetched and then raises FetchError.
+
+    If qualified is True the remote indices are kept apart as a
+    qualified.QualifiedIndex instead of being merged, and the diff is
+    computed and written on qualified keys (see index_diff), as are its
+    shards. with_deps, which resolves requirements against the merged
+    remote index, is not supported with qualified diffs. A local index in
+    the qualified layout is read as a QualifiedIndex either way.
+
+    Both sides are held as compact EggRecord indices.
+    """
+    if qualified and with_deps:
+        raise ValueError("Dependencies are not supported with qualified "
+                         "diffs")
+    with profiling.phase("load"):
+        local_idx = load_compact_index(local_idx_json)
+        if isinstance(local_idx, QualifiedIndex) and not qualified:
+            local_idx = local_idx.flat()
+    profiling.count("local eggs", len(local_idx))
+    indices, failures = fetch_indices(remote_url, org_repos, plats, vers,
+                                      legacy, jobs, client, compact=True)
+    with profiling.phase("diff"):
+        remote_idx = (QualifiedIndex(indices) if qualified
+                      else merge_indices(indices))
+        diff = index_diff(local_idx, remote_idx,
+                          detect_changed=detect_changed)
+    if with_deps:
+        with profiling.phase("dependencies"):
+            add_dependencies(diff, remote_idx, local_idx)
+    profiling.count("missing eggs", len(diff["missing"]))
+    write_diff(diff, output, sort=sort, shard_size=shard_size)
+    if failures:
+        raise FetchError(failures)
+
+
+def write_diff(diff: dict, output: str, sort: bool = False,
+               shard_size: Optional[int] = None) -> None:
+    """ Write an index_diff result to output, or, if shard_size is given,
+    as numbered shards of at most shard_size bytes next to output with a
+    manifest of the shards at output (see shard.write_shards)."""
+    if shard_size is None:
+        to_json_file(diff, output, sort=sort)
+    else:
+        with profiling.phase("write"):
+            write_shards(diff, output, shard_size, sort=sort)
+
+
+def to_json_file(idx: Union[Mapping, Iterable[Tuple[str, dict]]], path: str,
+                 sort: bool = False) -> None:
+    """ Write index to file as json, streamed one entry at a time (see
+    jsonio.write_json). EggRecords are written as the json objects they were
+    built from, and the output is gzip or xz compressed if path ends in .gz
+    or .xz."""
+    with profiling.phase("write"):
+        write_json(idx, path, sort=sort)
+
+
+def from_json_file(path: str) -> dict:
+    """ Read index from json file, which may be gzip or xz compressed."""
+    with open_json(path) as f:
+        return json.loads(f.read())
+
+
+def load_index(path: str) -> Mapping:
+    """ Open an index from a json file or a snapshot. Snapshots are
+    returned as a memory-mapped Snapshot rather than a dict."""
+    if is_snapshot(path):
+        return Snapshot(path)
+    return from_json_file(path)
+
+
+def open_index(path: str) -> Union[LazyIndex, Snapshot]:
+    """ Open an index from a json file or a snapshot without decoding its
+    records, which are read as they are accessed. The result is a context
+    manager closing the file."""
+    if is_snapshot(path):
+        return Snapshot(path)
+    return LazyIndex(path)
+
+
+def iter_index(path: str) -> Iterable[Tuple[str, dict]]:
+    """ Yield the (egg_name, metadata) pairs of a json index or snapshot
+    file without loading it into a dict."""
+    if is_snapshot(path):
+        with Snapshot(path) as snapshot:
+            yield from snapshot.iter_items()
+    else:
+        yield from iter_json_index(path)
+
+
+def load_compact_index(path: str) -> Union[dict, QualifiedIndex]:
+    """ Read a json index or snapshot as compact EggRecords, as a
+    QualifiedIndex if the file is in the qualified layout."""
+    if is_qualified_file(path):
+        return QualifiedIndex({
+            combo: compact_index(idx.items())
+            for combo, idx in iter_nested(iter_json_index(path))})
+    return compact_index(iter_index(path))
+
+
+def open_qualified_index(path: str) -> QualifiedIndex:
+    """ Read an index file in the qualified layout."""
+    return QualifiedIndex(dict(iter_nested(iter_json_index(path))))
+
+
+def is_qualified_file(path: str) -> bool:
+    """ Whether an index file is in the qualified layout, from its first
+    key only."""
+    return not is_snapshot(path) and is_qualified_key(first_json_key(path))
+
+
+def merge_json(input_paths: Iterable[str], output, policy: str = "last",
+               assume_sorted: bool = False) -> None:
+    """ Given list of paths to json indices, merge into one sorted json
+    file. Inputs may be json files or snapshots and are merged as sorted
+    streams (see merge.merge_files), so memory does not grow with their
+    size. policy decides between entries of the same egg in several inputs:
+    "last" (the last input wins), "error" or "newest" (highest mtime)."""
+    with profiling.phase("merge"):
+        merge_files(input_paths, output, policy, assume_sorted)
@@ -0,0 +1,470 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Incremental reading and writing of json brood indices.
+
+An index file is a single json object mapping egg names to their metadata,
+{egg_name: metadata}. iter_json_index walks the top-level object and yields
+one (egg_name, metadata) pair at a time from a bounded read buffer, so the raw
+text of a large index is never held in memory alongside the decoded entries.
+
+LazyIndex is a read-only mapping over an index file for when only some of
+the records are needed. A single scan records the byte offsets of each value
+and a value is decoded from the file when it is accessed.
+
+write_json is the counterpart for output: it writes an index or a diff one
+entry at a time, producing the same text as json.dump. Files ending in .gz or
+.xz are compressed on write, and compressed files are detected by their magic
+bytes on read.
+"""
+import functools
+import gzip
+import json
+import lzma
+import mmap
+import os
+import re
+import tempfile
+from array import array
+from collections.abc import Mapping
+from operator import itemgetter
+from typing import (
+    IO, Iterable, Iterator, Optional, TextIO, Tuple, Union
+)
+
+from brood_diff.qualified import QualifiedIndex
+from brood_diff.records import to_json_default
+from brood_diff.snapshot import Snapshot
+
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+# Openers used to write an output file, by extension.
+COMPRESSORS = {".gz": functools.partial(gzip.open, compresslevel=6),
+               ".xz": lzma.open}
+
+# Magic bytes of the compressed formats read transparently.
+_DECOMPRESSORS = ((b"\x1f\x8b", gzip.open),
+                  (b"\xfd7zXZ\x00", lzma.open))
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_BYTES_WHITESPACE = re.compile(rb"[ \t\n\r]*")
+_STRING_TAIL = re.compile(rb'(?:[^"\\]+|\\.)*"', re.DOTALL)
+_STRUCTURAL = re.compile(rb'["{}\[\]]')
+_SCALAR = re.compile(rb"[^,:{}\[\]\s]+")
+# Most whitespace a LazyIndex scan expects around the colon after a key
+# before walking the entry token by token.
+_MAX_COLON_GAP = 64
+
+
+# Characters that may continue a json number.
+_NUMBER_CHARS = frozenset("0123456789.eE+-")
+
+
+class _Buffer(object):
+    """ Sliding window over a text file for the incremental reader."""
+
+    def __init__(self, f: TextIO, chunk_size: int):
+        self.f = f
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """ Append the next chunk, dropping consumed text."""
+        chunk = self.f.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """ Next non-whitespace character, or '' at end of file."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                return ""
+
+    def expect(self, chars: str) -> str:
+        """ Consume the next character, which must be one of chars."""
+        char = self.peek()
+        if not char or char not in chars:
+            msg = "Expecting value" if not char else "Expecting {!r}".format(
+                " or ".join(chars))
+            raise json.JSONDecodeError(msg, self.buf, self.pos)
+        self.pos += 1
+        return char
+
+    def decode(self):
+        """ Decode the next json value, reading more input as needed."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if self.eof or not self.fill():
+                    raise
+                continue
+            # A number ending at the end of the buffer, or where the next
+            # character could continue it ("1." of "1.5"), may continue in
+            # the next chunk.
+            if (not self.eof and (end == len(self.buf) or (
+                    isinstance(obj, (int, float)) and
+                    self.buf[end] in _NUMBER_CHARS)) and self.fill()):
+                continue
+            self.pos = end
+            return obj
+
+
+def iter_json_index(path: str,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE
+                    ) -> Iterator[Tuple[str, dict]]:
+    """ Yield (egg_name, metadata) pairs from a json index file.
+
+    Raises json.JSONDecodeError, as from_json_file does, if the file is not
+    a json object. The file may be gzip or xz compressed.
+    """
+    with open_json(path) as f:
+        yield from iter_json_object(f, chunk_size)
+
+
+def iter_json_object(f: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE
+                     ) -> Iterator[Tuple[str, object]]:
+    """ Yield the (key, value) pairs of the top-level json object in f."""
+    buf = _Buffer(f, chunk_size)
+    if not buf.peek():
+        raise json.JSONDecodeError("Expecting value", buf.buf, buf.pos)
+    buf.expect("{")
+    if buf.peek() == "}":
+        buf.pos += 1
+    else:
+        while True:
+            if buf.peek() != '"':
+                raise json.JSONDecodeError(
+                    "Expecting property name enclosed in double quotes",
+                    buf.buf, buf.pos)
+            key = buf.decode()
+            buf.expect(":")
+            yield key, buf.decode()
+            if buf.expect(",}") == "}":
+                break
+    if buf.peek():
+        raise json.JSONDecodeError("Extra data", buf.buf, buf.pos)
+
+
+def first_json_key(path: str,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> Optional[str]:
+    """ The first key of the top-level json object in a file, or None if
+    the object is empty. Reads only as far as that key."""
+    with open_json(path) as f:
+        buf = _Buffer(f, chunk_size)
+        if not buf.peek():
+            raise json.JSONDecodeError("Expecting value", buf.buf, buf.pos)
+        buf.expect("{")
+        if buf.peek() != '"':
+            return None
+        return buf.decode()
+
+
+def iter_json_keys(path: str,
+                   chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+    """ Yield the egg names of a json index file."""
+    for key, _ in iter_json_index(path, chunk_size):
+        yield key
+
+
+class LazyIndex(Mapping):
+    """ Read-only mapping over a json index file that decodes a record only
+    when it is accessed.
+
+    Opening the file scans it once for the byte offsets of each top-level
+    value; keys iterate in file order. Uncompressed files are memory-mapped,
+    so records that are never accessed are never read again, while gzip and
+    xz files are decompressed into memory. Records are decoded on every
+    access rather than kept.
+
+    Raises json.JSONDecodeError if the file is not a json object. The scan
+    checks the structure of the file but not the contents of each value, so
+    a malformed record raises when it is accessed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._mmap = None
+        opener = _decompressor(path)
+        if opener is not None:
+            with opener(path, "rb") as f:
+                self._data = f.read()
+        else:
+            with open(path, "rb") as f:
+                if os.fstat(f.fileno()).st_size:
+                    self._mmap = mmap.mmap(f.fileno(), 0,
+                                           access=mmap.ACCESS_READ)
+            self._data = self._mmap if self._mmap is not None else b""
+        try:
+            self._slots, self._spans = _scan_offsets(self._data)
+        except BaseException:
+            self.close()
+            raise
+
+    def raw(self, key: str) -> bytes:
+        """ The undecoded json text of a record."""
+        i = 2 * self._slots[key]
+        return self._data[self._spans[i]:self._spans[i + 1]]
+
+    def __getitem__(self, key: str):
+        return json.loads(self.raw(key))
+
+    def __contains__(self, key) -> bool:
+        return key in self._slots
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._slots)
+
+    def __len__(self) -> int:
+        return len(self._slots)
+
+    def close(self) -> None:
+        if self._mmap is not None:
+            self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _scan_offsets(data) -> Tuple[dict, array]:
+    """ ({key: slot}, spans) of the top-level object in data, the value of
+    each key lying between offsets spans[2 * slot] and spans[2 * slot + 1].
+
+    Index records are flat objects, so most are delimited with a few
+    searches: the first "}" after the opening "{" closes the record if no
+    string in between holds a brace, which is the case if neither the key
+    nor the record contain an escape, the record has an even number of
+    quotes and no other "{". Anything else is walked token by token.
+    """
+    slots, spans = {}, array("Q")
+    find = data.find
+    pos = _skip_whitespace(data, 0)
+    if pos == len(data):
+        _decode_error("Expecting value", data, pos)
+    if data[pos] != 0x7B:
+        _decode_error("Expecting '{'", data, pos)
+    pos = _skip_whitespace(data, pos + 1)
+    if pos < len(data) and data[pos] == 0x7D:
+        pos += 1
+    else:
+        while True:
+            if pos == len(data) or data[pos] != 0x22:
+                _decode_error("Expecting property name enclosed in double "
+                              "quotes", data, pos)
+            key_end = find(b'"', pos + 1)
+            start = find(b"{", key_end, key_end + _MAX_COLON_GAP)
+            end = find(b"}", start) + 1 if key_end > 0 < start else 0
+            record = data[start:end] if end else b""
+            if (record and data[key_end + 1:start].strip() == b":" and
+                    not record.count(b'"') & 1 and
+                    record.find(b"{", 1) < 0 and
+                    b"\\" not in record and
+                    find(b"\\", pos, key_end) < 0):
+                key = data[pos + 1:key_end].decode("utf-8")
+            else:
+                key, start, end = _scan_entry(data, pos)
+            if key not in slots:
+                slots[key] = len(spans) // 2
+                spans.extend((start, end))
+            else:
+                # the last value wins, as with json.loads
+                i = 2 * slots[key]
+                spans[i], spans[i + 1] = start, end
+            if data[end:end + 3] == b', "':
+                pos = end + 2
+                continue
+            pos = _skip_whitespace(data, end)
+            separator = data[pos:pos + 1]
+            if separator == b"}":
+                pos += 1
+                break
+            if separator != b",":
+                _decode_error("Expecting ',' delimiter", data, pos)
+            pos = _skip_whitespace(data, pos + 1)
+    if _skip_whitespace(data, pos) != len(data):
+        _decode_error("Extra data", data, pos)
+    return slots, spans
+
+
+def _scan_entry(data, pos: int) -> Tuple[str, int, int]:
+    """ (key, start, end) of the key/value pair starting at pos."""
+    key_end = _skip_string(data, pos)
+    key = json.loads(data[pos:key_end])
+    pos = _skip_whitespace(data, key_end)
+    if data[pos:pos + 1] != b":":
+        _decode_error("Expecting ':' delimiter", data, pos)
+    start = _skip_whitespace(data, pos + 1)
+    return key, start, _skip_value(data, start)
+
+
+def _skip_value(data, pos: int) -> int:
+    """ Offset just past the json value starting at pos."""
+    char = data[pos:pos + 1]
+    if char == b'"':
+        return _skip_string(data, pos)
+    if char not in (b"{", b"["):
+        match = _SCALAR.match(data, pos)
+        if match is None:
+            _decode_error("Expecting value", data, pos)
+        return match.end()
+    depth = 0
+    while True:
+        match = _STRUCTURAL.search(data, pos)
+        if match is None:
+            _decode_error("Unterminated value", data, len(data))
+        char = match.group()
+        if char == b'"':
+            pos = _skip_string(data, match.start())
+            continue
+        pos = match.end()
+        depth += 1 if char in b"{[" else -1
+        if depth == 0:
+            return pos
+
+
+def _skip_string(data, pos: int) -> int:
+    """ Offset just past the json string starting at pos."""
+    match = _STRING_TAIL.match(data, pos + 1)
+    if match is None:
+        _decode_error("Unterminated string", data, pos)
+    return match.end()
+
+
+def _skip_whitespace(data, pos: int) -> int:
+    return _BYTES_WHITESPACE.match(data, pos).end()
+
+
+def _decode_error(msg: str, data, pos: int):
+    raise json.JSONDecodeError(
+        msg, data[:pos].decode("utf-8", "replace"), pos)
+
+
+def open_json(path: str, mode: str = "r") -> IO[str]:
+    """ Open a json file in text mode.
+
+    For writing, the file is compressed if path ends in .gz or .xz. For
+    reading, gzip and xz files are recognized by their magic bytes whatever
+    their name.
+    """
+    if "r" not in mode:
+        opener = COMPRESSORS.get(os.path.splitext(path)[1].lower())
+    else:
+        opener = _decompressor(path)
+    if opener is None:
+        return open(path, mode)
+    return opener(path, mode + "t")
+
+
+def _decompressor(path: str):
+    """ Opener of a compressed file, recognized by its magic bytes, or None
+    if it is not compressed."""
+    with open(path, "rb") as f:
+        head = f.read(6)
+    return next((opener for magic, opener in _DECOMPRESSORS
+                 if head.startswith(magic)), None)
+
+
+class SortedItems(object):
+    """ (key, value) pairs known to be in key order, which write_json does
+    not sort again."""
+
+    def __init__(self, items: Iterable[Tuple[str, object]]):
+        self.items = items
+
+    def __iter__(self) -> Iterator[Tuple[str, object]]:
+        return iter(self.items)
+
+
+def write_json(obj: Union[Mapping, Iterable[Tuple[str, object]]], path: str,
+               sort: bool = False, atomic: bool = False) -> None:
+    """ Write obj to path as json, one entry at a time.
+
+    obj is a mapping, such as an index or an index_diff result, or an
+    iterable of (key, value) pairs written as an object. The output is the
+    same as json.dump(obj, f, sort_keys=sort) would produce; EggRecords are
+    written as the json objects they were built from. Pairs are sorted in
+    memory if sort is True; snapshots and SortedItems are already sorted and
+    are written as they are read.
+
+    If atomic is True the file is written under a temporary name next to
+    path and renamed over it, so readers never see a partial file.
+    """
+    if atomic:
+        directory, name = os.path.split(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix="." + name,
+                                        suffix=os.path.splitext(name)[1])
+        os.close(fd)
+        try:
+            write_json(obj, tmp_path, sort)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return
+    with open_json(path, "w") as f:
+        for chunk in iter_json_chunks(obj, sort):
+            f.write(chunk)
+
+
+def iter_json_chunks(obj: Union[Mapping, Iterable[Tuple[str, object]]],
+                     sort: bool = False) -> Iterator[str]:
+    """ Yield the json text of obj, as described in write_json, in pieces.
+
+    Mappings whose values are themselves mappings, such as the top level of
+    an index or of a diff and the sections of a diff, are written entry by
+    entry; everything below is encoded whole. QualifiedIndexes are written
+    in their nested layout.
+    """
+    if isinstance(obj, QualifiedIndex):
+        obj = obj.nested()
+    if isinstance(obj, Mapping):
+        items = _mapping_items(obj, sort)
+    elif sort and not isinstance(obj, SortedItems):
+        items = sorted(obj, key=itemgetter(0))
+    else:
+        items = obj
+    return _iter_object(items, sort)
+
+
+def _iter_object(items: Iterable[Tuple[str, object]],
+                 sort: bool) -> Iterator[str]:
+    separator = "{"
+    for key, value in items:
+        yield separator + json.dumps(key) + ": "
+        separator = ", "
+        if isinstance(value, QualifiedIndex):
+            value = value.nested()
+        if isinstance(value, Mapping) and _has_mapping_values(value):
+            yield from _iter_object(_mapping_items(value, sort), sort)
+        else:
+            yield json.dumps(value, sort_keys=sort, default=to_json_default)
+    yield "{}" if separator == "{" else "}"
+
+
+def _mapping_items(mapping: Mapping, sort: bool) -> Iterable[Tuple]:
+    """ Items of a mapping, in key order if sort is True."""
+    if not sort or isinstance(mapping, Snapshot):
+        return mapping.items()
+    return sorted(mapping.items(), key=itemgetter(0))
+
+
+def _has_mapping_values(mapping: Mapping) -> bool:
+    for value in mapping.values():
+        return isinstance(value, Mapping)
+    return False
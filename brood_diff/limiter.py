@@ -0,0 +1,251 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Adaptive concurrency and rate limiting of EDS requests.
+
+A fixed number of concurrent requests is either too slow for an idle EDS
+instance or enough to overload a busy one into 429 and 50* responses.
+AdaptiveLimiter adjusts the number of requests allowed in flight AIMD
+style, as TCP adjusts its congestion window:
+
+    slow start      the limit grows by one per successful request, doubling
+                    every round trip, until the first sign of overload
+    increase        then by one per round trip, 1 / limit per success
+    decrease        a 429 or 50* response, a connection error or a request
+                    slower than latency_target multiplies the limit by
+                    decrease, once per round trip: requests sent before the
+                    last decrease do not decrease it again
+
+The limit stays between floor and ceiling. Threads over the limit wait in
+acquire, so a fan-out can be given as many threads as the ceiling and run
+as many of them as the server keeps up with.
+
+A TokenBucket per host additionally caps the rate requests are sent at, to
+stay under a known rate limit instead of discovering it through 429s.
+
+Every change of the whole number of requests allowed, and every decrease,
+is recorded in trajectory as (seconds, limit, in_flight, event).
+"""
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import click
+
+
+# Statuses signalling an overloaded or rate limiting server.
+OVERLOAD_STATUSES = (429, 500, 502, 503, 504)
+
+DEFAULT_DECREASE = 0.5
+
+
+class TokenBucket(object):
+    """ Allow rate acquisitions per second on average, burst at once.
+
+    An acquisition that finds the bucket empty reserves the next token and
+    sleeps until it is due, so waiting threads are served in order.
+    """
+
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("Rate must be positive")
+        self.rate = rate
+        self.burst = max(1.0, burst if burst is not None else rate)
+        self.tokens = self.burst
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """ Take a token, waiting for it if needed. Returns the seconds
+        waited."""
+        with self._lock:
+            now = self._clock()
+            self.tokens = min(self.burst, self.tokens +
+                              (now - self._updated) * self.rate)
+            self._updated = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            self._sleep(wait)
+        return wait
+
+
+class Permit(object):
+    """ A request admitted by AdaptiveLimiter.acquire."""
+    __slots__ = ("started", "epoch")
+
+    def __init__(self, started: float, epoch: int):
+        self.started = started
+        self.epoch = epoch
+
+
+class AdaptiveLimiter(object):
+    """ AIMD limit on the requests in flight, with optional per-host rate
+    limiting; see the module docstring.
+
+    initial is the starting limit and ceiling the largest. rate and burst
+    configure a TokenBucket per host, rate None for no rate limit.
+    latency_target is the request time in seconds above which a request
+    counts as a sign of overload, None to only count failed requests.
+    """
+
+    def __init__(self, ceiling: int, initial: float = 1.0,
+                 floor: float = 1.0, decrease: float = DEFAULT_DECREASE,
+                 latency_target: Optional[float] = None,
+                 rate: Optional[float] = None,
+                 burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if ceiling < 1:
+            raise ValueError("Ceiling must be at least 1")
+        if not 0 < decrease < 1:
+            raise ValueError("Decrease must be between 0 and 1")
+        self.ceiling = float(ceiling)
+        self.floor = max(1.0, min(float(floor), self.ceiling))
+        self.limit = min(max(float(initial), self.floor), self.ceiling)
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.rate = rate
+        self.burst = burst
+        self.in_flight = 0
+        self.trajectory: List[Tuple[float, float, int, str]] = []
+        self._threshold = self.ceiling
+        self._epoch = 0
+        self._clock = clock
+        self._started = clock()
+        self._buckets: Dict[str, TokenBucket] = {}
+        self._condition = threading.Condition()
+        self._record("start")
+
+    def acquire(self, url: str) -> Permit:
+        """ Wait until a request to url may be sent."""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+            bucket = None
+            if self.rate is not None:
+                host = urlsplit(url).netloc
+                bucket = self._buckets.get(host)
+                if bucket is None:
+                    bucket = self._buckets[host] = TokenBucket(
+                        self.rate, self.burst)
+        try:
+            if bucket is not None:
+                bucket.acquire()
+        except BaseException:
+            self._finish()
+            raise
+        return Permit(self._clock(), self._epoch)
+
+    def release(self, permit: Permit, status: Optional[int]) -> None:
+        """ Record the outcome of a request: its response status, or None
+        if it failed to connect or read."""
+        latency = self._clock() - permit.started
+        if status is None:
+            overload = "error"
+        elif status in OVERLOAD_STATUSES:
+            overload = str(status)
+        elif (self.latency_target is not None and
+              latency > self.latency_target):
+            overload = "latency"
+        else:
+            overload = None
+        with self._condition:
+            self.in_flight -= 1
+            if overload is not None:
+                if permit.epoch == self._epoch:
+                    self._epoch += 1
+                    self.limit = max(self.floor, self.limit * self.decrease)
+                    self._threshold = self.limit
+                    self._record("decrease ({})".format(overload))
+            else:
+                previous = int(self.limit)
+                step = 1.0 if self.limit < self._threshold else (
+                    1.0 / self.limit)
+                self.limit = min(self.ceiling, self.limit + step)
+                if int(self.limit) != previous:
+                    self._record("increase")
+            self._condition.notify_all()
+
+    def summary(self) -> dict:
+        """ Final, lowest and highest limit and the number of decreases."""
+        limits = [limit for _, limit, _, _ in self.trajectory]
+        return {"limit": self.limit,
+                "min_limit": min(limits),
+                "max_limit": max(limits),
+                "decreases": self._epoch}
+
+    def _finish(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def _record(self, event: str) -> None:
+        self.trajectory.append((self._clock() - self._started, self.limit,
+                                self.in_flight, event))
+
+
+def limiter_from_options(adaptive: bool, jobs: int,
+                         rate: Optional[float] = None,
+                         latency_target: Optional[float] = None
+                         ) -> Optional[AdaptiveLimiter]:
+    """ AdaptiveLimiter for the --adaptive/--rate/--latency-target CLI
+    options, with --jobs as its ceiling, or None if neither adaptive
+    concurrency nor a rate limit is asked for. Without --adaptive the limit
+    stays at jobs."""
+    if not adaptive and rate is None:
+        return None
+    initial = 1 if adaptive else jobs
+    floor = 1 if adaptive else jobs
+    return AdaptiveLimiter(jobs, initial=initial, floor=floor,
+                           latency_target=latency_target if adaptive
+                           else None, rate=rate)
+
+
+def limiter_options(f: Callable) -> Callable:
+    """ Decorator adding the --adaptive, --rate, --latency-target and
+    --verbose CLI options, see limiter_from_options and format_trajectory.
+    """
+    options = [
+        click.option('--adaptive/--no-adaptive', default=False,
+                     help=("Start with one request in flight and adapt the "
+                           "number of concurrent requests to the load of "
+                           "the EDS instance, up to --jobs, backing off on "
+                           "429 and 50* responses.\nDefault: --no-adaptive")),
+        click.option('--rate', type=click.FloatRange(min=0, min_open=True),
+                     default=None,
+                     help=("Maximum requests per second sent to the EDS "
+                           "instance.\nDefault: unlimited")),
+        click.option('--latency-target',
+                     type=click.FloatRange(min=0, min_open=True),
+                     default=None,
+                     help=("With --adaptive, seconds above which a request "
+                           "counts as a sign of overload.\nDefault: only "
+                           "failed requests count")),
+        click.option('--verbose', is_flag=True, default=False,
+                     help=("Report how the number of concurrent requests "
+                           "changed.")),
+    ]
+    for option in reversed(options):
+        f = option(f)
+    return f
+
+
+def format_trajectory(limiter: AdaptiveLimiter) -> List[str]:
+    """ Lines describing the trajectory of a limiter, for verbose
+    output."""
+    lines = ["{:8.3f}s  limit {:5.1f}  in flight {:3d}  {}".format(
+        seconds, limit, in_flight, event)
+        for seconds, limit, in_flight, event in limiter.trajectory]
+    summary = limiter.summary()
+    lines.append("Concurrency ended at {:.1f} (min {:.1f}, max {:.1f}) "
+                 "after {} decreases".format(
+                     summary["limit"], summary["min_limit"],
+                     summary["max_limit"], summary["decreases"]))
+    return lines
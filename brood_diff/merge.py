@@ -0,0 +1,162 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Streaming k-way merge of key-sorted indices.
+
+Each input is read as a stream of (egg_name, metadata) pairs in key order
+and the streams are merged with a heap, so memory is bounded by the number
+of inputs rather than the size of their union and the merged output comes
+out sorted in a single pass.
+
+Snapshots are always key-sorted, as are json indices written with --sort,
+and json inputs are merged as they are read. If one turns out not to be
+sorted, the unsorted json inputs are converted to temporary snapshots, which
+holds each of them in memory while it is written, and the merge starts
+over. An egg name found in several inputs is resolved by a conflict policy:
+
+    last    the entry of the last input holding the egg wins, as with
+            dict.update
+    error   raise MergeConflict
+    newest  the entry with the highest mtime wins, the last input breaking
+            ties
+"""
+import contextlib
+import heapq
+import os
+import tempfile
+from operator import itemgetter
+from typing import Iterable, Iterator, List, Tuple
+
+from brood_diff.jsonio import SortedItems, iter_json_index, write_json
+from brood_diff.snapshot import Snapshot, is_snapshot, write_snapshot
+
+
+CONFLICT_POLICIES = ("last", "error", "newest")
+
+
+class MergeConflict(ValueError):
+    """ Raised by the error policy when inputs share an egg name."""
+
+    def __init__(self, key: str):
+        self.key = key
+        super().__init__("Egg {} is present in more than one input".format(
+            key))
+
+
+class UnsortedInput(ValueError):
+    """ Raised when a merge input turns out not to be sorted."""
+
+    def __init__(self, number: int, key: str, previous: str):
+        self.number = number
+        super().__init__("Input {} is not sorted: {!r} follows {!r}".format(
+            number, key, previous))
+
+
+def merge_sorted(inputs: List[Iterable[Tuple[str, dict]]],
+                 policy: str = "last") -> Iterator[Tuple[str, dict]]:
+    """ Merge key-sorted streams of (egg_name, metadata) pairs into one
+    key-sorted stream, resolving duplicate names by policy.
+
+    Raises UnsortedInput if an input turns out not to be sorted.
+    """
+    if policy not in CONFLICT_POLICIES:
+        raise ValueError("Unknown conflict policy {!r}, expected one of "
+                         "{}".format(policy, ", ".join(CONFLICT_POLICIES)))
+    # heapq.merge is stable, so equal names come out in input order.
+    merged = heapq.merge(*(_checked(items, i) for i, items in
+                           enumerate(inputs)),
+                         key=itemgetter(0))
+    current_key, current = None, None
+    for key, egg in merged:
+        if key != current_key:
+            if current_key is not None:
+                yield current_key, current
+            current_key, current = key, egg
+        elif policy == "last":
+            current = egg
+        elif policy == "error":
+            raise MergeConflict(key)
+        elif _mtime(egg) >= _mtime(current):
+            current = egg
+    if current_key is not None:
+        yield current_key, current
+
+
+def _checked(items: Iterable[Tuple[str, dict]],
+             number: int) -> Iterator[Tuple[str, dict]]:
+    """ Pass items through, raising UnsortedInput if their keys go down."""
+    previous = None
+    for key, egg in items:
+        if previous is not None and key < previous:
+            raise UnsortedInput(number, key, previous)
+        previous = key
+        yield key, egg
+
+
+def _mtime(egg: dict) -> float:
+    mtime = egg.get("mtime")
+    return mtime if isinstance(mtime, (int, float)) else float("-inf")
+
+
+def is_sorted(path: str) -> bool:
+    """ Whether the keys of a json index or snapshot are in sorted order,
+    read without loading the index."""
+    if is_snapshot(path):
+        return True
+    previous = None
+    for key, _ in iter_json_index(path):
+        if previous is not None and key < previous:
+            return False
+        previous = key
+    return True
+
+
+def merge_files(input_paths: Iterable[str], output: str,
+                policy: str = "last", assume_sorted: bool = False) -> None:
+    """ Merge json indices and snapshots into a sorted json index.
+
+    Unless assume_sorted is True, if a json input turns out not to be
+    sorted, the json inputs are checked and those not sorted converted to
+    temporary snapshots before merging again. With assume_sorted an unsorted
+    input raises UnsortedInput part way through.
+    """
+    input_paths = list(input_paths)
+    try:
+        _merge_paths(input_paths, output, policy)
+    except UnsortedInput as e:
+        if assume_sorted:
+            raise
+        with tempfile.TemporaryDirectory() as tmpdir:
+            paths = _sorted_paths(input_paths, e.number, tmpdir)
+            _merge_paths(paths, output, policy)
+
+
+def _sorted_paths(paths: List[str], unsorted: int, tmpdir: str
+                  ) -> List[str]:
+    """ paths with the json inputs that are not sorted, input number
+    unsorted among them, replaced by snapshots written to tmpdir."""
+    result = []
+    for number, path in enumerate(paths):
+        if number == unsorted or not is_sorted(path):
+            sorted_path = os.path.join(tmpdir, "{}.snap".format(number))
+            write_snapshot(iter_json_index(path), sorted_path)
+            path = sorted_path
+        result.append(path)
+    return result
+
+
+def _merge_paths(paths: List[str], output: str, policy: str) -> None:
+    """ Merge sorted json indices and snapshots into output. output is only
+    replaced once the merge is complete, so a failed merge leaves it as it
+    was and it may be one of the inputs."""
+    with contextlib.ExitStack() as stack:
+        inputs = []
+        for path in paths:
+            if is_snapshot(path):
+                snapshot = stack.enter_context(Snapshot(path))
+                inputs.append(snapshot.iter_items())
+            else:
+                inputs.append(iter_json_index(path))
+        write_json(SortedItems(merge_sorted(inputs, policy)), output,
+                   sort=True, atomic=True)
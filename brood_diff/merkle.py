@@ -0,0 +1,121 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Bucketed digests of an index, for diffing across an air gap.
+
+Instead of carrying a full local index out of an air-gapped site, the
+customer builds a digest file: every egg is hashed by name into one of a
+fixed number of buckets, each bucket gets a digest over the names and
+content digests of its eggs, and a root digest covers all the buckets. The
+file holds 32 hex digits per bucket whatever the size of the index, about
+37 KB with the DEFAULT_BUCKETS of 1024 once every bucket holds an egg.
+
+Comparing a remote index against a digest file finds the buckets whose
+digests differ and returns the remote eggs in those buckets only. Those are
+a superset of the eggs the customer is missing or has a different build of:
+a differing bucket may also hold eggs the customer already has. Running
+gen-diff against the (small) result on the customer side gives the exact
+diff.
+"""
+import hashlib
+from typing import Iterable, List, Tuple
+
+
+DIGEST_FORMAT = "brood-digest"
+DIGEST_VERSION = 1
+DEFAULT_BUCKETS = 1024
+
+# Bytes kept of each bucket digest; collisions only need to be unlikely,
+# not infeasible to construct.
+BUCKET_DIGEST_SIZE = 16
+
+
+def bucket_of(egg_name: str, n_buckets: int) -> int:
+    """ Bucket an egg name hashes into."""
+    digest = hashlib.sha256(egg_name.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % n_buckets
+
+
+def egg_leaf(egg_name: str, egg) -> bytes:
+    """ Leaf hashed into a bucket digest: the egg name and its sha256,
+    falling back to md5 and then size."""
+    for field in ("sha256", "md5", "size"):
+        value = egg.get(field)
+        if value is not None:
+            return "{}\0{}:{}".format(egg_name, field, value).encode("utf-8")
+    return egg_name.encode("utf-8")
+
+
+def bucket_digests(index: Iterable[Tuple[str, dict]],
+                   n_buckets: int) -> Tuple[List[str], List[list]]:
+    """ Digest of every bucket for an iterable of (egg_name, metadata)
+    pairs, and the names hashed into each bucket. Empty buckets have an
+    empty digest."""
+    leaves = [[] for _ in range(n_buckets)]
+    names = [[] for _ in range(n_buckets)]
+    for key, egg in index:
+        bucket = bucket_of(key, n_buckets)
+        leaves[bucket].append(egg_leaf(key, egg))
+        names[bucket].append(key)
+    digests = []
+    for bucket_leaves in leaves:
+        if not bucket_leaves:
+            digests.append("")
+            continue
+        h = hashlib.sha256()
+        for leaf in sorted(bucket_leaves):
+            h.update(leaf)
+            h.update(b"\n")
+        digests.append(h.digest()[:BUCKET_DIGEST_SIZE].hex())
+    return digests, names
+
+
+def root_digest(digests: List[str]) -> str:
+    """ Digest over all bucket digests."""
+    h = hashlib.sha256()
+    for digest in digests:
+        h.update(digest.encode("ascii"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+def build_digest(index: Iterable[Tuple[str, dict]],
+                 n_buckets: int = DEFAULT_BUCKETS) -> dict:
+    """ Digest file contents for an iterable of (egg_name, metadata)
+    pairs."""
+    digests, names = bucket_digests(index, n_buckets)
+    return {"format": DIGEST_FORMAT,
+            "version": DIGEST_VERSION,
+            "buckets": n_buckets,
+            "eggs": sum(len(bucket) for bucket in names),
+            "root": root_digest(digests),
+            "digests": digests}
+
+
+def digest_diff(digest: dict, remote_index: dict) -> dict:
+    """ Compare a remote index against a digest file.
+
+    Returns {"buckets": [...], "missing": {...}}: the ids of the buckets
+    whose digests differ and the remote eggs in them. Raises ValueError if
+    digest is not a digest file.
+    """
+    if (digest.get("format") != DIGEST_FORMAT or
+            digest.get("version") != DIGEST_VERSION):
+        raise ValueError("Not a version {} brood digest file".format(
+            DIGEST_VERSION))
+    n_buckets = digest["buckets"]
+    local_digests = digest["digests"]
+    if len(local_digests) != n_buckets:
+        raise ValueError("Digest file has {} bucket digests, expected "
+                         "{}".format(len(local_digests), n_buckets))
+
+    remote_digests, names = bucket_digests(remote_index.items(), n_buckets)
+    if root_digest(remote_digests) == digest["root"]:
+        return {"buckets": [], "missing": {}}
+
+    buckets = [bucket for bucket in range(n_buckets)
+               if remote_digests[bucket] != local_digests[bucket]]
+    missing = {key: remote_index[key]
+               for bucket in buckets for key in names[bucket]}
+    return {"buckets": buckets, "missing": missing}
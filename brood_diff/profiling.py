@@ -0,0 +1,189 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Per-phase timing and resource report for CLI runs.
+
+The --profile option of the diff.py and utils.py command groups starts a
+Profile for the run and writes its report as json when the command exits:
+the wall time of the run, the time spent in each phase (fetch, decode,
+load, diff, write, ...), every fetched resource with its status, size and
+time, the bytes downloaded, counts of entries processed and the peak RSS.
+--cprofile additionally runs the command under cProfile and dumps the stats.
+
+Code is instrumented with phase(), fetch() and count(). When no profile is
+active these return a shared no-op context manager or return immediately,
+so the instrumentation costs a global lookup per call; they are only placed
+around whole phases and requests, never per entry. Phase times are summed
+over threads, so phases run by the fan-out can add up to more than the wall
+time.
+"""
+import contextlib
+import cProfile
+import json
+import sys
+import threading
+import time
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+
+class Profile(object):
+    """ Measurements of one run, collected from any thread."""
+
+    def __init__(self, path: Optional[str] = None,
+                 cprofile_path: Optional[str] = None):
+        self.path = path
+        self.cprofile_path = cprofile_path
+        self.started = time.perf_counter()
+        self.phases = {}
+        self.resources = []
+        self.counts = {}
+        self._lock = threading.Lock()
+        self._cprofile = None
+
+    def add_phase(self, name: str, seconds: float) -> None:
+        with self._lock:
+            phase = self.phases.setdefault(name, {"seconds": 0.0,
+                                                  "calls": 0})
+            phase["seconds"] += seconds
+            phase["calls"] += 1
+
+    def add_resource(self, record: dict) -> None:
+        with self._lock:
+            self.resources.append(record)
+
+    def add_count(self, name: str, n: int) -> None:
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def report(self) -> dict:
+        """ The json report of the run so far."""
+        with self._lock:
+            return {"command": sys.argv[1:],
+                    "wall_seconds": time.perf_counter() - self.started,
+                    "phases": {name: dict(phase)
+                               for name, phase in self.phases.items()},
+                    "resources": list(self.resources),
+                    "bytes_downloaded": sum(r["bytes"]
+                                            for r in self.resources),
+                    "entries": dict(self.counts),
+                    "peak_rss_mb": peak_rss_mb(),
+                    "cprofile": self.cprofile_path}
+
+
+class _Phase(object):
+    """ Context manager adding its duration to a phase of a profile."""
+    __slots__ = ("profile", "name", "start")
+
+    def __init__(self, profile: Profile, name: str):
+        self.profile = profile
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.add_phase(self.name, time.perf_counter() - self.start)
+
+
+class _Fetch(object):
+    """ Context manager recording one request; the caller fills in its
+    status, body size and whether it was served from the cache."""
+
+    def __init__(self, profile: Profile, url: str):
+        self.profile = profile
+        self.record = {"url": url, "status": None, "bytes": 0,
+                       "cached": False, "seconds": 0.0}
+
+    def update(self, **fields) -> None:
+        self.record.update(fields)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        seconds = time.perf_counter() - self.start
+        self.record["seconds"] = seconds
+        self.profile.add_resource(self.record)
+        self.profile.add_phase("fetch", seconds)
+
+
+class _NullFetch(object):
+    __slots__ = ()
+
+    def update(self, **fields) -> None:
+        pass
+
+
+_NULL_PHASE = contextlib.nullcontext()
+_NULL_FETCH = contextlib.nullcontext(_NullFetch())
+
+_active: Optional[Profile] = None
+
+
+def phase(name: str):
+    """ Context manager timing a phase of the active profile, if any."""
+    if _active is None:
+        return _NULL_PHASE
+    return _Phase(_active, name)
+
+
+def fetch(url: str):
+    """ Context manager recording a request in the active profile, if any.
+    It yields an object whose update(status=, bytes=, cached=) describes
+    the response."""
+    if _active is None:
+        return _NULL_FETCH
+    return _Fetch(_active, url)
+
+
+def count(name: str, n: int) -> None:
+    """ Add n entries processed under name to the active profile, if any."""
+    if _active is not None:
+        _active.add_count(name, n)
+
+
+def peak_rss_mb() -> Optional[float]:
+    """ Peak resident set size of this process in MB, if known."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def start(path: Optional[str] = None,
+          cprofile_path: Optional[str] = None) -> Profile:
+    """ Make a new Profile the active one. Its report is written to path
+    and, if cprofile_path is given, cProfile stats of the calling thread to
+    cprofile_path by finish()."""
+    global _active
+    profile = Profile(path, cprofile_path)
+    if cprofile_path:
+        profile._cprofile = cProfile.Profile()
+        profile._cprofile.enable()
+    _active = profile
+    return profile
+
+
+def finish() -> Optional[dict]:
+    """ Stop the active profile, write its outputs and return its report."""
+    global _active
+    profile, _active = _active, None
+    if profile is None:
+        return None
+    if profile._cprofile is not None:
+        profile._cprofile.disable()
+        profile._cprofile.dump_stats(profile.cprofile_path)
+    report = profile.report()
+    if profile.path:
+        with open(profile.path, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
@@ -0,0 +1,138 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Indices keyed by (org/repo, platform, python-tag, egg name).
+
+An egg name such as numpy-1.11.3-1.egg is the same for every platform and
+python tag it is built for, so merging the indices of several combinations
+into one {egg_name: metadata} dict keeps only the last of them.
+QualifiedIndex keeps every combination apart: its keys are qualified keys,
+(org_repo, platform, python_tag, egg_name) tuples.
+
+The key space is stored as a table of its combinations, each holding the
+{egg_name: metadata} index of that combination, rather than as one tuple
+per egg. Combination tuples and egg names are interned, so an egg name
+shared by many combinations is held once and a multi-dimension index costs
+little more than its flat indices. Qualified keys are only built when the
+index is iterated.
+
+On disk a qualified index is nested json,
+
+    {org_repo: {platform: {python_tag: {egg_name: metadata}}}}
+
+which json.load reads as plain dicts; is_qualified tells the layouts apart
+by the "/" that every org/repo holds and no egg name does.
+"""
+import sys
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, Optional, Tuple, Union
+
+
+class QualifiedIndex(Mapping):
+    """ Mapping of (org_repo, platform, python_tag, egg_name) to metadata.
+
+    indices maps (org_repo, platform, python_tag) combinations to their
+    {egg_name: metadata} index, as fetch_indices returns them.
+    """
+
+    def __init__(self, indices: Optional[Mapping] = None):
+        self._indices = {}
+        for combo, index in (indices or {}).items():
+            self.add(combo, index)
+
+    @classmethod
+    def from_nested(cls, nested: Mapping) -> "QualifiedIndex":
+        """ Build an index from the nested json layout."""
+        return cls(dict(iter_nested(nested)))
+
+    def add(self, combo: tuple, index: Mapping) -> None:
+        """ Add the index of a combination, replacing the eggs of the same
+        name already held for it."""
+        combo = tuple(sys.intern(part) for part in combo)
+        eggs = self._indices.setdefault(combo, {})
+        for egg_name, egg in index.items():
+            eggs[sys.intern(egg_name)] = egg
+
+    def combos(self) -> Iterable[tuple]:
+        """ The (org_repo, platform, python_tag) combinations, in the order
+        they were added."""
+        return self._indices.keys()
+
+    def index(self, combo: tuple) -> Dict[str, Mapping]:
+        """ The {egg_name: metadata} index of a combination, empty if it is
+        not held."""
+        return self._indices.get(tuple(combo), {})
+
+    def flat(self) -> dict:
+        """ The {egg_name: metadata} index of all combinations merged, an
+        egg found in several taking its metadata from the last one."""
+        flat = {}
+        for eggs in self._indices.values():
+            flat.update(eggs)
+        return flat
+
+    def nested(self) -> dict:
+        """ The nested json layout of the index. The per-combination
+        indices are shared, not copied."""
+        nested = {}
+        for (org_repo, plat, ver), eggs in self._indices.items():
+            nested.setdefault(org_repo, {}).setdefault(plat, {})[ver] = eggs
+        return nested
+
+    def __getitem__(self, key: tuple) -> Mapping:
+        try:
+            *combo, egg_name = key
+            return self._indices[tuple(combo)][egg_name]
+        except (TypeError, ValueError, KeyError):
+            raise KeyError(key) from None
+
+    def __contains__(self, key) -> bool:
+        try:
+            *combo, egg_name = key
+            return egg_name in self._indices[tuple(combo)]
+        except (TypeError, ValueError, KeyError):
+            return False
+
+    def __iter__(self) -> Iterator[tuple]:
+        for combo, eggs in self._indices.items():
+            for egg_name in eggs:
+                yield combo + (egg_name,)
+
+    def __len__(self) -> int:
+        return sum(len(eggs) for eggs in self._indices.values())
+
+
+def is_qualified(index: Mapping) -> bool:
+    """ Whether a mapping, e.g. a decoded json file, is a qualified index
+    or its nested json layout rather than a flat index."""
+    if isinstance(index, QualifiedIndex):
+        return True
+    for key in index:
+        return is_qualified_key(key)
+    return False
+
+
+def as_qualified(index: Mapping) -> "QualifiedIndex":
+    """ A qualified index or its nested json layout as a QualifiedIndex."""
+    if isinstance(index, QualifiedIndex):
+        return index
+    return QualifiedIndex.from_nested(index)
+
+
+def is_qualified_key(key: Optional[str]) -> bool:
+    """ Whether the first key of a json file is an org/repo, i.e. the file
+    is in the nested layout."""
+    return isinstance(key, str) and "/" in key
+
+
+def iter_nested(nested: Union[Mapping, Iterable[Tuple[str, Mapping]]]
+                ) -> Iterator[Tuple[tuple, Mapping]]:
+    """ Yield ((org_repo, platform, python_tag), index) pairs of the nested
+    json layout, given as a mapping or as (org_repo, platforms) pairs
+    streamed from a file."""
+    items = nested.items() if isinstance(nested, Mapping) else nested
+    for org_repo, plats in items:
+        for plat, vers in plats.items():
+            for ver, index in vers.items():
+                yield (org_repo, plat, ver), index
@@ -0,0 +1,171 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Compact in-memory representation of egg records.
+
+An index entry is a json object of about 16 fields. Held as plain dicts, a
+large index is dominated by per-dict overhead and by repeated strings such as
+platform_abi, python_tag and product. EggRecord stores the known fields in
+__slots__, interns the strings that repeat across eggs, keeps the packages
+list as a tuple of interned requirement strings and stores md5/sha256 digests
+as bytes.
+
+EggRecord is a read-only Mapping that presents the same keys and values as
+the json object it was built from, so code written against index dicts, such
+as index_diff, works on compact indices unchanged.
+"""
+import sys
+from collections.abc import Mapping
+from typing import Iterable, Tuple, Union
+
+
+# Known fields of an EDS egg record.
+FIELDS = ("available",
+          "build",
+          "full_version",
+          "md5",
+          "mtime",
+          "name",
+          "packages",
+          "platform_abi",
+          "product",
+          "python",
+          "python_tag",
+          "sha256",
+          "size",
+          "type",
+          "version")
+
+# String fields that repeat across many eggs and are worth interning.
+INTERNED_FIELDS = frozenset(("full_version",
+                             "name",
+                             "platform_abi",
+                             "product",
+                             "python",
+                             "python_tag",
+                             "type",
+                             "version"))
+
+DIGEST_FIELDS = frozenset(("md5", "sha256"))
+
+_HEX_DIGITS = frozenset("0123456789abcdef")
+
+# Canonical key-order tuples, shared by every record with the same layout.
+_KEY_ORDERS = {}
+
+
+class _Absent(object):
+    """ Marker for a known field missing from the original record."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return "<absent>"
+
+
+ABSENT = _Absent()
+
+
+class EggRecord(Mapping):
+    """ Compact, read-only egg record.
+
+    Fields not in FIELDS are kept in a dict, extra, which is None when the
+    record has none. keys_ is the key order of the original json object, a
+    tuple shared between all records with the same layout.
+    """
+    __slots__ = FIELDS + ("extra", "keys_")
+
+    @classmethod
+    def from_dict(cls, egg: dict) -> "EggRecord":
+        """ Build a record from an index json object."""
+        record = cls.__new__(cls)
+        extra = None
+        for key, value in egg.items():
+            if key in INTERNED_FIELDS:
+                if isinstance(value, str):
+                    value = sys.intern(value)
+            elif key in DIGEST_FIELDS:
+                value = _pack_digest(value)
+            elif key == "packages":
+                if isinstance(value, list):
+                    value = tuple(sys.intern(p) if isinstance(p, str) else p
+                                  for p in value)
+            elif key not in FIELDS:
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+                continue
+            setattr(record, key, value)
+        for field in FIELDS:
+            if not hasattr(record, field):
+                setattr(record, field, ABSENT)
+        record.extra = extra
+        keys = tuple(egg)
+        record.keys_ = _KEY_ORDERS.setdefault(keys, keys)
+        return record
+
+    def to_dict(self) -> dict:
+        """ The index json object this record was built from."""
+        return {key: self[key] for key in self.keys_}
+
+    def __getitem__(self, key: str):
+        if key in FIELDS:
+            value = getattr(self, key)
+            if value is not ABSENT:
+                return _unpack(value)
+        elif self.extra and key in self.extra:
+            return self.extra[key]
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self.keys_)
+
+    def __len__(self) -> int:
+        return len(self.keys_)
+
+    def __repr__(self):
+        return "EggRecord({!r})".format(self.to_dict())
+
+    def __reduce__(self):
+        return (EggRecord.from_dict, (self.to_dict(),))
+
+
+def _pack_digest(value):
+    """ Lowercase hex digests as bytes, anything else unchanged."""
+    if (isinstance(value, str) and len(value) % 2 == 0 and
+            _HEX_DIGITS.issuperset(value)):
+        return bytes.fromhex(value)
+    return value
+
+
+def _unpack(value):
+    """ json form of a stored field value."""
+    if isinstance(value, bytes):
+        return value.hex()
+    if isinstance(value, tuple):
+        return list(value)
+    return value
+
+
+def compact_index(index: Union[dict, Iterable[Tuple[str, dict]]]) -> dict:
+    """ Convert an index, or an iterable of (egg_name, metadata) pairs, to a
+    dict of EggRecords."""
+    if isinstance(index, Mapping):
+        index = index.items()
+    return {sys.intern(key): (egg if isinstance(egg, EggRecord)
+                              else EggRecord.from_dict(egg))
+            for key, egg in index}
+
+
+def expand_index(index: dict) -> dict:
+    """ Convert a compact index back to plain json dicts."""
+    return {key: egg.to_dict() if isinstance(egg, EggRecord) else egg
+            for key, egg in index.items()}
+
+
+def to_json_default(obj):
+    """ json.dump default hook serializing EggRecords."""
+    if isinstance(obj, EggRecord):
+        return obj.to_dict()
+    raise TypeError("Object of type {} is not JSON serializable".format(
+        type(obj).__name__))
@@ -0,0 +1,206 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Build an index from a directory of egg files.
+
+Every .egg file under the directory becomes an entry keyed by its file name,
+with the fields of an EDS index record. name, version, build, packages and
+python_tag come from the egg's EGG-INFO/spec/depend metadata, falling back
+to the "<name>-<version>-<build>.egg" file name; size and mtime come from
+the file and md5 and sha256 from its content. Two eggs of the same file
+name in different subdirectories would share an entry, so a scan finding
+them fails with DuplicateEgg.
+
+Files are hashed on a process pool through an mmap of the file, both
+digests in one pass. A sidecar cache keyed on each file's path, size and
+mtime keeps the records of earlier scans, so a rescan only hashes the files
+that were added or changed since.
+"""
+import ast
+import hashlib
+import json
+import mmap
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple
+
+from brood_diff import profiling
+from brood_diff.cache import DEFAULT_CACHE_DIR, atomic_write
+from brood_diff.deps import split_egg_name
+
+
+SPEC_PATH = "EGG-INFO/spec/depend"
+HASH_BLOCK_SIZE = 4 * 1024 * 1024
+SCAN_CACHE_VERSION = 1
+
+
+class DuplicateEgg(ValueError):
+    """ Raised when eggs of the same file name are found in different
+    subdirectories."""
+
+    def __init__(self, first: str, second: str):
+        self.paths = (first, second)
+        super().__init__("Egg {} is both at {} and at {}".format(
+            os.path.basename(first), first, second))
+
+
+def default_scan_cache(directory: str) -> str:
+    """ Sidecar cache path for a directory, under the index cache
+    directory so that the egg store itself is never written to."""
+    key = hashlib.sha256(os.path.abspath(directory).encode("utf-8"))
+    return os.path.join(DEFAULT_CACHE_DIR, "scan",
+                        key.hexdigest()[:32] + ".json")
+
+
+def hash_file(path: str) -> Tuple[str, str]:
+    """ (md5, sha256) hex digests of a file, read through an mmap."""
+    md5, sha256 = hashlib.md5(), hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                view = memoryview(mm)
+                try:
+                    for start in range(0, len(view), HASH_BLOCK_SIZE):
+                        block = view[start:start + HASH_BLOCK_SIZE]
+                        md5.update(block)
+                        sha256.update(block)
+                        block.release()
+                finally:
+                    view.release()
+    return md5.hexdigest(), sha256.hexdigest()
+
+
+def read_spec(path: str) -> dict:
+    """ The assignments of an egg's spec/depend metadata, or {} if it has
+    none or it cannot be read."""
+    try:
+        with zipfile.ZipFile(path) as egg:
+            text = egg.read(SPEC_PATH).decode("utf-8")
+        tree = ast.parse(text)
+    except (KeyError, OSError, SyntaxError, UnicodeDecodeError,
+            ValueError, zipfile.BadZipFile):
+        return {}
+    spec = {}
+    for node in tree.body:
+        if (isinstance(node, ast.Assign) and len(node.targets) == 1 and
+                isinstance(node.targets[0], ast.Name)):
+            try:
+                spec[node.targets[0].id] = ast.literal_eval(node.value)
+            except ValueError:
+                continue
+    return spec
+
+
+def egg_record(path: str) -> dict:
+    """ Index record of an egg file; the stat fields are filled in by the
+    caller."""
+    md5, sha256 = hash_file(path)
+    spec = read_spec(path)
+    parts = split_egg_name(os.path.basename(path))
+    name, version, build = parts if parts else (None, None, None)
+    name = spec.get("name") or name
+    version = spec.get("version") or version
+    build = spec.get("build", build)
+    try:
+        build = int(build)
+    except (TypeError, ValueError):
+        pass
+    python_tag = spec.get("python_tag")
+    if python_tag is None and spec.get("python"):
+        python_tag = "cp" + str(spec["python"]).replace(".", "")
+    packages = spec.get("packages")
+    return {"available": True,
+            "build": build,
+            "full_version": ("{}-{}".format(version, build)
+                             if version is not None else None),
+            "md5": md5,
+            "name": name.lower() if isinstance(name, str) else name,
+            "packages": list(packages) if packages else [],
+            "platform_abi": spec.get("platform_abi"),
+            "product": None,
+            "python_tag": python_tag,
+            "sha256": sha256,
+            "type": "egg",
+            "version": version}
+
+
+def iter_egg_files(directory: str):
+    """ (relative path, stat) of every .egg file under directory, in a
+    stable order."""
+    for dirpath, dirnames, filenames in os.walk(directory):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(".egg"):
+                path = os.path.join(dirpath, filename)
+                yield os.path.relpath(path, directory), os.stat(path)
+
+
+def scan_directory(directory: str, jobs: int = 1,
+                   cache_path: Optional[str] = None) -> Tuple[dict, dict]:
+    """ Index of the egg files under directory.
+
+    Returns (index, stats), stats counting the files hashed and the files
+    whose record was reused from the cache at cache_path. The cache is
+    rewritten with the records of this scan; no cache is used if
+    cache_path is None. Files are hashed on a pool of jobs processes.
+
+    Raises DuplicateEgg, before hashing anything, if two files have the
+    same name.
+    """
+    cached = _read_scan_cache(cache_path) if cache_path else {}
+    entries, todo = [], []
+    # {file name: relative path}
+    seen = {}
+    for relpath, st in iter_egg_files(directory):
+        filename = os.path.basename(relpath)
+        if filename in seen:
+            raise DuplicateEgg(seen[filename], relpath)
+        seen[filename] = relpath
+        stamp = [st.st_size, st.st_mtime_ns]
+        entry = cached.get(relpath)
+        record = entry["record"] if entry and entry["stamp"] == stamp else None
+        entries.append((relpath, st, stamp, record))
+        if record is None:
+            todo.append(os.path.join(directory, relpath))
+
+    with profiling.phase("hash"):
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                hashed = list(executor.map(egg_record, todo, chunksize=max(
+                    1, len(todo) // (jobs * 4))))
+        else:
+            hashed = [egg_record(path) for path in todo]
+    profiling.count("hashed eggs", len(todo))
+
+    hashed = iter(hashed)
+    index, new_cache = {}, {}
+    for relpath, st, stamp, record in entries:
+        if record is None:
+            record = next(hashed)
+            record["size"] = st.st_size
+            record["mtime"] = float(int(st.st_mtime))
+        new_cache[relpath] = {"stamp": stamp, "record": record}
+        index[os.path.basename(relpath)] = record
+    if cache_path:
+        _write_scan_cache(cache_path, new_cache)
+    return index, {"hashed": len(todo), "cached": len(entries) - len(todo)}
+
+
+def _read_scan_cache(path: str) -> dict:
+    try:
+        with open(path, "rb") as f:
+            data = json.loads(f.read().decode("utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(data, dict) or data.get(
+            "version") != SCAN_CACHE_VERSION:
+        return {}
+    return data.get("files", {})
+
+
+def _write_scan_cache(path: str, files: dict) -> None:
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    atomic_write(path, json.dumps({"version": SCAN_CACHE_VERSION,
+                                   "files": files}).encode("utf-8"))
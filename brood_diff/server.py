@@ -0,0 +1,341 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Local stand-in for an EDS instance.
+
+Serves indices on the v1 and legacy v0 json index routes, so that the fetch
+path can be tested and benchmarked without packages.enthought.com. Every
+index has an ETag and a Last-Modified header. The server can be made slow
+and unreliable:
+
+    latency      seconds to wait before answering each request
+    bandwidth    bytes per second index bodies are sent at, None for no
+                 limit
+    error_rate   fraction of requests answered with error_status instead,
+                 drawn from a generator seeded with seed
+    capacity     number of requests served at once; requests beyond it
+                 are answered with error_status straight away, as by an
+                 overloaded instance. None for no limit
+    conditional  whether a matching If-None-Match or, without one,
+                 If-Modified-Since is answered with a 304; if False every
+                 request gets a 200
+    ranges       whether a single-range Range header is answered with a
+                 206 or a 416; if False the whole body is sent
+
+Egg files can be served as well, on the route fetch-missing downloads
+from. Unknown routes get a 404. Statuses appended to queued_errors answer
+the next requests, in order, before any of the above. Each request's path
+and response status are appended to requests and statuses, and the address
+of the connection it came on is added to peers.
+
+Usage:
+    python -m brood_diff.server -i enthought/free/rh6-x86_64/cp36=idx.json
+        [--port N] [--latency S] [--bandwidth SIZE] [--error-rate F]
+        [--capacity N]
+"""
+import email.utils
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Tuple
+
+import click
+
+from brood_diff import valid
+from brood_diff.download import EGG_ROUTE
+from brood_diff.indices import INDEX_ROUTE, LEGACY_INDEX_ROUTE, iter_index
+
+
+CHUNK_SIZE = 64 * 1024
+
+
+class IndexHandler(BaseHTTPRequestHandler):
+    """ Serve server.indices[path], as configured on the server."""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.path)
+            server.peers.add(self.client_address)
+            overloaded = (server.capacity is not None and
+                          server.in_flight >= server.capacity)
+            if server.queued_errors:
+                error = server.queued_errors.pop(0)
+            elif overloaded or (server.error_rate > 0 and
+                                server.random.random() < server.error_rate):
+                error = server.error_status
+            else:
+                error = None
+            if not overloaded:
+                server.in_flight += 1
+                server.max_in_flight = max(server.max_in_flight,
+                                           server.in_flight)
+        try:
+            self._respond(server, error, overloaded)
+        finally:
+            if not overloaded:
+                with server.lock:
+                    server.in_flight -= 1
+
+    def _respond(self, server, error: Optional[int], overloaded: bool):
+        if server.latency and not overloaded:
+            time.sleep(server.latency)
+        entity = None if error else server.entity(self.path)
+        headers = {}
+        if error:
+            status, body = error, b""
+        elif entity is None:
+            status, body = 404, b""
+        else:
+            body, etag, last_modified = entity
+            headers = {"ETag": etag, "Last-Modified": last_modified}
+            status = 200
+            if server.conditional and _not_modified(self.headers, etag,
+                                                    last_modified):
+                status, body = 304, b""
+            elif server.ranges and "Range" in self.headers:
+                total = len(body)
+                byte_range = _parse_range(self.headers["Range"], total)
+                if byte_range is None:
+                    status, body = 416, b""
+                    headers["Content-Range"] = "bytes */{}".format(total)
+                else:
+                    start, stop = byte_range
+                    status, body = 206, body[start:stop]
+                    headers["Content-Range"] = "bytes {}-{}/{}".format(
+                        start, stop - 1, total)
+        with server.lock:
+            server.statuses.append(status)
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if server.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            self._write_body(body, server.bandwidth)
+        except ConnectionError:
+            pass
+
+    def _write_body(self, body: bytes, bandwidth: Optional[int]) -> None:
+        """ Send body, at most bandwidth bytes per second."""
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        start = time.perf_counter()
+        for offset in range(0, len(body), CHUNK_SIZE):
+            chunk = body[offset:offset + CHUNK_SIZE]
+            self.wfile.write(chunk)
+            due = start + (offset + len(chunk)) / bandwidth
+            delay = due - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+
+    def log_message(self, *args):
+        pass
+
+
+class IndexServer(ThreadingHTTPServer):
+    """ Threaded EDS stand-in; see the module docstring for the options.
+
+    indices maps a request path to an index, either a dict or its encoded
+    json body, or to an egg file. add_index registers an index on both
+    routes and add_egg an egg file.
+    """
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int] = ("127.0.0.1", 0),
+                 latency: float = 0.0, bandwidth: Optional[int] = None,
+                 error_rate: float = 0.0, error_status: int = 503,
+                 conditional: bool = True, ranges: bool = True,
+                 seed: int = 0, capacity: Optional[int] = None):
+        super().__init__(address, IndexHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.conditional = conditional
+        self.ranges = ranges
+        self.capacity = capacity
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.indices = {}
+        self.queued_errors = []
+        self.requests = []
+        self.statuses = []
+        self.peers = set()
+        self.url = "http://{}:{}".format(*self.server_address[:2])
+        self._entities = {}
+        self._thread = None
+
+    def add_index(self, org_repo: str, plat: str, pyver: str,
+                  index) -> None:
+        """ Serve index for a repo/platform/python-tag on the v1 and v0
+        routes, encoded once up front."""
+        if not isinstance(index, bytes):
+            index = json.dumps(index).encode("utf-8")
+        for route in (INDEX_ROUTE, LEGACY_INDEX_ROUTE):
+            self.indices[index_path(route, org_repo, plat, pyver)] = index
+
+    def add_egg(self, org_repo: str, plat: str, pyver: str, egg_name: str,
+                body: bytes) -> None:
+        """ Serve an egg file of a repo/platform/python-tag."""
+        self.indices[egg_path(org_repo, plat, pyver, egg_name)] = body
+
+    def entity(self, path: str) -> Optional[Tuple[bytes, str, str]]:
+        """ (body, ETag, Last-Modified) of the index at path, or None.
+
+        A dict index is encoded on every request, so changes made to it in
+        place are served; the ETag and Last-Modified only change along with
+        the body. Those of an encoded body are computed once.
+        """
+        with self.lock:
+            index = self.indices.get(path)
+            cached = self._entities.get(path)
+        if index is None:
+            return None
+        if cached is not None and cached[0] is index:
+            return cached
+        body = index if isinstance(index, bytes) else json.dumps(
+            index).encode("utf-8")
+        etag = '"{}"'.format(hashlib.sha256(body).hexdigest())
+        if cached is not None and cached[1] == etag:
+            last_modified = cached[2]
+        else:
+            last_modified = email.utils.formatdate(usegmt=True)
+        with self.lock:
+            self._entities[path] = (body, etag, last_modified)
+        return body, etag, last_modified
+
+    def start(self) -> "IndexServer":
+        """ Serve from a background thread."""
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def _not_modified(headers, etag: str, last_modified: str) -> bool:
+    """ Whether a conditional request matches; as in RFC 7232,
+    If-Modified-Since is ignored when If-None-Match is present."""
+    if "If-None-Match" in headers:
+        return headers["If-None-Match"] == etag
+    return headers.get("If-Modified-Since") == last_modified
+
+
+def index_path(route: str, org_repo: str, plat: str, pyver: str) -> str:
+    """ Request path of the index of a repo/platform/python-tag."""
+    return "/" + "/".join((route, org_repo, plat, pyver, "eggs"))
+
+
+def egg_path(org_repo: str, plat: str, pyver: str, egg_name: str) -> str:
+    """ Request path of an egg file of a repo/platform/python-tag."""
+    return "/" + "/".join((EGG_ROUTE, org_repo, plat, pyver, "eggs",
+                           egg_name))
+
+
+def _parse_range(value: str, total: int) -> Optional[Tuple[int, int]]:
+    """ (start, stop) of a single "bytes=" range of a body of total bytes,
+    or None if it cannot be satisfied."""
+    unit, _, spec = value.partition("=")
+    first, dash, last = spec.strip().partition("-")
+    if unit.strip() != "bytes" or not dash or "," in spec:
+        return None
+    try:
+        if not first:
+            start, stop = max(0, total - int(last)), total
+        else:
+            start = int(first)
+            stop = min(int(last) + 1, total) if last else total
+    except ValueError:
+        return None
+    if start >= stop:
+        return None
+    return start, stop
+
+
+def _parse_index_option(ctx, param, value):
+    """ Split each org/repo/platform/python-tag=path value."""
+    parsed = []
+    for spec in value:
+        combo, _, path = spec.partition("=")
+        parts = combo.split("/")
+        if not path or len(parts) != 4:
+            raise click.BadParameter(
+                "Expected org/repo/platform/python-tag=path, got "
+                "{}".format(spec))
+        parsed.append(("/".join(parts[:2]), parts[2], parts[3], path))
+    return parsed
+
+
+@click.command()
+@click.option('--index', '-i', 'indices', multiple=True, required=True,
+              callback=_parse_index_option,
+              help=("<org/repo/platform/python-tag=path> Serve this json "
+                    "index or snapshot for the combination. May be given "
+                    "multiple times."))
+@click.option('--host', default="127.0.0.1",
+              help="Address to listen on.\nDefault: 127.0.0.1")
+@click.option('--port', type=click.IntRange(min=0), default=8000,
+              help="Port to listen on, 0 for any free port.\nDefault: 8000")
+@click.option('--latency', type=click.FloatRange(min=0), default=0.0,
+              help="Seconds to wait before each response.\nDefault: 0")
+@click.option('--bandwidth', type=str, callback=valid.validate_size,
+              default=None,
+              help=("<size> Bytes per second to send bodies at, e.g. 10MB."
+                    "\nDefault: unlimited"))
+@click.option('--error-rate', type=click.FloatRange(min=0, max=1),
+              default=0.0,
+              help="Fraction of requests to fail.\nDefault: 0")
+@click.option('--error-status', type=click.IntRange(400, 599), default=503,
+              help="Status of failed requests.\nDefault: 503")
+@click.option('--conditional/--no-conditional', default=True,
+              help=("Answer matching conditional requests with a 304."
+                    "\nDefault: True"))
+@click.option('--seed', type=int, default=0,
+              help="Seed of the error draws.\nDefault: 0")
+@click.option('--capacity', type=click.IntRange(min=1), default=None,
+              help=("Number of requests served at once, others failing "
+                    "with the error status.\nDefault: unlimited"))
+def cli(indices, host, port, latency, bandwidth, error_rate, error_status,
+        conditional, seed, capacity):
+    """ Serve indices as a local EDS instance until interrupted."""
+    server = IndexServer((host, port), latency=latency, bandwidth=bandwidth,
+                         error_rate=error_rate, error_status=error_status,
+                         conditional=conditional, seed=seed,
+                         capacity=capacity)
+    for org_repo, plat, pyver, path in indices:
+        server.add_index(org_repo, plat, pyver, dict(iter_index(path)))
+    click.echo("Serving {} index(es) at {}".format(len(indices), server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,369 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Packing of a diff into size-bounded shards for transfer.
+
+The eggs of a diff are bin-packed by their size field into shards of at most
+a given capacity, so that each shard fits on one transfer medium. Packing is
+first fit decreasing, with one ordering constraint: an egg is placed in the
+same shard as its dependencies (taken from packages, see deps) or a later
+one, so a site that imports the shards in order always has an egg's
+requirements by the time the egg arrives.
+
+Eggs are packed one dependency level at a time, largest first within a
+level, and each egg goes into the first shard at or after the last shard
+holding one of its dependencies that still has room for it. That search is
+a descent of a max tree over the free space of every shard, O(log shards)
+per egg. An egg larger than the capacity gets a shard of its own.
+
+Most eggs are small next to a shard, and for them the search costs more
+than the fit it buys: an egg of at most 1 / SMALL_SHARE of the capacity goes
+into the shard the last small egg went into, if that shard is late enough
+and has room, and only otherwise searches the tree for a new running shard.
+"""
+import os
+from typing import List, Mapping, Optional
+
+from brood_diff.deps import DependencyIndex, parse_requirement
+from brood_diff.jsonio import COMPRESSORS, write_json
+from brood_diff.qualified import QualifiedIndex, as_qualified, is_qualified
+
+
+# Diff sections whose eggs are packed into shards.
+PACKED_SECTIONS = ("missing", "changed")
+
+# Eggs of at most 1 / SMALL_SHARE of the capacity fill a running shard.
+SMALL_SHARE = 64
+
+
+def egg_size(egg: Mapping) -> int:
+    """ Size of an egg in bytes, 0 if its record has none."""
+    size = egg.get("size")
+    return size if isinstance(size, int) and size > 0 else 0
+
+
+def dependency_ids(keys: List[str], eggs: Mapping[str, dict]
+                   ) -> List[List[int]]:
+    """ For each egg of keys, the positions in keys of the eggs it
+    requires, resolved as DependencyIndex.resolve does.
+
+    The eggs of each python tag are looked up by "<name> <version>", the
+    way requirements are written, so most requirements resolve with a
+    single dict lookup and without being parsed.
+    """
+    # {python_tag: {"<name> <version>": egg_name}}
+    providers = {}
+    for key, egg in eggs.items():
+        name = egg.get("name")
+        version = egg.get("version")
+        if not isinstance(name, str) or not isinstance(version, str):
+            continue
+        tag = egg.get("python_tag")
+        by_name = providers.get(tag)
+        if by_name is None:
+            by_name = providers[tag] = {}
+        name = name.lower() + " " + version
+        other = by_name.get(name)
+        if other is None or _build_rank(other, eggs) < _build_rank(key,
+                                                                   eggs):
+            by_name[name] = key
+
+    def resolve(requirement, tag):
+        """ Name of the egg providing requirement, "" for none."""
+        name, version = parse_requirement(requirement)
+        if version is not None:
+            name = name + " " + version
+            by_tag = {other: by_name[name]
+                      for other, by_name in providers.items()
+                      if name in by_name}
+            if by_tag or "-" not in version:
+                if not by_tag:
+                    return ""
+                return by_tag.get(tag) or by_tag.get(None) or max(
+                    by_tag.values(), key=lambda key: _build_rank(key, eggs))
+        nonlocal dep_index
+        if dep_index is None:
+            dep_index = DependencyIndex(eggs)
+        return dep_index.resolve(requirement, tag) or ""
+
+    ids = {key: i for i, key in enumerate(keys)}
+    dep_index = None
+    # {python_tag: {requirement: egg_name}} of the requirements not
+    # written as their egg is named, or provided for another tag.
+    resolved = {}
+    deps = []
+    for i, key in enumerate(keys):
+        egg = eggs[key]
+        tag = egg.get("python_tag")
+        by_name = providers.get(tag, {})
+        egg_deps = []
+        for requirement in egg.get("packages") or ():
+            dep = by_name.get(requirement)
+            if dep is None:
+                tag_resolved = resolved.setdefault(tag, {})
+                dep = tag_resolved.get(requirement)
+                if dep is None:
+                    dep = tag_resolved[requirement] = resolve(requirement,
+                                                              tag)
+            dep = ids.get(dep)
+            if dep is not None and dep != i:
+                egg_deps.append(dep)
+        deps.append(egg_deps)
+    return deps
+
+
+def _build_rank(egg_name: str, eggs: Mapping[str, dict]) -> tuple:
+    """ Order of the eggs providing the same requirement, as in
+    DependencyIndex: highest build, then egg name."""
+    build = eggs[egg_name].get("build")
+    return (build if isinstance(build, int) else -1, egg_name)
+
+
+def dependency_levels(deps: List[List[int]]) -> List[int]:
+    """ Level of every egg of a dependency graph, as returned by
+    dependency_ids: 0 for eggs without dependencies, otherwise one more than
+    the highest level among its dependencies. A dependency closing a cycle
+    is ignored."""
+    # Iterative depth first search; -2 marks an egg not yet visited and -1
+    # one being visited.
+    levels = [-2] * len(deps)
+    for root in range(len(deps)):
+        if levels[root] != -2:
+            continue
+        levels[root] = -1
+        stack = [(root, iter(deps[root]))]
+        while stack:
+            node, children = stack[-1]
+            for child in children:
+                if levels[child] == -2:
+                    levels[child] = -1
+                    stack.append((child, iter(deps[child])))
+                    break
+            else:
+                stack.pop()
+                level = 0
+                for child in deps[node]:
+                    if levels[child] >= level:
+                        level = levels[child] + 1
+                levels[node] = level
+    return levels
+
+
+class FreeSpace(object):
+    """ Max tree over the free space of every shard, grown on demand. The
+    leaves hold the free bytes of each shard and every other node the
+    largest free space below it."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.leaves = 1
+        self.tree = [capacity, capacity]
+
+    def find(self, lo: int, size: int) -> int:
+        """ First shard at or after lo with size bytes free, adding shards
+        as needed."""
+        while True:
+            tree, leaves = self.tree, self.leaves
+            i = lo + leaves
+            if i < len(tree):
+                while tree[i] < size:
+                    # Climb while i is a right child, then move to the
+                    # subtree just to the right.
+                    while i & 1:
+                        i >>= 1
+                    if i == 0:
+                        break
+                    i += 1
+                if i:
+                    while i < leaves:
+                        i <<= 1
+                        if tree[i] < size:
+                            i += 1
+                    return i - leaves
+            self._grow()
+
+    def free(self, shard: int) -> int:
+        """ Free bytes of a shard."""
+        return self.tree[shard + self.leaves]
+
+    def set(self, shard: int, free: int) -> None:
+        """ Set the free bytes of a shard."""
+        tree = self.tree
+        i = shard + self.leaves
+        tree[i] = free
+        while i > 1:
+            left, right = tree[i & ~1], tree[i | 1]
+            i >>= 1
+            free = left if left > right else right
+            if tree[i] == free:
+                break
+            tree[i] = free
+
+    def place(self, lo: int, size: int) -> int:
+        """ Use size bytes of the first shard at or after lo with enough
+        free space, and return that shard."""
+        shard = self.find(lo, size)
+        self.set(shard, self.free(shard) - size)
+        return shard
+
+    def _grow(self) -> None:
+        leaves = self.tree[self.leaves:]
+        self.leaves *= 2
+        leaves += [self.capacity] * (self.leaves - len(leaves))
+        tree = [0] * self.leaves + leaves
+        for i in range(self.leaves - 1, 0, -1):
+            tree[i] = max(tree[2 * i], tree[2 * i + 1])
+        self.tree = tree
+
+
+def pack(eggs: Mapping[str, dict], capacity: int,
+         deps: Optional[List[List[int]]] = None) -> List[List[str]]:
+    """ Pack eggs into shards of at most capacity bytes, as described in
+    the module docstring. Returns the egg names of each shard.
+
+    deps is the dependency graph of eggs as returned by dependency_ids,
+    computed from their packages if not given.
+    """
+    if capacity <= 0:
+        raise ValueError("Shard capacity must be positive, got {}".format(
+            capacity))
+    keys = list(eggs)
+    if deps is None:
+        deps = dependency_ids(keys, eggs)
+    levels = dependency_levels(deps)
+    sizes = [min(egg_size(egg), capacity) for egg in eggs.values()]
+
+    # By level, then largest first, then in the order of eggs; both sorts
+    # are stable.
+    order = sorted(range(len(keys)), key=sizes.__getitem__, reverse=True)
+    order.sort(key=levels.__getitem__)
+
+    space = FreeSpace(capacity)
+    small = capacity // SMALL_SHARE
+    # The running shard of small eggs and its free bytes, written back to
+    # space before it is searched again.
+    current, current_free = -1, 0
+    shard_of = [-1] * len(keys)
+    shards = []
+    for i in order:
+        size = sizes[i]
+        lo = 0
+        for dep in deps[i]:
+            if shard_of[dep] > lo:
+                lo = shard_of[dep]
+        if lo <= current and size <= current_free and size <= small:
+            current_free -= size
+            shard = current
+        else:
+            if current >= 0:
+                space.set(current, current_free)
+            if size <= small:
+                current = shard = space.find(lo, size)
+                current_free = space.free(shard) - size
+            else:
+                current = -1
+                shard = space.place(lo, size)
+        shard_of[i] = shard
+        if shard == len(shards):
+            shards.append([keys[i]])
+        else:
+            shards[shard].append(keys[i])
+    return shards
+
+
+def split_diff(diff: Mapping[str, dict], capacity: int) -> List[dict]:
+    """ Split an index_diff result into shards.
+
+    The eggs of the PACKED_SECTIONS are packed together with pack. Each
+    shard is a diff with the same sections, holding the entries of its own
+    eggs, and a "manifest" with its number, the number of shards, its egg
+    count and total bytes, the capacity and whether it holds an egg larger
+    than the capacity.
+
+    Sections of a qualified diff, as QualifiedIndexes or in their nested
+    json layout, are packed by qualified key and stay qualified in the
+    shards; an egg's requirements are resolved among the eggs of its
+    platform.
+    """
+    diff = dict(diff)
+    for section, entries in diff.items():
+        if isinstance(entries, Mapping) and is_qualified(entries):
+            diff[section] = as_qualified(entries)
+    eggs = {}
+    for section in PACKED_SECTIONS:
+        eggs.update(diff.get(section, {}).items())
+    keys = list(eggs)
+    if any(isinstance(key, tuple) for key in keys):
+        shards = pack(eggs, capacity, qualified_dependency_ids(keys, eggs))
+    else:
+        shards = pack(eggs, capacity)
+
+    results = []
+    for number, keys in enumerate(shards, 1):
+        sizes = [egg_size(eggs[key]) for key in keys]
+        shard = {"manifest": {"shard": number,
+                              "shards": len(shards),
+                              "eggs": len(keys),
+                              "bytes": sum(sizes),
+                              "capacity": capacity,
+                              "oversized": max(sizes) > capacity}}
+        for section, entries in diff.items():
+            if isinstance(entries, QualifiedIndex):
+                shard[section] = QualifiedIndex()
+                for key in keys:
+                    if key in entries:
+                        shard[section].add(key[:3], {key[3]: entries[key]})
+            else:
+                shard[section] = {key: entries[key] for key in keys
+                                  if key in entries}
+        results.append(shard)
+    return results
+
+
+def qualified_dependency_ids(keys: List[tuple],
+                             eggs: Mapping[tuple, dict]) -> List[List[int]]:
+    """ dependency_ids of the eggs of a qualified index, each egg's
+    requirements resolved among the eggs of its platform."""
+    by_platform = {}
+    for i, key in enumerate(keys):
+        by_platform.setdefault(key[1], []).append(i)
+    deps = [[] for _ in keys]
+    for positions in by_platform.values():
+        platform_keys = [keys[i] for i in positions]
+        platform_deps = dependency_ids(
+            platform_keys, {key: eggs[key] for key in platform_keys})
+        for i, egg_deps in zip(positions, platform_deps):
+            deps[i] = [positions[dep] for dep in egg_deps]
+    return deps
+
+
+def shard_path(output: str, number: int, width: int = 3) -> str:
+    """ Path of a numbered shard of output, e.g. diff-001.json.xz for
+    diff.json.xz."""
+    root, compression = os.path.splitext(output)
+    if compression.lower() not in COMPRESSORS:
+        root, compression = output, ""
+    root, ext = os.path.splitext(root)
+    return "{}-{:0{}d}{}{}".format(root, number, width, ext, compression)
+
+
+def write_shards(diff: Mapping[str, dict], output: str, capacity: int,
+                 sort: bool = True) -> dict:
+    """ Write the shards of a diff next to output, numbered from 1, and a
+    manifest of all shards to output. Returns the manifest."""
+    shards = split_diff(diff, capacity)
+    width = max(3, len(str(len(shards))))
+    manifest = {"capacity": capacity,
+                "eggs": 0,
+                "bytes": 0,
+                "shards": []}
+    for shard in shards:
+        path = shard_path(output, shard["manifest"]["shard"], width)
+        write_json(shard, path, sort=sort)
+        entry = dict(shard["manifest"], path=os.path.basename(path))
+        manifest["shards"].append(entry)
+        manifest["eggs"] += entry["eggs"]
+        manifest["bytes"] += entry["bytes"]
+    write_json(manifest, output, sort=sort)
+    return manifest
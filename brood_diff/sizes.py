@@ -0,0 +1,255 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Egg counts and byte totals of indices, snapshots and diffs, grouped by any
+combination of dimensions.
+
+A SizeTable is a columnar view of the eggs of one or more indices: a size
+column and, for each dimension that varies from egg to egg, a column of
+label codes. Dimensions that are the same for a whole index are stored once
+per block of rows instead. Only the dimensions that will be grouped by are
+built, so sizing a snapshot by source, repo or platform reads its size
+column alone without decoding a record, and grouping by name reads its keys
+but not its records. Grouping is a single pass over the columns; a block
+whose labels are all fixed is summed without visiting its rows.
+
+add_path and add_indices take an optional set of the sha256 digests already
+added, to size the deduplicated transfer of their eggs: an egg whose blob
+was already added is skipped (see dedup).
+
+Dimensions:
+
+    source      the index file, or the org/repo/platform/python-tag
+                combination the index was fetched for
+    section     "missing" or "changed" for the eggs of a diff file,
+                "index" otherwise
+    repo        org/repo of a fetched index or of a qualified file, None
+                for other files
+    platform    platform of a fetched index or of a qualified file, None
+                for other files
+    python_tag  python_tag of the egg record
+    product     product of the egg record
+    name        package name, from the egg name
+"""
+from array import array
+from collections.abc import Mapping
+from itertools import repeat
+from typing import Iterable, List, Optional, Sequence, Set, Tuple
+
+from brood_diff.dedup import unique_eggs
+from brood_diff.deps import split_egg_name
+from brood_diff.jsonio import iter_json_index
+from brood_diff.qualified import is_qualified, iter_nested
+from brood_diff.snapshot import Snapshot, is_snapshot
+
+
+DIMENSIONS = ("source", "section", "repo", "platform", "python_tag",
+              "product", "name")
+BLOCK_DIMENSIONS = ("source", "section", "repo", "platform")
+RECORD_DIMENSIONS = ("python_tag", "product")
+
+INDEX_SECTION = "index"
+DIFF_SECTIONS = ("missing", "changed")
+# diff entries that hold a mapping but no eggs
+_DIFF_METADATA = ("dependencies", "unresolved", "manifest")
+
+GB = 1_000_000_000
+
+
+class SizeTable(object):
+    """ Columnar egg sizes, labelled by the given dimensions.
+
+    Labels are dictionary encoded: each dimension keeps its distinct labels
+    in order of first appearance and a column stores their positions.
+    """
+
+    def __init__(self, dimensions: Iterable[str] = DIMENSIONS):
+        dimensions = tuple(dimensions)
+        _check_dimensions(dimensions)
+        self.dimensions = dimensions
+        self.sizes = array("q")
+        self._columns = {dim: array("I") for dim in DIMENSIONS
+                         if dim in dimensions and dim not in BLOCK_DIMENSIONS}
+        self._labels = {dim: [] for dim in dimensions}
+        self._codes = {dim: {} for dim in dimensions}
+        # (start, stop, {dimension: code}) of each block of rows
+        self._blocks = []
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def add_eggs(self, eggs: Iterable[Tuple[str, Mapping]],
+                 **labels) -> None:
+        """ Append a block of (egg_name, metadata) pairs. labels gives the
+        source, section, repo and platform of the whole block."""
+        start = len(self.sizes)
+        sizes = self.sizes
+        columns = list(self._columns.items())
+        code = self._code
+        for key, egg in eggs:
+            size = egg.get("size")
+            sizes.append(size if isinstance(size, int) and size > 0 else 0)
+            for dim, column in columns:
+                if dim == "name":
+                    column.append(code(dim, egg_package_name(key)))
+                else:
+                    column.append(code(dim, egg.get(dim)))
+        self._add_block(start, labels)
+
+    def add_snapshot(self, snapshot: Snapshot, **labels) -> None:
+        """ Append the eggs of a snapshot from its size column, decoding its
+        keys and records only if they are grouped by."""
+        start = len(self.sizes)
+        sizes = array("q", memoryview(snapshot.sizes).tobytes())
+        if sizes and min(sizes) < 0:
+            sizes = array("q", (size if size > 0 else 0 for size in sizes))
+        self.sizes.extend(sizes)
+        count = len(snapshot)
+        code = self._code
+        if "name" in self._columns:
+            self._columns["name"].extend(
+                code("name", egg_package_name(snapshot.key(i)))
+                for i in range(count))
+        record_columns = [(dim, self._columns[dim])
+                          for dim in RECORD_DIMENSIONS
+                          if dim in self._columns]
+        if record_columns:
+            for i in range(count):
+                egg = snapshot.record(i)
+                for dim, column in record_columns:
+                    column.append(code(dim, egg.get(dim)))
+        self._add_block(start, labels)
+
+    def group(self, by: Sequence[str] = ()) -> List[Tuple[tuple, int, int]]:
+        """ (labels, eggs, bytes) of each group of eggs sharing their labels
+        for the dimensions by, in order of first appearance."""
+        by = tuple(by)
+        _check_dimensions(by)
+        unknown = [dim for dim in by if dim not in self.dimensions]
+        if unknown:
+            raise ValueError("Table has no {} dimension".format(
+                ", ".join(unknown)))
+        counts, totals = {}, {}
+        for start, stop, fixed in self._blocks:
+            sizes = self.sizes[start:stop]
+            if all(dim in fixed for dim in by):
+                key = tuple(fixed[dim] for dim in by)
+                counts[key] = counts.get(key, 0) + len(sizes)
+                totals[key] = totals.get(key, 0) + sum(sizes)
+                continue
+            columns = [repeat(fixed[dim]) if dim in fixed
+                       else self._columns[dim][start:stop] for dim in by]
+            for key, size in zip(zip(*columns), sizes):
+                if key in totals:
+                    counts[key] += 1
+                    totals[key] += size
+                else:
+                    counts[key] = 1
+                    totals[key] = size
+        return [(tuple(self._labels[dim][code] for dim, code in zip(by, key)),
+                 counts[key], totals[key])
+                for key in totals]
+
+    def _code(self, dim: str, label) -> int:
+        codes = self._codes[dim]
+        code = codes.get(label)
+        if code is None:
+            code = codes[label] = len(self._labels[dim])
+            self._labels[dim].append(label)
+        return code
+
+    def _add_block(self, start: int, labels: dict) -> None:
+        unknown = set(labels) - set(BLOCK_DIMENSIONS)
+        if unknown:
+            raise ValueError("Not a block dimension: {}".format(
+                ", ".join(sorted(unknown))))
+        stop = len(self.sizes)
+        if stop == start:
+            return
+        fixed = {dim: self._code(dim, labels.get(dim))
+                 for dim in BLOCK_DIMENSIONS if dim in self._labels}
+        self._blocks.append((start, stop, fixed))
+
+
+def _check_dimensions(dimensions: Sequence[str]) -> None:
+    unknown = [dim for dim in dimensions if dim not in DIMENSIONS]
+    if unknown:
+        raise ValueError("Unknown dimension {}, expected one of {}".format(
+            ", ".join(unknown), ", ".join(DIMENSIONS)))
+
+
+def egg_package_name(egg_name: str) -> str:
+    """ Package name of an egg, or the egg name if it is not of the
+    "<name>-<version>-<build>.egg" form."""
+    parts = split_egg_name(egg_name)
+    return egg_name if parts is None else parts[0]
+
+
+def add_path(table: SizeTable, path: str,
+             seen: Optional[Set[str]] = None) -> None:
+    """ Add the eggs of a json index, diff or snapshot file to table, with
+    path as their source.
+
+    A json file is read incrementally. The eggs of the "missing" and
+    "changed" sections of a diff are labelled with their section; the other
+    diff sections, and any entry that is not an egg record, are skipped.
+    The eggs of a qualified index or diff (see qualified.QualifiedIndex)
+    are labelled with their org/repo and platform.
+
+    If seen is given, eggs whose sha256 is in seen are skipped and the
+    others added to it. A snapshot is then read record by record.
+    """
+    if is_snapshot(path):
+        with Snapshot(path) as snapshot:
+            if seen is None:
+                table.add_snapshot(snapshot, source=path,
+                                   section=INDEX_SECTION)
+            else:
+                table.add_eggs(unique_eggs(snapshot.iter_items(), seen),
+                               source=path, section=INDEX_SECTION)
+        return
+
+    def eggs_of(eggs):
+        return eggs if seen is None else unique_eggs(eggs, seen)
+
+    sections = []
+
+    def index_eggs():
+        for key, value in iter_json_index(path):
+            if not isinstance(value, Mapping) or key in _DIFF_METADATA:
+                continue
+            if key in DIFF_SECTIONS:
+                sections.append((key, value))
+            elif "/" in key:
+                sections.append((INDEX_SECTION, {key: value}))
+            else:
+                yield key, value
+
+    table.add_eggs(eggs_of(index_eggs()), source=path,
+                   section=INDEX_SECTION)
+    for section, eggs in sections:
+        if is_qualified(eggs):
+            for (org_repo, plat, _), idx in iter_nested(eggs):
+                table.add_eggs(eggs_of(idx.items()), source=path,
+                               section=section, repo=org_repo, platform=plat)
+        else:
+            table.add_eggs(eggs_of(eggs.items()), source=path,
+                           section=section)
+
+
+def add_indices(table: SizeTable, indices: Mapping,
+                seen: Optional[Set[str]] = None) -> None:
+    """ Add fetched indices to table, keyed by (org/repo, platform,
+    python-tag) combination as fetch_indices returns them. seen is as for
+    add_path."""
+    for (org_repo, plat, ver), idx in indices.items():
+        eggs = idx.items() if seen is None else unique_eggs(idx.items(), seen)
+        table.add_eggs(eggs, source="/".join((org_repo, plat, ver)),
+                       section=INDEX_SECTION, repo=org_repo, platform=plat)
+
+
+def format_labels(labels: tuple, missing: str = "-") -> str:
+    """ Group labels joined for display, None shown as missing."""
+    return " / ".join(missing if label is None else str(label)
+                      for label in labels)
@@ -0,0 +1,256 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Binary index snapshots, loaded with mmap.
+
+A snapshot holds the same {egg_name: metadata} mapping as a json index, laid
+out so that opening it costs almost nothing and only the pages that are
+touched are read from disk:
+
+    header      magic, format version, egg count, heap offset
+    key table   count x (file offset, length) of each egg name in the heap,
+                sorted by the utf-8 encoded name
+    record table
+                count x (file offset, length) of each record's json
+    size        count x int64, -1 if the record has no size
+    mtime       count x float64, NaN if the record has no mtime
+    build       count x int64, -1 if the record has no build
+    sha256      count x 32 bytes, all zero if the record has no sha256
+    heap        egg names and compact json records
+
+All integers are little-endian and every section starts on an 8 byte
+boundary. Lookups binary search the key table and decode a single record;
+the fixed-width columns give direct access to sizes, mtimes, builds and
+digests without decoding any json.
+"""
+import json
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import ItemsView, Mapping
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+from brood_diff.records import to_json_default
+
+
+MAGIC = b"BRDSNAP\x00"
+FORMAT_VERSION = 1
+
+# magic, format version, reserved, egg count, heap offset, heap length
+HEADER = struct.Struct("<8sIIQQQ")
+HEADER_SIZE = 64
+
+DIGEST_SIZE = 32
+_NO_DIGEST = bytes(DIGEST_SIZE)
+
+
+def is_snapshot(path: str) -> bool:
+    """ Whether path is a snapshot file, judged by its magic bytes."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except IsADirectoryError:
+        return False
+
+
+def write_snapshot(index: Union[Mapping, Iterable[Tuple[str, dict]]],
+                   path: str) -> None:
+    """ Write an index, or an iterable of (egg_name, metadata) pairs, as a
+    snapshot. The file is written to a temporary name and renamed into
+    place."""
+    if isinstance(index, Mapping):
+        index = index.items()
+
+    entries = []
+    for key, egg in index:
+        record = json.dumps(egg, separators=(",", ":"),
+                            default=to_json_default).encode("utf-8")
+        entries.append((key.encode("utf-8"), record, _column_values(egg)))
+    entries.sort(key=lambda entry: entry[0])
+    count = len(entries)
+
+    key_table = array("Q")
+    record_table = array("Q")
+    sizes, mtimes, builds = array("q"), array("d"), array("q")
+    digests = bytearray()
+    heap_offset = HEADER_SIZE + count * (16 + 16 + 8 + 8 + 8 + DIGEST_SIZE)
+    heap_end = heap_offset
+    for key, record, (size, mtime, build, sha256) in entries:
+        key_table.extend((heap_end, len(key)))
+        heap_end += len(key)
+        record_table.extend((heap_end, len(record)))
+        heap_end += len(record)
+        sizes.append(size)
+        mtimes.append(mtime)
+        builds.append(build)
+        digests += sha256
+
+    heap_size = heap_end - heap_offset
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, count, heap_offset,
+                         heap_size)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header.ljust(HEADER_SIZE, b"\x00"))
+            for column in (key_table, record_table, sizes, mtimes, builds):
+                if sys.byteorder != "little":
+                    column.byteswap()
+                column.tofile(f)
+            f.write(digests)
+            for key, record, _ in entries:
+                f.write(key)
+                f.write(record)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _column_values(egg) -> Tuple[int, float, int, bytes]:
+    """ (size, mtime, build, sha256) column values for a record."""
+    size = egg.get("size")
+    mtime = egg.get("mtime")
+    build = egg.get("build")
+    sha256 = egg.get("sha256")
+    try:
+        digest = bytes.fromhex(sha256) if sha256 else _NO_DIGEST
+    except (TypeError, ValueError):
+        digest = _NO_DIGEST
+    return (size if isinstance(size, int) else -1,
+            float(mtime) if isinstance(mtime, (int, float)) else math.nan,
+            build if isinstance(build, int) else -1,
+            digest if len(digest) == DIGEST_SIZE else _NO_DIGEST)
+
+
+class Snapshot(Mapping):
+    """ Read-only, memory-mapped view of a snapshot file.
+
+    Behaves as a dict of egg name to metadata whose keys iterate in sorted
+    order. Records are decoded from the heap on access. The size, mtime and
+    build columns are exposed as sequences indexed like the sorted keys.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER_SIZE:
+                raise ValueError("Not a brood index snapshot: {}".format(path))
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count, heap_offset, heap_size = HEADER.unpack_from(
+            self._mmap)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError("Not a brood index snapshot: {}".format(path))
+        if version != FORMAT_VERSION:
+            self._mmap.close()
+            raise ValueError("Unsupported snapshot version {}: {}".format(
+                version, path))
+        self._count = count
+        view = memoryview(self._mmap)
+        offset = HEADER_SIZE
+
+        def section(width, fmt):
+            nonlocal offset
+            start, offset = offset, offset + count * width
+            return _column(view[start:offset], fmt)
+
+        self._keys = section(16, "Q")
+        self._records = section(16, "Q")
+        self.sizes = section(8, "q")
+        self.mtimes = section(8, "d")
+        self.builds = section(8, "q")
+        self._digests = view[offset:offset + count * DIGEST_SIZE]
+
+    def key(self, i: int) -> str:
+        """ Egg name at position i of the sorted key table."""
+        return self._key_bytes(i).decode("utf-8")
+
+    def record(self, i: int) -> dict:
+        """ Decoded metadata at position i of the sorted key table."""
+        offset, length = self._records[2 * i], self._records[2 * i + 1]
+        return json.loads(self._mmap[offset:offset + length].decode("utf-8"))
+
+    def sha256(self, i: int) -> Optional[bytes]:
+        """ sha256 digest at position i, or None if the record has none."""
+        digest = bytes(self._digests[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE])
+        return None if digest == _NO_DIGEST else digest
+
+    def find(self, key: str) -> int:
+        """ Position of key in the sorted key table, or -1."""
+        target = key.encode("utf-8")
+        lo, hi = 0, self._count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key_bytes(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self._count and self._key_bytes(lo) == target:
+            return lo
+        return -1
+
+    def _key_bytes(self, i: int) -> bytes:
+        offset, length = self._keys[2 * i], self._keys[2 * i + 1]
+        return self._mmap[offset:offset + length]
+
+    def __getitem__(self, key: str) -> dict:
+        i = self.find(key) if isinstance(key, str) else -1
+        if i < 0:
+            raise KeyError(key)
+        return self.record(i)
+
+    def __contains__(self, key) -> bool:
+        return isinstance(key, str) and self.find(key) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._count):
+            yield self.key(i)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def iter_items(self) -> Iterator[Tuple[str, dict]]:
+        """ (egg_name, metadata) pairs in sorted order."""
+        for i in range(self._count):
+            yield self.key(i), self.record(i)
+
+    def items(self) -> ItemsView:
+        """ Items view iterating sequentially rather than by lookup."""
+        return _SnapshotItems(self)
+
+    def close(self) -> None:
+        for name in ("_keys", "_records", "sizes", "mtimes", "builds",
+                     "_digests"):
+            column = getattr(self, name)
+            if isinstance(column, memoryview):
+                column.release()
+        self._mmap.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class _SnapshotItems(ItemsView):
+
+    def __iter__(self):
+        return self._mapping.iter_items()
+
+
+def _column(view: memoryview, fmt: str):
+    """ A sequence view of a little-endian column."""
+    if sys.byteorder == "little":
+        return view.cast(fmt)
+    column = array(fmt, view.tobytes())
+    column.byteswap()
+    return column
@@ -0,0 +1,190 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Stored sync state for incremental syncs.
+
+A sync-state directory keeps, for every org/repo, platform and python-tag,
+a snapshot of the remote index as of the last sync together with the
+ETag/Last-Modified validators it was fetched with:
+
+    <state-dir>/<org>/<repo>/<platform>/<python-tag>.snap
+    <state-dir>/<org>/<repo>/<platform>/<python-tag>.json
+
+The next sync only needs what changed since that snapshot. An index that
+still validates (304 Not Modified) has no changes at all, and a changed index
+is compared in full against the snapshot's sorted key table and digest/mtime
+columns without decoding the previous records.
+
+sync_index, the driver of the sync command, diffs and rolls forward a
+sync-state directory.
+"""
+import json
+import math
+import os
+from itertools import product
+from typing import Mapping, Optional, Tuple
+
+from brood_diff import profiling
+from brood_diff.cache import atomic_write
+from brood_diff.client import Client, DEFAULT_JOBS
+from brood_diff.indices import (
+    FetchError, fan_out, fetch_combo_since, index_diff, iter_index,
+    to_json_file
+)
+from brood_diff.records import compact_index
+from brood_diff.snapshot import Snapshot, write_snapshot
+
+
+SNAPSHOT_SUFFIX = ".snap"
+META_SUFFIX = ".json"
+
+
+class SyncState(object):
+    """ Per (org/repo, platform, python-tag) snapshots in state_dir."""
+
+    def __init__(self, state_dir: str):
+        self.state_dir = state_dir
+
+    def snapshot(self, combo: tuple) -> Optional[Snapshot]:
+        """ Snapshot of the last synced index, or None if never synced."""
+        path = self._path(combo) + SNAPSHOT_SUFFIX
+        if not os.path.exists(path):
+            return None
+        return Snapshot(path)
+
+    def validators(self, combo: tuple) -> dict:
+        """ Validators the last synced index was fetched with."""
+        if not os.path.exists(self._path(combo) + SNAPSHOT_SUFFIX):
+            return {}
+        try:
+            with open(self._path(combo) + META_SUFFIX) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def commit(self, combo: tuple, index: Mapping,
+               validators: Mapping) -> None:
+        """ Roll the state of combo forward to index.
+
+        The snapshot and then its validators are each replaced atomically,
+        so an interrupted commit leaves either the old state or a new
+        snapshot that the old validators will simply fail to revalidate.
+        """
+        path = self._path(combo)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        write_snapshot(index, path + SNAPSHOT_SUFFIX)
+        atomic_write(path + META_SUFFIX,
+                     json.dumps(dict(validators)).encode("utf-8"))
+
+    def _path(self, combo: tuple) -> str:
+        org_repo, plat, ver = combo
+        org, repo = org_repo.split("/")
+        return os.path.join(self.state_dir, org, repo, plat, ver)
+
+
+def snapshot_delta(previous: Optional[Snapshot], index: Mapping) -> dict:
+    """ Eggs of index that are new or changed since the previous snapshot.
+
+    Returns {"missing": {...}, "changed": {...}} in the same layout as
+    index_diff, an egg counting as changed if its sha256 or mtime differs
+    from the snapshot. The sorted keys of index are merge-joined against the
+    snapshot's sorted key table.
+
+    The cost is that of the whole index, not of the change: every egg of
+    index is compared, in O(n log n) for the sort and O(n + m) for the
+    join against the m rows of the snapshot, reading only its key table and
+    sha256/mtime columns. An EDS index carries no per-egg change marker, so
+    the eggs that changed cannot be found without looking at all of them;
+    the comparison is cheap next to fetching and decoding the index, which
+    is O(n) already. Only an index that validates (304) costs nothing.
+    """
+    if previous is None:
+        return {"missing": dict(index), "changed": {}}
+
+    missing, changed = {}, {}
+    i, n = 0, len(previous)
+    for key in sorted(index):
+        while i < n and previous.key(i) < key:
+            i += 1
+        egg = index[key]
+        if i < n and previous.key(i) == key:
+            if _snapshot_egg_changed(previous, i, egg):
+                changed[key] = egg
+        else:
+            missing[key] = egg
+    return {"missing": missing, "changed": changed}
+
+
+def _snapshot_egg_changed(previous: Snapshot, i: int, egg: Mapping) -> bool:
+    """ Whether egg differs in sha256 or mtime from row i of previous."""
+    sha256 = egg.get("sha256")
+    old_sha256 = previous.sha256(i)
+    if sha256 and old_sha256 is not None and sha256 != old_sha256.hex():
+        return True
+    mtime = egg.get("mtime")
+    old_mtime = previous.mtimes[i]
+    return (isinstance(mtime, (int, float)) and not math.isnan(old_mtime) and
+            float(mtime) != old_mtime)
+
+
+def sync_index(state_dir: str, org_repos: Tuple[str], plats: Tuple[str],
+               vers: Tuple[str], output: str,
+               local_idx_json: Optional[str] = None,
+               commit: bool = True,
+               legacy: bool = False,
+               remote_url: str = "https://packages.enthought.com",
+               jobs: int = DEFAULT_JOBS,
+               client: Optional[Client] = None) -> dict:
+    """ Incremental diff against the remote indices stored in state_dir.
+
+    Each org/repo/plat/ver index is fetched conditionally on the validators
+    stored with its last snapshot. A 304 means the index has no changes; a
+    changed index is compared against its snapshot (see
+    snapshot_delta). The eggs that are new or changed since the
+    last sync are written to output in the index_diff layout.
+
+    A combination that has never been synced is diffed in full against
+    local_idx_json if given, otherwise all of its eggs are new. If commit is
+    True each fetched combination's snapshot is then rolled forward.
+
+    Returns {(org_repo, plat, ver): "unchanged" | "updated" | "new"}.
+    Raises FetchError after writing and committing the other combinations if
+    any fetch failed.
+    """
+    state = SyncState(state_dir)
+    combos = list(product(org_repos, plats, vers))
+    fetched, failures = fan_out(combos, fetch_combo_since, jobs, client,
+                                url=remote_url, legacy=legacy, state=state)
+
+    local_idx = None
+    delta = {"missing": {}, "changed": {}}
+    status = {}
+    for combo, (idx, _) in fetched.items():
+        if idx is None:
+            status[combo] = "unchanged"
+            continue
+        previous = state.snapshot(combo)
+        if previous is None and local_idx_json is not None:
+            if local_idx is None:
+                with profiling.phase("load"):
+                    local_idx = compact_index(iter_index(local_idx_json))
+            with profiling.phase("diff"):
+                combo_delta = index_diff(local_idx, idx, detect_changed=True)
+        else:
+            with profiling.phase("diff"):
+                combo_delta = snapshot_delta(previous, idx)
+        if previous is not None:
+            previous.close()
+        status[combo] = "new" if previous is None else "updated"
+        delta["missing"].update(combo_delta["missing"])
+        delta["changed"].update(combo_delta["changed"])
+
+    to_json_file(delta, output, sort=True)
+    if commit:
+        for combo, (idx, validators) in fetched.items():
+            if idx is not None:
+                state.commit(combo, idx, validators)
+    if failures:
+        raise FetchError(failures)
+    return status
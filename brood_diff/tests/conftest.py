@@ -0,0 +1,13 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.server import IndexServer
+
+import pytest
+
+
+@pytest.fixture
+def index_server():
+    """ Local EDS stand-in; tests set index_server.indices[path] = index."""
+    with IndexServer() as server:
+        yield server
@@ -0,0 +1,130 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.batch import COMMON_MISSING, batch_diff, local_index_files
+from brood_diff.diff import cli, from_json_file, index_diff, to_json_file
+from brood_diff.snapshot import write_snapshot
+
+import os
+
+import pytest
+from click.testing import CliRunner
+
+ROUTE = "/api/v1/json/indices/enthought/free/rh6-x86_64/cp36/eggs"
+
+
+def egg(name, sha="a"):
+    return {"name": name, "size": 10, "mtime": 1.0, "sha256": sha * 64}
+
+
+REMOTE = {"{}-1.0-1.egg".format(name): egg(name) for name in "abcdef"}
+
+
+def write_customers(directory):
+    """ Write three customer indices, each missing "f-1.0-1.egg"."""
+    os.makedirs(str(directory))
+    customers = {
+        "acme": {key: REMOTE[key] for key in ("a-1.0-1.egg", "b-1.0-1.egg")},
+        "globex": {key: REMOTE[key] for key in ("c-1.0-1.egg",
+                                                "d-1.0-1.egg")},
+        "initech": dict(REMOTE, **{"a-1.0-1.egg": egg("a", sha="b")})}
+    del customers["initech"]["f-1.0-1.egg"]
+    to_json_file(customers["acme"], str(directory / "acme.json"))
+    to_json_file(customers["globex"], str(directory / "globex.json.gz"))
+    write_snapshot(customers["initech"], str(directory / "initech.snap"))
+    return customers
+
+
+class TestBatchDiff(object):
+
+    @pytest.mark.parametrize("processes", [1, 2])
+    def test_batch_diff(self, tmp_path, processes):
+        # given
+        customers = write_customers(tmp_path / "local")
+        remote = str(tmp_path / "remote.json")
+        to_json_file(REMOTE, remote)
+        output_dir = str(tmp_path / "out")
+
+        # when
+        report = batch_diff(local_index_files(str(tmp_path / "local")),
+                            remote, output_dir, processes=processes,
+                            detect_changed=True)
+
+        # then
+        for name, local in customers.items():
+            expected = index_diff(local, REMOTE, detect_changed=True)
+            diff = from_json_file(os.path.join(output_dir, name + ".json"))
+            assert diff == expected
+            assert report["customers"][name] == {
+                "missing": len(expected["missing"]),
+                "changed": len(expected["changed"])}
+        assert report["failures"] == {}
+        assert report["common_missing"] == 1
+        assert from_json_file(os.path.join(output_dir, COMMON_MISSING)) == {
+            "missing": {"f-1.0-1.egg": REMOTE["f-1.0-1.egg"]}}
+
+    def test_unreadable_customer(self, tmp_path):
+        # given
+        write_customers(tmp_path / "local")
+        with open(str(tmp_path / "local" / "broken.json"), "w") as f:
+            f.write('{"a-1.0-1.egg": ')
+        output_dir = str(tmp_path / "out")
+
+        # when
+        report = batch_diff(local_index_files(str(tmp_path / "local")),
+                            REMOTE, output_dir)
+
+        # then
+        assert list(report["failures"]) == ["broken"]
+        assert sorted(report["customers"]) == ["acme", "globex", "initech"]
+        assert report["common_missing"] == 1
+
+    def test_duplicate_customer_names(self, tmp_path):
+        # given
+        write_customers(tmp_path / "local")
+        to_json_file({}, str(tmp_path / "local" / "acme.json.xz"))
+
+        # when
+        with pytest.raises(ValueError) as execinfo:
+            local_index_files(str(tmp_path / "local"))
+
+        # then
+        assert "acme" in str(execinfo.value)
+
+    def test_cli_fetches_remote_once(self, tmp_path, index_server):
+        # given
+        write_customers(tmp_path / "local")
+        index_server.indices[ROUTE] = REMOTE
+        output_dir = str(tmp_path / "out")
+
+        # when
+        result = CliRunner().invoke(cli, [
+            "batch-diff", "-d", str(tmp_path / "local"), "-o", output_dir,
+            "-u", index_server.url, "-r", "enthought/free",
+            "-p", "rh6-x86_64", "-v", "cp36", "-P", "2", "--no-cache"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        assert "acme: 4 missing" in result.output
+        assert "1 eggs missing for every customer" in result.output
+        assert len(index_server.requests) == 1
+        assert sorted(os.listdir(output_dir)) == [
+            "acme.json", COMMON_MISSING, "globex.json", "initech.json"]
+
+    def test_cli_remote_options(self, tmp_path):
+        # given
+        write_customers(tmp_path / "local")
+        local_dir = str(tmp_path / "local")
+
+        # when
+        neither = CliRunner().invoke(cli, [
+            "batch-diff", "-d", local_dir, "-o", str(tmp_path / "out")])
+        same_dir = CliRunner().invoke(cli, [
+            "batch-diff", "-d", local_dir, "-o", local_dir,
+            "-R", str(tmp_path / "local" / "acme.json")])
+
+        # then
+        assert neither.exit_code != 0
+        assert "-R" in neither.output
+        assert same_dir.exit_code != 0
+        assert "must differ" in same_dir.output
@@ -0,0 +1,95 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.cache import IndexCache
+
+import os
+import time
+
+V1 = "https://eds/api/v1/json/indices/enthought/free/rh6-x86_64/cp36/eggs"
+V0 = "https://eds/api/v0/json/indices/enthought/free/rh6-x86_64/cp36/eggs"
+
+
+class TestIndexCache(object):
+    """ Test the on-disk index cache."""
+
+    def test_store_and_load(self, tmpdir):
+        # given
+        cache = IndexCache(str(tmpdir))
+
+        # when
+        cache.store(V1, b"{}", {"ETag": '"abc"',
+                                "Last-Modified": "Mon, 01 Jan 2018"})
+
+        # then
+        assert cache.load(V1) == b"{}"
+        assert cache.conditional_headers(V1) == {
+            "If-None-Match": '"abc"',
+            "If-Modified-Since": "Mon, 01 Jan 2018"}
+        assert cache.load(V0) is None
+        assert cache.conditional_headers(V0) == {}
+
+    def test_without_validators_not_stored(self, tmpdir):
+        # given
+        cache = IndexCache(str(tmpdir))
+
+        # when
+        cache.store(V1, b"{}", {})
+
+        # then
+        assert cache.load(V1) is None
+
+    def test_legacy_route_cached_separately(self, tmpdir):
+        # given
+        cache = IndexCache(str(tmpdir))
+
+        # when
+        cache.store(V1, b'{"v": 1}', {"ETag": '"1"'})
+        cache.store(V0, b'{"v": 0}', {"ETag": '"0"'})
+
+        # then
+        assert sorted(os.listdir(str(tmpdir))) == ["v0", "v1"]
+        assert cache.load(V1) == b'{"v": 1}'
+        assert cache.load(V0) == b'{"v": 0}'
+
+    def test_lru_eviction(self, tmpdir):
+        # given
+        body = b"x" * 1000
+        cache = IndexCache(str(tmpdir), max_size=2500)
+        urls = [V1.replace("cp36", ver) for ver in ("cp27", "cp35", "cp36")]
+
+        # when
+        cache.store(urls[0], body, {"ETag": '"0"'})
+        time.sleep(0.01)
+        cache.store(urls[1], body, {"ETag": '"1"'})
+        time.sleep(0.01)
+        cache.load(urls[0])  # most recently used
+        time.sleep(0.01)
+        cache.store(urls[2], body, {"ETag": '"2"'})
+
+        # then
+        assert cache.load(urls[0]) == body
+        assert cache.load(urls[1]) is None
+        assert cache.load(urls[2]) == body
+
+    def test_walks_only_when_full(self, tmpdir, monkeypatch):
+        # given
+        walks = []
+        walk = os.walk
+        monkeypatch.setattr(os, "walk",
+                            lambda top: walks.append(top) or walk(top))
+        cache = IndexCache(str(tmpdir), max_size=2500)
+        urls = [V1.replace("cp36", ver) for ver in ("cp27", "cp35", "cp36")]
+
+        # when
+        cache.store(urls[0], b"x" * 1000, {"ETag": '"0"'})
+        cache.store(urls[0], b"x" * 1000, {"ETag": '"1"'})
+        cache.store(urls[1], b"x" * 1000, {"ETag": '"0"'})
+        before_full = len(walks)
+        cache.store(urls[2], b"x" * 1000, {"ETag": '"0"'})
+
+        # then
+        assert before_full == 1
+        assert len(walks) == 2
+        assert cache._size <= 2500
+        assert sum(cache.load(url) is not None for url in urls) == 2
@@ -113,3 +113,19 @@ class TestValidation(object):
         # then
         assert g_repo == good_repo
         assert "Invalid repository" in str(execinfo.value)
+
+    def test_validate_size(self):
+        # given
+        ctx = None
+        param = None
+
+        # when
+        sizes = [valid.validate_size(ctx, param, value)
+                 for value in ("4GB", "512MiB", "1.5 kb", "100")]
+
+        with pytest.raises(click.BadParameter) as execinfo:
+            valid.validate_size(ctx, param, "4 parsecs")
+
+        # then
+        assert sizes == [4_000_000_000, 512 * 2 ** 20, 1500, 100]
+        assert "Invalid size" in str(execinfo.value)
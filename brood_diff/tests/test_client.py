@@ -0,0 +1,107 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.cache import IndexCache
+from brood_diff.client import Client
+from brood_diff.diff import get_index
+
+import pytest
+import requests
+
+
+INDEX = {"egg-1.0-1.egg": {"size": 1}}
+
+
+class TestClient(object):
+    """ Test the pooled client against a local EDS stand-in."""
+
+    def test_retries_transient_errors(self, index_server):
+        # given
+        index_server.add_index("enthought/free", "rh6-x86_64", "cp36", INDEX)
+        index_server.queued_errors.extend([503, 429, 502])
+        client = Client(retries=3, backoff=0.001)
+
+        # when
+        with client:
+            idx = get_index(index_server.url, "enthought", "free",
+                            "rh6-x86_64", "cp36", client=client)
+
+        # then
+        assert idx == INDEX
+        assert index_server.statuses == [503, 429, 502, 200]
+
+    def test_retries_exhausted_raises(self, index_server):
+        # given
+        index_server.add_index("enthought/free", "rh6-x86_64", "cp36", INDEX)
+        index_server.queued_errors.extend([503] * 3)
+        client = Client(retries=2, backoff=0.001)
+
+        # when
+        with client:
+            with pytest.raises(requests.HTTPError) as execinfo:
+                get_index(index_server.url, "enthought", "free",
+                          "rh6-x86_64", "cp36", client=client)
+
+        # then
+        assert "503" in str(execinfo.value)
+        assert index_server.statuses == [503] * 3
+
+    def test_client_error_not_retried(self, index_server):
+        # given
+        index_server.add_index("enthought/free", "rh6-x86_64", "cp36", INDEX)
+        client = Client(retries=3, backoff=0.001)
+
+        # when
+        with client:
+            with pytest.raises(requests.HTTPError):
+                get_index(index_server.url, "entought", "free",
+                          "rh6-x86_64", "cp36", client=client)
+
+        # then
+        assert index_server.statuses == [404]
+
+    def test_connections_kept_alive(self, index_server):
+        # given
+        for ver in ("cp27", "cp35", "cp36"):
+            index_server.add_index("enthought/free", "rh6-x86_64", ver,
+                                   INDEX)
+        client = Client(pool_size=1)
+
+        # when
+        with client:
+            for ver in ("cp27", "cp35", "cp36"):
+                get_index(index_server.url, "enthought", "free",
+                          "rh6-x86_64", ver, client=client)
+
+        # then
+        assert len(index_server.requests) == 3
+        assert len(index_server.peers) == 1
+
+    def test_conditional_request_served_from_cache(self, index_server,
+                                                   tmpdir):
+        # given
+        index_server.add_index("enthought/free", "rh6-x86_64", "cp36", INDEX)
+        client = Client(cache=IndexCache(str(tmpdir)))
+
+        # when
+        with client:
+            first = get_index(index_server.url, "enthought", "free",
+                              "rh6-x86_64", "cp36", client=client)
+            second = get_index(index_server.url, "enthought", "free",
+                               "rh6-x86_64", "cp36", client=client)
+
+        # then
+        assert first == second == INDEX
+        assert index_server.statuses == [200, 304]
+
+    def test_backoff_delay_bounds(self):
+        # given
+        client = Client(backoff=1.0, backoff_max=5.0)
+
+        # when
+        delays = [client.backoff_delay(attempt)
+                  for attempt in range(10) for _ in range(20)]
+
+        # then
+        assert all(0 <= delay <= 5.0 for delay in delays)
+        assert len(set(delays)) > 1
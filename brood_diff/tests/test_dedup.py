@@ -0,0 +1,147 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.dedup import ContentIndex, unique_diff
+from brood_diff.diff import cli, from_json_file, to_json_file
+from brood_diff.qualified import QualifiedIndex
+from brood_diff.utils import get_sizes
+
+import os
+
+from click.testing import CliRunner
+
+RH6 = ("enthought/free", "rh6-x86_64", "cp36")
+OSX = ("enthought/free", "osx-x86_64", "cp36")
+WIN = ("enthought/free", "win-x86_64", "cp36")
+
+
+def egg(name, sha="a", size=10):
+    return {"name": name, "size": size, "mtime": 1.0, "sha256": sha * 64,
+            "python_tag": "cp36"}
+
+
+def qualified_diff():
+    """ A diff with a noarch egg listed under three platforms, and an egg
+    built for each platform under the same name."""
+    noarch = egg("six", sha="6", size=100)
+    return {"missing": QualifiedIndex({
+        RH6: {"six-1.0-1.egg": noarch, "a-1.0-1.egg": egg("a", sha="1")},
+        OSX: {"six-1.0-1.egg": noarch, "a-1.0-1.egg": egg("a", sha="2")},
+        WIN: {"six-1.0-1.egg": dict(noarch),
+              "b-1.0-1.egg": dict(egg("b"), sha256=None)}})}
+
+
+class TestContentIndex(object):
+
+    def test_qualified_diff(self):
+        # when
+        content = ContentIndex.from_diff(qualified_diff())
+
+        # then
+        assert content.locations["6" * 64] == [
+            RH6 + ("six-1.0-1.egg",), OSX + ("six-1.0-1.egg",),
+            WIN + ("six-1.0-1.egg",)]
+        assert list(content.duplicates()) == [
+            ("6" * 64, content.locations["6" * 64])]
+        assert content.summary() == {
+            "locations": 6, "blobs": 4, "undigested": 1,
+            "logical_bytes": 330, "unique_bytes": 130, "saved_bytes": 200}
+
+    def test_flat_diff(self):
+        # given
+        diff = {"missing": {"a-1.0-1.egg": egg("a"),
+                            "a-1.0-1.egg.bak": egg("a")},
+                "changed": {"b-1.0-1.egg": egg("b", sha="b")},
+                "dependencies": {"a-1.0-1.egg": []}}
+
+        # when
+        content = ContentIndex.from_diff(diff)
+        unique = unique_diff(diff)
+
+        # then
+        assert content.locations["a" * 64] == [
+            (None, None, "cp36", "a-1.0-1.egg"),
+            (None, None, "cp36", "a-1.0-1.egg.bak")]
+        assert unique == {"missing": {"a-1.0-1.egg": egg("a")},
+                          "changed": diff["changed"],
+                          "dependencies": diff["dependencies"]}
+
+    def test_unique_diff_sizes(self, tmp_path):
+        # given
+        diff = qualified_diff()
+        path = str(tmp_path / "diff.json")
+        unique_path = str(tmp_path / "unique.json")
+        to_json_file(diff, path)
+
+        # when
+        to_json_file(unique_diff(diff), unique_path)
+        logical = get_sizes(("platform",), (path,))
+        dedup = get_sizes(("platform",), (path,), dedup=True)
+        unique = get_sizes(("platform",), (unique_path,))
+
+        # then
+        assert logical == [(("rh6-x86_64",), 2, 110),
+                           (("osx-x86_64",), 2, 110),
+                           (("win-x86_64",), 2, 110)]
+        assert dedup == [(("rh6-x86_64",), 2, 110),
+                         (("osx-x86_64",), 1, 10),
+                         (("win-x86_64",), 1, 10)]
+        assert unique == dedup
+
+
+class TestDedupDiffCli(object):
+
+    def test_qualified(self, tmp_path):
+        # given
+        path = str(tmp_path / "diff.json")
+        output = str(tmp_path / "content.json")
+        unique = str(tmp_path / "unique.json")
+        to_json_file(qualified_diff(), path)
+        runner = CliRunner()
+
+        # when
+        result = runner.invoke(cli, [
+            "dedup-diff", "-d", path, "-o", output, "--unique", unique])
+        sharded = runner.invoke(cli, [
+            "dedup-diff", "-d", path, "-o", output, "--unique",
+            str(tmp_path / "sharded.json"), "--shard-size", "100"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        assert "6 eggs in 4 unique blobs" in result.output
+        content = from_json_file(output)
+        assert content["summary"]["saved_bytes"] == 200
+        assert content["blobs"]["6" * 64]["locations"] == [
+            list(combo) + ["six-1.0-1.egg"] for combo in (RH6, OSX, WIN)]
+        assert content["undigested"] == [{
+            "egg": dict(egg("b"), sha256=None),
+            "location": list(WIN) + ["b-1.0-1.egg"]}]
+        missing = from_json_file(unique)["missing"]["enthought/free"]
+        assert sorted(missing["osx-x86_64"]["cp36"]) == ["a-1.0-1.egg"]
+        assert sharded.exit_code == 0, sharded.output
+        manifest = from_json_file(str(tmp_path / "sharded.json"))
+        assert (manifest["eggs"], manifest["bytes"]) == (4, 130)
+        first = from_json_file(str(tmp_path / "sharded-001.json"))
+        assert first["missing"]["enthought/free"]["rh6-x86_64"]["cp36"]
+
+    def test_flat_shards(self, tmp_path):
+        # given
+        path = str(tmp_path / "diff.json")
+        diff = {"missing": {"a-1.0-1.egg": egg("a", size=600),
+                            "a-copy-1.0-1.egg": egg("a", size=600),
+                            "b-1.0-1.egg": egg("b", sha="b", size=300)}}
+        to_json_file(diff, path)
+        unique = str(tmp_path / "unique.json")
+
+        # when
+        result = CliRunner().invoke(cli, [
+            "dedup-diff", "-d", path, "-o", str(tmp_path / "content.json"),
+            "--unique", unique, "--shard-size", "1000"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        manifest = from_json_file(unique)
+        assert manifest["eggs"] == 2
+        assert manifest["bytes"] == 900
+        assert len(manifest["shards"]) == 1
+        assert os.path.exists(str(tmp_path / "unique-001.json"))
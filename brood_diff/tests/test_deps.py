@@ -0,0 +1,114 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.deps import (
+    DependencyIndex, add_dependencies, local_provides, parse_requirement
+)
+from brood_diff.diff import cli, from_json_file, index_diff
+
+import os
+
+from click.testing import CliRunner
+
+
+def egg(name, version, build=1, packages=(), python_tag="cp36"):
+    return {"name": name, "version": version, "build": build,
+            "full_version": "{}-{}".format(version, build),
+            "python_tag": python_tag, "packages": list(packages)}
+
+
+def egg_key(record):
+    return "{}-{}.egg".format(record["name"], record["full_version"])
+
+
+def make_index(*records):
+    return {egg_key(record): record for record in records}
+
+
+class TestDependencyIndex(object):
+
+    def test_resolve_prefers_python_tag_then_build(self):
+        # given
+        idx = make_index(egg("six", "1.10.0", 1),
+                         egg("six", "1.10.0", 2, python_tag="cp27"),
+                         egg("six", "1.10.0", 3, python_tag="cp27"))
+
+        # when
+        dep_index = DependencyIndex(idx)
+
+        # then
+        assert dep_index.resolve("six 1.10.0", "cp36") == "six-1.10.0-1.egg"
+        assert dep_index.resolve("six 1.10.0", "cp27") == "six-1.10.0-3.egg"
+        assert dep_index.resolve("Six 1.10.0-1", "cp36") == "six-1.10.0-1.egg"
+        assert dep_index.resolve("six 1.11.0", "cp36") is None
+
+    def test_local_provides(self):
+        # when
+        provides = local_provides(["six-1.10.0-1.egg", "not-an-egg"])
+
+        # then
+        assert parse_requirement("six 1.10.0") in provides
+        assert parse_requirement("six 1.10.0-1") in provides
+        assert parse_requirement("six") in provides
+        assert parse_requirement("six 1.11.0") not in provides
+
+
+class TestDependencyClosure(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_closure_of_subset(self):
+        # given
+        remote_idx = make_index(egg("app", "1.0", packages=["lib 2.0"]),
+                                egg("lib", "2.0", packages=["base 3.0",
+                                                            "six 1.10.0"]),
+                                egg("base", "3.0", packages=["gone 0.1"]),
+                                egg("six", "1.10.0"))
+        diff = {"missing": {"app-1.0-1.egg": remote_idx["app-1.0-1.egg"]}}
+
+        # when
+        add_dependencies(diff, remote_idx, ["six-1.10.0-2.egg"])
+
+        # then
+        assert set(diff["missing"]) == {"app-1.0-1.egg", "lib-2.0-1.egg",
+                                        "base-3.0-1.egg"}
+        assert diff["dependencies"] == {"app-1.0-1.egg": ["lib-2.0-1.egg"],
+                                        "lib-2.0-1.egg": ["base-3.0-1.egg"]}
+        assert diff["unresolved"] == {"base-3.0-1.egg": ["gone 0.1"]}
+
+    def test_cycle_terminates(self):
+        # given
+        remote_idx = make_index(egg("a", "1", packages=["b 1"]),
+                                egg("b", "1", packages=["a 1"]))
+        diff = {"missing": {"a-1-1.egg": remote_idx["a-1-1.egg"]}}
+
+        # when
+        add_dependencies(diff, remote_idx, [])
+
+        # then
+        assert set(diff["missing"]) == {"a-1-1.egg", "b-1-1.egg"}
+        assert diff["dependencies"]["b-1-1.egg"] == ["a-1-1.egg"]
+
+    def test_gen_diff_with_deps(self, tmp_path):
+        # given
+        local = os.path.join(self.test_data, "idx-e-gpl-rh6-36-edit.json")
+        remote = os.path.join(self.test_data, "idx-e-gpl-rh6-36.json")
+        output = str(tmp_path / "diff.json")
+
+        # when
+        result = CliRunner().invoke(cli, ["gen-diff", "-l", local,
+                                          "-r", remote, "-o", output,
+                                          "--with-deps"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        diff = from_json_file(output)
+        expected = index_diff(from_json_file(local), from_json_file(remote))
+        assert diff["missing"] == expected["missing"]
+        for key, deps in diff["dependencies"].items():
+            assert key in diff["missing"]
+            assert set(deps) <= set(diff["missing"])
+        assert isinstance(diff["unresolved"], dict)
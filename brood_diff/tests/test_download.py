@@ -0,0 +1,211 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import cli, from_json_file, full_diff, to_json_file
+from brood_diff.download import (
+    ChecksumError, UnknownLocation, fetch_missing
+)
+from brood_diff.server import IndexServer
+
+import hashlib
+import os
+import random
+
+import pytest
+from click.testing import CliRunner
+
+COMBO = ("enthought/free", "rh6-x86_64", "cp36")
+
+
+def make_eggs(server, count=3, size=300 * 1024):
+    """ Serve count eggs of random bytes, returning the diff listing them."""
+    rng = random.Random(0)
+    missing = {}
+    bodies = {}
+    for i in range(count):
+        name = "egg{}-1.0-1.egg".format(i)
+        body = bytes(rng.getrandbits(8) for _ in range(size + i))
+        server.add_egg(*COMBO, name, body)
+        bodies[name] = body
+        missing[name] = {"size": len(body),
+                         "sha256": hashlib.sha256(body).hexdigest()}
+    return {"missing": missing, "changed": {}}, bodies
+
+
+class TestFetchMissing(object):
+
+    def fetch(self, server, diff, tmp_path):
+        diff_path = str(tmp_path / "diff.json")
+        to_json_file(diff, diff_path)
+        return fetch_missing(diff_path, str(tmp_path / "eggs"), server.url,
+                             *COMBO, jobs=2)
+
+    def test_download_and_skip(self, tmp_path):
+        with IndexServer() as server:
+            # given
+            diff, bodies = make_eggs(server)
+
+            # when
+            first = self.fetch(server, diff, tmp_path)
+            requests = len(server.requests)
+            second = self.fetch(server, diff, tmp_path)
+
+        # then
+        assert sorted(first["downloaded"]) == sorted(bodies)
+        assert first["bytes"] == sum(len(body) for body in bodies.values())
+        assert first["throughput"] > 0
+        for name, body in bodies.items():
+            with open(str(tmp_path / "eggs" / name), "rb") as f:
+                assert f.read() == body
+        assert sorted(second["present"]) == sorted(bodies)
+        assert len(server.requests) == requests
+
+    def test_resume(self, tmp_path):
+        with IndexServer() as server:
+            # given
+            diff, bodies = make_eggs(server, count=1)
+            [(name, body)] = bodies.items()
+            os.makedirs(str(tmp_path / "eggs"))
+            with open(str(tmp_path / "eggs" / (name + ".part")), "wb") as f:
+                f.write(body[:1000])
+
+            # when
+            summary = self.fetch(server, diff, tmp_path)
+
+        # then
+        assert summary["resumed"] == [name]
+        assert summary["bytes"] == len(body) - 1000
+        assert server.statuses == [206]
+        with open(str(tmp_path / "eggs" / name), "rb") as f:
+            assert f.read() == body
+
+    def test_no_range_support(self, tmp_path):
+        with IndexServer(ranges=False) as server:
+            # given
+            diff, bodies = make_eggs(server, count=1)
+            [(name, body)] = bodies.items()
+            os.makedirs(str(tmp_path / "eggs"))
+            with open(str(tmp_path / "eggs" / (name + ".part")), "wb") as f:
+                f.write(b"x" * 1000)
+
+            # when
+            summary = self.fetch(server, diff, tmp_path)
+
+        # then
+        assert summary["downloaded"] == [name]
+        assert server.statuses == [200]
+        with open(str(tmp_path / "eggs" / name), "rb") as f:
+            assert f.read() == body
+
+    def test_checksum_mismatch(self, tmp_path):
+        with IndexServer() as server:
+            # given
+            diff, bodies = make_eggs(server, count=1)
+            [name] = bodies
+            diff["missing"][name]["sha256"] = "0" * 64
+
+            # when
+            summary = self.fetch(server, diff, tmp_path)
+
+        # then
+        assert isinstance(summary["failures"][name], ChecksumError)
+        assert os.listdir(str(tmp_path / "eggs")) == []
+
+    def test_cli(self, tmp_path):
+        with IndexServer() as server:
+            # given
+            diff, bodies = make_eggs(server, count=2)
+            diff["missing"]["gone-1.0-1.egg"] = {"size": 1}
+            diff_path = str(tmp_path / "diff.json")
+            to_json_file(diff, diff_path)
+
+            # when
+            result = CliRunner().invoke(cli, [
+                "fetch-missing", "-d", diff_path, "-o", str(tmp_path),
+                "-u", server.url, "-r", COMBO[0], "-p", COMBO[1],
+                "-v", COMBO[2], "--retries", "0"])
+
+        # then
+        assert result.exit_code != 0
+        assert "Downloaded 2 eggs (0 resumed)" in result.output
+        assert "MB/s" in result.output
+        assert "gone-1.0-1.egg" in result.output
+        assert sorted(bodies) == sorted(
+            name for name in os.listdir(str(tmp_path))
+            if name.endswith(".egg"))
+
+
+class TestFetchQualified(object):
+
+    def serve(self, server):
+        """ Serve a noarch egg under two platforms and an egg of the same
+        name built for each, returning the bodies by location."""
+        bodies = {}
+        for plat in ("rh6-x86_64", "win-x86_64"):
+            combo = ("enthought/free", plat, "cp36")
+            index = {}
+            for name, body in (("six-1.0-1.egg", b"six" * 1000),
+                               ("a-1.0-1.egg", plat.encode() * 1000)):
+                server.add_egg(*combo, name, body)
+                bodies[combo + (name,)] = body
+                index[name] = {"name": name.split("-")[0], "size": len(body),
+                               "sha256": hashlib.sha256(body).hexdigest(),
+                               "mtime": 1.0, "python_tag": "cp36"}
+            server.add_index(*combo, index)
+        return bodies
+
+    def test_unique_qualified_diff(self, index_server, tmp_path):
+        # given
+        bodies = self.serve(index_server)
+        local = str(tmp_path / "local.json")
+        diff = str(tmp_path / "diff.json")
+        unique = str(tmp_path / "unique.json")
+        eggs = tmp_path / "eggs"
+        to_json_file({}, local)
+        full_diff(local, ("enthought/free",), ("rh6-x86_64", "win-x86_64"),
+                  ("cp36",), diff, remote_url=index_server.url,
+                  qualified=True)
+        runner = CliRunner()
+
+        # when
+        dedup = runner.invoke(cli, [
+            "dedup-diff", "-d", diff, "-o", str(tmp_path / "content.json"),
+            "--unique", unique, "--shard-size", "13000"])
+        fetched = [runner.invoke(cli, [
+            "fetch-missing", "-d", str(tmp_path / shard["path"]), "-o",
+            str(eggs), "-u", index_server.url])
+            for shard in from_json_file(unique)["shards"]]
+
+        # then
+        assert dedup.exit_code == 0, dedup.output
+        assert len(fetched) == 2
+        for result in fetched:
+            assert result.exit_code == 0, result.output
+        paths = sorted(os.path.relpath(os.path.join(root, name), str(eggs))
+                       for root, _, names in os.walk(str(eggs))
+                       for name in names)
+        assert paths == [
+            os.path.join("enthought", "free", "rh6-x86_64", "cp36", name)
+            for name in ("a-1.0-1.egg", "six-1.0-1.egg")] + [
+            os.path.join("enthought", "free", "win-x86_64", "cp36",
+                         "a-1.0-1.egg")]
+        for path in paths:
+            *_, plat, ver, name = path.split(os.sep)
+            with open(str(eggs / path), "rb") as f:
+                assert f.read() == bodies[("enthought/free", plat, ver, name)]
+
+    def test_flat_diff_needs_location(self, tmp_path):
+        # given
+        diff_path = str(tmp_path / "diff.json")
+        to_json_file({"missing": {"a-1.0-1.egg": {"size": 1}}}, diff_path)
+
+        # when
+        with pytest.raises(UnknownLocation):
+            fetch_missing(diff_path, str(tmp_path), "http://127.0.0.1",
+                          None, None, None)
+        result = CliRunner().invoke(cli, [
+            "fetch-missing", "-d", diff_path, "-o", str(tmp_path)])
+
+        # then
+        assert result.exit_code != 0
+        assert "-r, -p and -v" in result.output
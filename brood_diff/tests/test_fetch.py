@@ -0,0 +1,82 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import (
+    FetchError, fetch_indices, from_json_file, gen_full_index, merge_indices
+)
+
+from itertools import product
+import random
+import tempfile
+import time
+
+import pytest
+
+
+def fake_get_index(url, org, repo, plat, pyver, legacy=False, client=None):
+    """ Stand-in for get_index returning overlapping indices."""
+    time.sleep(random.uniform(0, 0.01))
+    if repo == "broken":
+        raise ValueError("boom")
+    return {
+        "shared-1.0-1.egg": {"repo": repo, "plat": plat, "ver": pyver},
+        "{}-{}-{}.egg".format(repo, plat, pyver): {"size": 1},
+    }
+
+
+class TestFetchIndices(object):
+    """ Test the concurrent index fan-out."""
+
+    ORG_REPOS = ("enthought/free", "enthought/gpl", "enthought/lgpl")
+    PLATS = ("rh6-x86_64", "osx-x86_64", "win-x86_64")
+    VERS = ("cp27", "cp35", "cp36")
+
+    def test_matches_sequential(self, monkeypatch):
+        # given
+        monkeypatch.setattr("brood_diff.indices.get_index", fake_get_index)
+        sequential = {}
+        for org_repo, plat, ver in product(self.ORG_REPOS, self.PLATS,
+                                           self.VERS):
+            org, repo = org_repo.split("/")
+            sequential.update(fake_get_index("url", org, repo, plat, ver))
+
+        # when
+        indices, failures = fetch_indices("url", self.ORG_REPOS, self.PLATS,
+                                          self.VERS, jobs=8)
+        merged = merge_indices(indices)
+
+        # then
+        assert not failures
+        assert merged == sequential
+        assert list(merged) == list(sequential)
+        assert merged["shared-1.0-1.egg"]["repo"] == "lgpl"
+
+    def test_failure_keeps_rest_of_fan_out(self, monkeypatch):
+        # given
+        monkeypatch.setattr("brood_diff.indices.get_index", fake_get_index)
+        org_repos = ("enthought/free", "enthought/broken")
+
+        # when
+        indices, failures = fetch_indices("url", org_repos, self.PLATS,
+                                          self.VERS, jobs=4)
+
+        # then
+        assert len(indices) == len(self.PLATS) * len(self.VERS)
+        assert len(failures) == len(self.PLATS) * len(self.VERS)
+        assert all(combo[0] == "enthought/broken" for combo in failures)
+
+    def test_gen_full_index_reports_failures(self, monkeypatch):
+        # given
+        monkeypatch.setattr("brood_diff.indices.get_index", fake_get_index)
+        org_repos = ("enthought/free", "enthought/broken")
+        _, out_path = tempfile.mkstemp(suffix=".json")
+
+        # when
+        with pytest.raises(FetchError) as execinfo:
+            gen_full_index("url", org_repos, ("rh6-x86_64",), ("cp36",),
+                           out_path, jobs=2)
+        idx = from_json_file(out_path)
+
+        # then
+        assert "enthought/broken rh6-x86_64 cp36" in str(execinfo.value)
+        assert "free-rh6-x86_64-cp36.egg" in idx
@@ -1,7 +1,9 @@
 # (C) Copyright 2018 Enthought, Inc., Austin, TX
 # All rights reserved.
 #
-from brood_diff.diff import get_index, index_diff, from_json_file
+from brood_diff.diff import (
+    egg_changed, egg_digests, get_index, index_diff, from_json_file
+)
 
 import os
 import pytest
@@ -103,6 +105,54 @@ class TestIndexDiff(object):
         assert diff['missing']
         assert diff['missing'].keys() == remote_idx.keys()
 
+    def test_diff_detect_changed(self):
+        # given
+        remote_idx = from_json_file(os.path.join(self.test_data,
+                                                 "idx-e-gpl-rh6-36.json"))
+        local_idx = {key: dict(value) for key, value in remote_idx.items()}
+        rebuilt, removed = sorted(remote_idx)[:2]
+        local_idx[rebuilt]["sha256"] = "0" * 64
+        del local_idx[removed]
+
+        # when
+        diff = index_diff(local_idx, remote_idx, detect_changed=True)
+        plain = index_diff(local_idx, remote_idx)
+
+        # then
+        assert list(diff["changed"]) == [rebuilt]
+        assert diff["changed"][rebuilt] == remote_idx[rebuilt]
+        assert list(diff["missing"]) == [removed]
+        assert "changed" not in plain
+
+    def test_diff_detect_changed_on_digests(self):
+        """ Local side reduced to digests, as gen-diff streams it."""
+        # given
+        remote_idx = from_json_file(os.path.join(self.test_data,
+                                                 "idx-e-gpl-rh6-36.json"))
+        local_idx = {key: egg_digests(value)
+                     for key, value in remote_idx.items()}
+
+        # when
+        diff = index_diff(local_idx, remote_idx, detect_changed=True)
+
+        # then
+        assert not diff["missing"]
+        assert not diff["changed"]
+
+    def test_egg_changed_fallbacks(self):
+        # given
+        egg = {"sha256": "a" * 64, "md5": "b" * 32, "size": 10}
+
+        # then
+        assert not egg_changed(egg, dict(egg))
+        assert egg_changed(egg, dict(egg, sha256="c" * 64))
+        # sha256 takes precedence over md5 and size
+        assert not egg_changed(egg, dict(egg, md5="c" * 32, size=11))
+        # fall back to md5, then size
+        assert egg_changed({"md5": "b" * 32}, dict(egg, md5="c" * 32))
+        assert egg_changed({"size": 10}, {"size": 11})
+        assert not egg_changed({"size": 10}, {"sha256": "a" * 64})
+
     @pytest.mark.skip(reason="Unsure how to test - requires two different EDS")
     def test_full_pipeline(self):
         # given
@@ -0,0 +1,326 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import (
+    cli, from_json_file, index_diff, open_index, to_json_file
+)
+from brood_diff.jsonio import (
+    LazyIndex, first_json_key, iter_json_index, iter_json_keys, write_json
+)
+from brood_diff.records import compact_index
+from brood_diff.snapshot import Snapshot, write_snapshot
+
+import gzip
+import json
+import lzma
+import os
+import tempfile
+
+import pytest
+from click.testing import CliRunner
+
+
+class TestIterJsonIndex(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_matches_from_json_file(self):
+        # given
+        names = ["idx-e-gpl-rh6-36.json", "test-formatted-index.json",
+                 "idx-e-lgpl-rh6-x86_64-36.json"]
+
+        for name in names:
+            path = os.path.join(self.test_data, name)
+
+            # when
+            items = list(iter_json_index(path, chunk_size=7))
+
+            # then
+            assert dict(items) == from_json_file(path)
+            assert [k for k, _ in items] == list(from_json_file(path))
+
+    def test_chunk_boundaries(self):
+        # given
+        idx = {"a": 12345, "b": [1, 2.5, None], "c\"d": {"e": "f"}, "g": {}}
+        _, path = tempfile.mkstemp(suffix=".json")
+        with open(path, "w") as f:
+            json.dump(idx, f, indent=1)
+
+        # when
+        results = [dict(iter_json_index(path, chunk_size=size))
+                   for size in range(1, 20)]
+
+        # then
+        assert all(result == idx for result in results)
+
+    def test_numbers_split_across_chunks(self, tmp_path):
+        # given
+        idx = {"a": {"size": 1.5, "mtime": -2.25e-10},
+               "b": [12345, 0.5, 1E+30, -7], "c": 6.0}
+        path = str(tmp_path / "numbers.json")
+        with open(path, "w") as f:
+            json.dump(idx, f, separators=(",", ":"))
+
+        # when
+        results = [dict(iter_json_index(path, chunk_size=size))
+                   for size in range(1, 12)]
+
+        # then
+        assert all(result == idx for result in results)
+
+    def test_empty_object(self):
+        # given
+        _, path = tempfile.mkstemp(suffix=".json")
+        with open(path, "w") as f:
+            f.write(" { } \n")
+
+        # when
+        items = list(iter_json_index(path))
+
+        # then
+        assert items == []
+
+    def test_empty_file(self):
+        # given
+        test_file = os.path.join(self.test_data, "empty.json")
+
+        # when
+        with pytest.raises(json.decoder.JSONDecodeError) as execinfo:
+            list(iter_json_index(test_file))
+
+        # then
+        assert "Expecting value" in str(execinfo.value)
+
+    def test_truncated_file(self):
+        # given
+        _, path = tempfile.mkstemp(suffix=".json")
+        with open(path, "w") as f:
+            f.write('{"a-1.0-1.egg": {"size": 1}, "b-1.0-1.egg": {"si')
+
+        # when
+        with pytest.raises(json.decoder.JSONDecodeError):
+            list(iter_json_index(path, chunk_size=8))
+
+    def test_streaming_diff_matches_dict_diff(self):
+        # given
+        remote = os.path.join(self.test_data, "idx-e-gpl-rh6-36.json")
+        local = os.path.join(self.test_data, "idx-e-gpl-rh6-36-edit.json")
+
+        # when
+        expected = index_diff(from_json_file(local), from_json_file(remote))
+        diff = index_diff(iter_json_keys(local), iter_json_index(remote))
+
+        # then
+        assert diff == expected
+        assert "psycopg2-2.7.3.2-1.egg" in diff["missing"]
+
+    def test_first_key_reads_one_chunk(self, tmp_path):
+        # given
+        path = str(tmp_path / "index.json.gz")
+        empty = str(tmp_path / "empty.json")
+        with gzip.open(path, "wt") as f:
+            # invalid past the first chunk, which a full read would reject
+            f.write('{"enthought/free": {"rh6-x86_64": ' + "x" * 100000)
+        with open(empty, "w") as f:
+            f.write(" {}")
+
+        # when
+        key = first_json_key(path, chunk_size=64)
+
+        # then
+        assert key == "enthought/free"
+        assert first_json_key(empty) is None
+
+
+class TestLazyIndex(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_matches_from_json_file(self):
+        # given
+        names = ["idx-e-gpl-rh6-36.json", "test-formatted-index.json",
+                 "idx-e-lgpl-rh6-x86_64-36.json"]
+
+        for name in names:
+            path = os.path.join(self.test_data, name)
+            expected = from_json_file(path)
+
+            # when
+            with LazyIndex(path) as idx:
+
+                # then
+                assert list(idx) == list(expected)
+                assert dict(idx.items()) == expected
+                assert "not-an-egg-1.0-1.egg" not in idx
+
+    def test_nested_and_escaped_values(self):
+        # given
+        idx = {"a": 12345, "b": [1, {"c": "}"}], "c\"d": {"e": "f}"},
+               "g": {}, "h": {"i": {"j": "\\"}}, "k\u00e9": "l, \"m\": {"}
+        _, path = tempfile.mkstemp(suffix=".json")
+
+        for indent in (None, 1):
+            with open(path, "w") as f:
+                json.dump(idx, f, indent=indent)
+
+            # when
+            with LazyIndex(path) as lazy:
+
+                # then
+                assert dict(lazy.items()) == idx
+                assert list(lazy) == list(idx)
+
+    def test_empty_and_duplicate_keys(self):
+        # given
+        _, path = tempfile.mkstemp(suffix=".json")
+        cases = [" { } \n", '{"a": {"size": 1}, "b": 2, "a": {"size": 3}}']
+
+        for text in cases:
+            with open(path, "w") as f:
+                f.write(text)
+
+            # when
+            with LazyIndex(path) as lazy:
+
+                # then
+                assert dict(lazy.items()) == json.loads(text)
+
+    def test_invalid_files(self):
+        # given
+        _, path = tempfile.mkstemp(suffix=".json")
+        cases = ["", "[1]", '{"a" 1}', '{"a": {"size": 1}',
+                 '{"a": {"size": 1}} x', '{"a-1.0-1.egg": {"size": 1}, "b']
+
+        for text in cases:
+            with open(path, "w") as f:
+                f.write(text)
+
+            # when
+            with pytest.raises(json.decoder.JSONDecodeError):
+                LazyIndex(path)
+
+    def test_compressed(self, tmp_path):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-gpl-rh6-36.json"))
+        path = str(tmp_path / "idx.json.gz")
+        to_json_file(idx, path)
+
+        # when
+        with LazyIndex(path) as lazy:
+
+            # then
+            assert dict(lazy.items()) == idx
+
+    def test_diff_decodes_missing_records_only(self, tmp_path):
+        # given
+        remote = os.path.join(self.test_data, "idx-e-gpl-rh6-36.json")
+        local = os.path.join(self.test_data, "idx-e-gpl-rh6-36-edit.json")
+        expected = index_diff(from_json_file(local), from_json_file(remote))
+        decoded = []
+
+        class CountingIndex(LazyIndex):
+            def __getitem__(self, key):
+                decoded.append(key)
+                return super().__getitem__(key)
+
+        # when
+        with LazyIndex(local) as local_idx, \
+                CountingIndex(remote) as remote_idx:
+            diff = index_diff(local_idx, remote_idx)
+
+        # then
+        assert diff == expected
+        assert sorted(decoded) == sorted(expected["missing"])
+        assert isinstance(open_index(remote), LazyIndex)
+
+    def test_gen_diff(self, tmp_path):
+        # given
+        remote = os.path.join(self.test_data, "idx-e-gpl-rh6-36.json")
+        local = os.path.join(self.test_data, "idx-e-gpl-rh6-36-edit.json")
+        output = str(tmp_path / "diff.json")
+        local_idx, remote_idx = from_json_file(local), from_json_file(remote)
+
+        for flag in ("--no-detect-changed", "--detect-changed"):
+            # when
+            result = CliRunner().invoke(cli, [
+                "gen-diff", "-l", local, "-r", remote, "-o", output, flag])
+
+            # then
+            assert result.exit_code == 0, result.output
+            assert from_json_file(output) == index_diff(
+                local_idx, remote_idx,
+                detect_changed=flag == "--detect-changed")
+
+
+class TestWriteJson(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_matches_json_dump(self, tmp_path):
+        # given
+        remote = from_json_file(os.path.join(self.test_data,
+                                             "idx-e-gpl-rh6-36.json"))
+        local = from_json_file(os.path.join(self.test_data,
+                                            "idx-e-gpl-rh6-36-edit.json"))
+        diff = index_diff(local, remote, detect_changed=True)
+        cases = [remote, diff, {}, {"missing": {}}, {"a": {"b": []}}]
+        path = str(tmp_path / "out.json")
+
+        for obj in cases:
+            for sort in (True, False):
+                # when
+                write_json(obj, path, sort=sort)
+
+                # then
+                with open(path) as f:
+                    assert f.read() == json.dumps(obj, sort_keys=sort)
+
+    def test_compact_and_streamed_inputs(self, tmp_path):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-free-rh6-36.json"))
+        snap_path = str(tmp_path / "idx.snap")
+        write_snapshot(idx, snap_path)
+        path = str(tmp_path / "out.json")
+        expected = json.dumps(idx, sort_keys=True)
+
+        # when
+        with Snapshot(snap_path) as snapshot:
+            to_json_file(snapshot, path, sort=True)
+            from_snapshot = open(path).read()
+        to_json_file(compact_index(idx), path, sort=True)
+        from_compact = open(path).read()
+        to_json_file(reversed(list(idx.items())), path, sort=True)
+        from_pairs = open(path).read()
+
+        # then
+        assert from_snapshot == from_compact == from_pairs == expected
+
+    @pytest.mark.parametrize("suffix,opener", [(".json.gz", gzip.open),
+                                               (".json.xz", lzma.open)])
+    def test_compressed_round_trip(self, tmp_path, suffix, opener):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-gpl-rh6-36.json"))
+        path = str(tmp_path / ("idx" + suffix))
+        plain = str(tmp_path / "renamed.json")
+
+        # when
+        to_json_file(idx, path, sort=True)
+        os.link(path, plain)
+
+        # then
+        with opener(path, "rt") as f:
+            assert f.read() == json.dumps(idx, sort_keys=True)
+        assert from_json_file(path) == idx
+        assert dict(iter_json_index(plain, chunk_size=100)) == idx
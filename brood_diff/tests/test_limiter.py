@@ -0,0 +1,205 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.client import Client
+from brood_diff.diff import cli, fetch_indices, from_json_file
+from brood_diff.limiter import (
+    AdaptiveLimiter, TokenBucket, limiter_from_options
+)
+from brood_diff.server import IndexServer
+
+import threading
+
+import pytest
+from click.testing import CliRunner
+
+URL = "http://127.0.0.1/api"
+VERSIONS = tuple("cp{}".format(n) for n in range(24))
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def serve_versions(server):
+    for ver in VERSIONS:
+        server.add_index("enthought/free", "rh6-x86_64", ver,
+                         {"{}-1.0-1.egg".format(ver): {"size": 1}})
+    return server
+
+
+class TestTokenBucket(object):
+
+    def test_rate_and_burst(self):
+        # given
+        clock = FakeClock()
+        bucket = TokenBucket(10.0, burst=2, clock=clock, sleep=clock.sleep)
+
+        # when
+        waits = [bucket.acquire() for _ in range(4)]
+        clock.now += 1.0
+        rested = bucket.acquire()
+
+        # then
+        assert waits == [0.0, 0.0, pytest.approx(0.1), pytest.approx(0.1)]
+        assert rested == 0.0
+        assert bucket.tokens == pytest.approx(1.0)
+
+    def test_invalid_rate(self):
+        with pytest.raises(ValueError):
+            TokenBucket(0)
+
+
+class TestAdaptiveLimiter(object):
+
+    def test_slow_start_then_additive_increase(self):
+        # given
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(16, clock=clock)
+
+        # when
+        for _ in range(3):
+            limiter.release(limiter.acquire(URL), 200)
+        slow_start = limiter.limit
+        limiter.release(limiter.acquire(URL), 503)
+        after_decrease = limiter.limit
+        for _ in range(4):
+            limiter.release(limiter.acquire(URL), 200)
+
+        # then
+        assert slow_start == 4.0
+        assert after_decrease == 2.0
+        assert 2.0 < limiter.limit < 4.0
+        assert [event for _, _, _, event in limiter.trajectory] == [
+            "start", "increase", "increase", "increase", "decrease (503)",
+            "increase"]
+
+    def test_decrease_once_per_round_trip(self):
+        # given
+        limiter = AdaptiveLimiter(8, initial=8)
+        permits = [limiter.acquire(URL) for _ in range(8)]
+
+        # when
+        for permit in permits:
+            limiter.release(permit, 429)
+        after_burst = limiter.limit
+        limiter.release(limiter.acquire(URL), None)
+
+        # then
+        assert after_burst == 4.0
+        assert limiter.limit == 2.0
+        assert limiter.summary() == {"limit": 2.0, "min_limit": 2.0,
+                                     "max_limit": 8.0, "decreases": 2}
+
+    def test_bounds_and_latency_target(self):
+        # given
+        clock = FakeClock()
+        limiter = AdaptiveLimiter(2, initial=2, floor=1, latency_target=0.5,
+                                  clock=clock)
+
+        # when
+        for _ in range(5):
+            limiter.release(limiter.acquire(URL), 200)
+        at_ceiling = limiter.limit
+        for _ in range(3):
+            permit = limiter.acquire(URL)
+            clock.now += 1.0
+            limiter.release(permit, 200)
+
+        # then
+        assert at_ceiling == 2.0
+        assert limiter.limit == 1.0
+        assert limiter.trajectory[-1][3] == "decrease (latency)"
+
+    def test_blocks_over_limit(self):
+        # given
+        limiter = AdaptiveLimiter(4, initial=1)
+        first = limiter.acquire(URL)
+        admitted = threading.Event()
+
+        def second():
+            limiter.release(limiter.acquire(URL), 200)
+            admitted.set()
+
+        # when
+        thread = threading.Thread(target=second)
+        thread.start()
+        blocked = not admitted.wait(0.1)
+        limiter.release(first, 200)
+        thread.join(5)
+
+        # then
+        assert blocked
+        assert admitted.is_set()
+        assert limiter.in_flight == 0
+
+    def test_from_options(self):
+        # when
+        fixed = limiter_from_options(False, 8)
+        rate_only = limiter_from_options(False, 8, rate=5.0)
+        adaptive = limiter_from_options(True, 8, latency_target=1.0)
+
+        # then
+        assert fixed is None
+        assert (rate_only.limit, rate_only.floor) == (8.0, 8.0)
+        assert (adaptive.limit, adaptive.ceiling) == (1.0, 8.0)
+
+
+class TestOverload(object):
+    """ Fetch against a server that fails requests beyond its capacity."""
+
+    def fetch(self, limiter, jobs=8):
+        with serve_versions(IndexServer(latency=0.02, capacity=3)) as server:
+            with Client(pool_size=jobs, retries=2, backoff=0.001,
+                        limiter=limiter) as client:
+                indices, failures = fetch_indices(
+                    server.url, ("enthought/free",), ("rh6-x86_64",),
+                    VERSIONS, jobs=jobs, client=client)
+        return indices, failures, server
+
+    def test_adaptive_limit_avoids_overload(self):
+        # when
+        _, fixed_failures, fixed = self.fetch(None)
+        limiter = AdaptiveLimiter(8)
+        indices, failures, adaptive = self.fetch(limiter)
+
+        # then
+        assert failures == {}
+        assert len(indices) == len(VERSIONS)
+        assert fixed_failures
+        assert (adaptive.statuses.count(503) <
+                fixed.statuses.count(503))
+        assert adaptive.max_in_flight <= 3
+        summary = limiter.summary()
+        assert summary["decreases"] >= 1
+        assert summary["max_limit"] > 1.0
+
+    def test_verbose_cli(self, tmp_path):
+        # given
+        output = str(tmp_path / "full.json")
+
+        # when
+        with IndexServer(latency=0.01, capacity=1) as server:
+            for ver in ("cp27", "cp36"):
+                server.add_index("enthought/free", "rh6-x86_64", ver,
+                                 {"{}-1.0-1.egg".format(ver): {"size": 1}})
+            result = CliRunner().invoke(cli, [
+                "full-index", "--url", server.url, "-r", "enthought/free",
+                "-p", "rh6-x86_64", "-v", "cp27", "-v", "cp36",
+                "-o", output, "-j", "4", "--adaptive", "--rate", "1000",
+                "--verbose", "--no-cache"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        assert "limit   1.0  in flight   0  start" in result.output
+        assert "Concurrency ended at" in result.output
+        assert sorted(from_json_file(output)) == ["cp27-1.0-1.egg",
+                                                  "cp36-1.0-1.egg"]
@@ -0,0 +1,159 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import cli, from_json_file, merge_json, to_json_file
+from brood_diff.merge import (
+    MergeConflict, UnsortedInput, is_sorted, merge_sorted
+)
+
+import os
+
+import pytest
+from click.testing import CliRunner
+
+
+class TestMergeSorted(object):
+
+    def test_policies(self):
+        # given
+        first = [("a", {"mtime": 2.0}), ("b", {"mtime": 1.0})]
+        second = [("b", {"mtime": 3.0}), ("c", {"mtime": 1.0})]
+        third = [("a", {"mtime": 1.0})]
+
+        # when
+        last = list(merge_sorted([first, second, third], "last"))
+        newest = list(merge_sorted([first, second, third], "newest"))
+
+        # then
+        assert last == [("a", {"mtime": 1.0}), ("b", {"mtime": 3.0}),
+                        ("c", {"mtime": 1.0})]
+        assert newest == [("a", {"mtime": 2.0}), ("b", {"mtime": 3.0}),
+                          ("c", {"mtime": 1.0})]
+        with pytest.raises(MergeConflict):
+            list(merge_sorted([first, second], "error"))
+
+    def test_unsorted_input(self):
+        with pytest.raises(ValueError):
+            list(merge_sorted([[("b", {}), ("a", {})]]))
+
+    def test_lazy(self):
+        # given
+        def endless(prefix):
+            i = 0
+            while True:
+                yield "{}{:09d}".format(prefix, i), {}
+                i += 1
+
+        # when
+        merged = merge_sorted([endless("a"), endless("b")])
+
+        # then
+        assert next(merged)[0] == "a000000000"
+
+
+class TestMergeFiles(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_matches_dict_merge(self, tmp_path):
+        # given
+        paths = [os.path.join(self.test_data, name)
+                 for name in ("idx-e-gpl-rh6-x86_64-36.json",
+                              "idx-e-gpl-rh6-36-edit.json",
+                              "idx-e-lgpl-rh6-x86_64-36.json")]
+        expected = {}
+        for path in paths:
+            expected.update(from_json_file(path))
+        output = str(tmp_path / "merged.json")
+
+        # when
+        merge_json(paths, output)
+
+        # then
+        merged = from_json_file(output)
+        assert merged == expected
+        assert list(merged) == sorted(expected)
+        assert not is_sorted(paths[0])
+        assert is_sorted(output)
+
+    def test_sorted_records_and_late_unsorted_input(self, tmp_path):
+        # given
+        first, second = str(tmp_path / "a.json"), str(tmp_path / "b.json")
+        to_json_file({"a-1.0-1.egg": {"size": 1, "mtime": 1.0},
+                      "c-1.0-1.egg": {"size": 3, "mtime": 1.0}}, first,
+                     sort=True)
+        with open(second, "w") as f:
+            f.write('{"b-1.0-1.egg": {"size": 2, "mtime": 1.0}, '
+                    '"a-1.0-2.egg": {"size": 4, "mtime": 1.0}}')
+        output = str(tmp_path / "merged.json")
+
+        # when
+        merge_json([first, second], output)
+
+        # then
+        with open(output) as f:
+            text = f.read()
+        assert list(from_json_file(output)) == [
+            "a-1.0-1.egg", "a-1.0-2.egg", "b-1.0-1.egg", "c-1.0-1.egg"]
+        assert '{"mtime": 1.0, "size": 4}' in text
+        with pytest.raises(UnsortedInput) as excinfo:
+            merge_json([first, second], output, assume_sorted=True)
+        assert excinfo.value.number == 1
+
+    def test_failed_merge_leaves_output(self, tmp_path):
+        # given
+        first, second = str(tmp_path / "a.json"), str(tmp_path / "b.json")
+        to_json_file({"x-1.0-1.egg": {"mtime": 1.0}}, first)
+        to_json_file({"x-1.0-1.egg": {"mtime": 2.0}}, second)
+        output = str(tmp_path / "merged.json")
+        to_json_file({"old-1.0-1.egg": {}}, output)
+
+        # when
+        with pytest.raises(MergeConflict):
+            merge_json([first, second], output, "error")
+
+        # then
+        assert from_json_file(output) == {"old-1.0-1.egg": {}}
+        assert sorted(os.listdir(str(tmp_path))) == [
+            "a.json", "b.json", "merged.json"]
+
+    def test_output_is_an_input(self, tmp_path):
+        # given
+        first, second = str(tmp_path / "a.json"), str(tmp_path / "b.json")
+        to_json_file({"x-1.0-1.egg": {"mtime": 1.0}}, first)
+        to_json_file({"y-1.0-1.egg": {"mtime": 2.0}}, second)
+
+        # when
+        result = CliRunner().invoke(cli, ["merge-json", "-i", first, "-i",
+                                          second, "-o", first])
+
+        # then
+        assert result.exit_code == 0, result.output
+        assert from_json_file(first) == {"x-1.0-1.egg": {"mtime": 1.0},
+                                         "y-1.0-1.egg": {"mtime": 2.0}}
+
+    def test_cli(self, tmp_path):
+        # given
+        first, second = str(tmp_path / "a.json"), str(tmp_path / "b.json")
+        to_json_file({"x-1.0-1.egg": {"mtime": 5.0}}, first)
+        to_json_file({"x-1.0-1.egg": {"mtime": 1.0},
+                      "y-1.0-1.egg": {"mtime": 1.0}}, second)
+        output = str(tmp_path / "merged.json")
+        runner = CliRunner()
+
+        # when
+        newest = runner.invoke(cli, ["merge-json", "-i", first, "-i", second,
+                                     "-o", output, "--on-conflict", "newest"])
+        merged = from_json_file(output)
+        error = runner.invoke(cli, ["merge-json", "-i", first, "-i", second,
+                                    "-o", output, "--on-conflict", "error"])
+
+        # then
+        assert newest.exit_code == 0, newest.output
+        assert merged == {"x-1.0-1.egg": {"mtime": 5.0},
+                          "y-1.0-1.egg": {"mtime": 1.0}}
+        assert error.exit_code != 0
+        assert "x-1.0-1.egg" in error.output
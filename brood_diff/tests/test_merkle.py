@@ -0,0 +1,65 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import from_json_file, index_diff
+from brood_diff.merkle import bucket_of, build_digest, digest_diff
+
+import json
+import os
+
+import pytest
+
+
+class TestMerkleDigest(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def load(self, name):
+        return from_json_file(os.path.join(self.test_data, name))
+
+    def test_same_index_no_diff(self):
+        # given
+        idx = self.load("idx-e-free-rh6-36.json")
+
+        # when
+        digest = build_digest(idx.items(), 64)
+        diff = digest_diff(digest, idx)
+
+        # then
+        assert digest["eggs"] == len(idx)
+        assert len(json.dumps(digest)) < 4096
+        assert diff == {"buckets": [], "missing": {}}
+
+    def test_diff_covers_missing_and_changed(self):
+        # given
+        remote_idx = self.load("idx-e-free-rh6-36.json")
+        local_idx = {key: dict(egg) for key, egg in remote_idx.items()}
+        rebuilt, removed = sorted(remote_idx)[10], sorted(remote_idx)[20]
+        local_idx[rebuilt]["sha256"] = "0" * 64
+        del local_idx[removed]
+
+        # when
+        digest = build_digest(local_idx.items(), 256)
+        diff = digest_diff(digest, remote_idx)
+
+        # then
+        exact = index_diff(local_idx, remote_idx, detect_changed=True)
+        assert set(exact["missing"]) | set(exact["changed"]) <= set(
+            diff["missing"])
+        assert sorted(diff["buckets"]) == sorted(
+            {bucket_of(rebuilt, 256), bucket_of(removed, 256)})
+        assert len(diff["missing"]) < len(remote_idx) // 10
+
+    def test_bad_digest_file(self):
+        # given
+        idx = self.load("idx-e-gpl-rh6-36.json")
+
+        # when
+        with pytest.raises(ValueError) as execinfo:
+            digest_diff(idx, idx)
+
+        # then
+        assert "Not a version 1 brood digest file" in str(execinfo.value)
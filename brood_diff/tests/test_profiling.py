@@ -0,0 +1,92 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff import profiling
+from brood_diff.diff import cli, from_json_file
+from brood_diff.utils import cli as utils_cli
+
+import os
+import pstats
+
+from click.testing import CliRunner
+
+ROUTE = "/api/v1/json/indices/enthought/free/rh6-x86_64/cp36/eggs"
+
+
+class TestProfile(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_gen_diff_report(self, tmp_path):
+        # given
+        local = os.path.join(self.test_data, "idx-e-gpl-rh6-36-edit.json")
+        remote = os.path.join(self.test_data, "idx-e-gpl-rh6-36.json")
+        report_path = str(tmp_path / "profile.json")
+        cprofile_path = str(tmp_path / "profile.pstats")
+
+        # when
+        result = CliRunner().invoke(cli, [
+            "--profile", report_path, "--cprofile", cprofile_path,
+            "gen-diff", "-l", local, "-r", remote,
+            "-o", str(tmp_path / "diff.json")])
+
+        # then
+        assert result.exit_code == 0, result.output
+        report = from_json_file(report_path)
+        assert {"load", "diff", "write"} <= set(report["phases"])
+        assert report["phases"]["write"]["calls"] == 1
+        assert report["entries"]["missing eggs"] == len(
+            from_json_file(str(tmp_path / "diff.json"))["missing"])
+        assert report["wall_seconds"] > 0
+        assert report["peak_rss_mb"] > 0
+        assert pstats.Stats(cprofile_path).total_calls > 0
+        assert profiling._active is None
+
+    def test_fetch_report(self, tmp_path, index_server):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-free-rh6-36.json"))
+        index_server.indices[ROUTE] = idx
+        report_path = str(tmp_path / "profile.json")
+
+        # when
+        result = CliRunner().invoke(cli, [
+            "--profile", report_path, "full-index", "-u", index_server.url,
+            "-r", "enthought/free", "-p", "rh6-x86_64", "-v", "cp36",
+            "-o", str(tmp_path / "full.json"), "--no-cache"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        report = from_json_file(report_path)
+        [resource] = report["resources"]
+        assert resource["url"] == index_server.url + ROUTE
+        assert resource["status"] == 200
+        assert resource["bytes"] == report["bytes_downloaded"] > 0
+        assert report["entries"]["remote eggs"] == len(idx)
+        assert {"fetch", "decode", "write"} <= set(report["phases"])
+
+    def test_utils_report(self, tmp_path):
+        # given
+        index = os.path.join(self.test_data, "idx-e-free-rh6-36.json")
+        report_path = str(tmp_path / "profile.json")
+
+        # when
+        result = CliRunner().invoke(utils_cli, [
+            "--profile", report_path, "get-size", "-i", index])
+
+        # then
+        assert result.exit_code == 0, result.output
+        assert "sum" in from_json_file(report_path)["phases"]
+
+    def test_inactive_is_no_op(self):
+        # when
+        with profiling.phase("diff"), profiling.fetch("url") as fetched:
+            fetched.update(status=200, bytes=1)
+            profiling.count("eggs", 1)
+
+        # then
+        assert profiling.phase("diff") is profiling.phase("write")
+        assert profiling._active is None
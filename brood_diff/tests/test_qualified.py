@@ -0,0 +1,210 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import (
+    cli, from_json_file, full_diff, gen_full_index, index_diff, to_json_file
+)
+from brood_diff.qualified import QualifiedIndex, is_qualified
+from brood_diff.utils import get_sizes
+
+import pytest
+from click.testing import CliRunner
+
+ROUTE = "/api/v1/json/indices/enthought/free/{}/{}/eggs"
+CP27 = ("enthought/free", "rh6-x86_64", "cp27")
+CP36 = ("enthought/free", "rh6-x86_64", "cp36")
+WIN = ("enthought/free", "win-x86_64", "cp36")
+
+
+def egg(name, sha="a", size=10):
+    return {"name": name, "size": size, "mtime": 1.0, "sha256": sha * 64}
+
+
+# the same egg name, built for two python tags
+INDICES = {CP27: {"a-1.0-1.egg": egg("a", sha="b"), "b-1.0-1.egg": egg("b")},
+           CP36: {"a-1.0-1.egg": egg("a", sha="c")}}
+
+
+class TestQualifiedIndex(object):
+
+    def test_same_egg_name_in_several_combos(self):
+        # when
+        index = QualifiedIndex(INDICES)
+
+        # then
+        assert len(index) == 3
+        assert index[CP27 + ("a-1.0-1.egg",)]["sha256"] == "b" * 64
+        assert index[CP36 + ("a-1.0-1.egg",)]["sha256"] == "c" * 64
+        assert CP36 + ("b-1.0-1.egg",) not in index
+        assert "a-1.0-1.egg" not in index
+        assert list(index.combos()) == [CP27, CP36]
+        assert index.index(WIN) == {}
+        assert index.flat()["a-1.0-1.egg"]["sha256"] == "c" * 64
+
+    def test_interned_egg_names(self):
+        # given
+        name = "".join(["a-1.0", "-1.egg"])
+
+        # when
+        index = QualifiedIndex({CP27: {name: egg("a")},
+                                CP36: {"".join(["a-1", ".0-1.egg"]):
+                                       egg("a")}})
+
+        # then
+        names = [key[-1] for key in index]
+        assert names[0] is names[1]
+
+    def test_json_round_trip(self, tmp_path):
+        # given
+        path = str(tmp_path / "index.json.gz")
+
+        # when
+        to_json_file(QualifiedIndex(INDICES), path, sort=True)
+        nested = from_json_file(path)
+
+        # then
+        assert nested == {"enthought/free": {"rh6-x86_64": {
+            "cp27": INDICES[CP27], "cp36": INDICES[CP36]}}}
+        assert is_qualified(nested)
+        assert not is_qualified(INDICES[CP27])
+        assert QualifiedIndex.from_nested(nested) == QualifiedIndex(INDICES)
+
+
+class TestQualifiedDiff(object):
+
+    def test_index_diff(self):
+        # given
+        local = QualifiedIndex({CP27: {"a-1.0-1.egg": egg("a", sha="b")},
+                                CP36: {"a-1.0-1.egg": egg("a", sha="d")}})
+        remote = QualifiedIndex(INDICES)
+
+        # when
+        diff = index_diff(local, remote, detect_changed=True)
+        flat_local = index_diff({"a-1.0-1.egg": egg("a", sha="b")}, remote,
+                                detect_changed=True)
+
+        # then
+        assert dict(diff["missing"]) == {
+            CP27 + ("b-1.0-1.egg",): egg("b")}
+        assert dict(diff["changed"]) == {
+            CP36 + ("a-1.0-1.egg",): egg("a", sha="c")}
+        assert dict(flat_local["missing"]) == dict(diff["missing"])
+        assert dict(flat_local["changed"]) == dict(diff["changed"])
+
+    def test_qualified_local_against_flat_remote(self):
+        # given
+        local = QualifiedIndex(INDICES)
+        remote = {"a-1.0-1.egg": egg("a"), "c-1.0-1.egg": egg("c")}
+
+        # when
+        diff = index_diff(local, remote)
+
+        # then
+        assert diff == {"missing": {"c-1.0-1.egg": egg("c")}}
+
+    def test_gen_diff_cli(self, tmp_path):
+        # given
+        local = str(tmp_path / "local.json")
+        remote = str(tmp_path / "remote.json")
+        output = str(tmp_path / "diff.json")
+        to_json_file(QualifiedIndex({CP27: INDICES[CP27]}), local)
+        to_json_file(QualifiedIndex(INDICES), remote)
+        to_json_file({}, str(tmp_path / "empty.json"))
+        runner = CliRunner()
+
+        # when
+        result = runner.invoke(cli, [
+            "gen-diff", "-l", local, "-r", remote, "-o", output])
+        diff = from_json_file(output)
+        with_deps = runner.invoke(cli, [
+            "gen-diff", "-l", local, "-r", remote, "-o", output,
+            "--with-deps"])
+        sharded = runner.invoke(cli, [
+            "gen-diff", "-l", str(tmp_path / "empty.json"), "-r", remote,
+            "-o", output, "--shard-size", "20"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        assert diff == {"missing": {"enthought/free": {
+            "rh6-x86_64": {"cp36": INDICES[CP36]}}}}
+        assert sharded.exit_code == 0, sharded.output
+        assert from_json_file(output)["eggs"] == 3
+        assert from_json_file(str(tmp_path / "diff-002.json"))["missing"] == {
+            "enthought/free": {"rh6-x86_64": {"cp36": INDICES[CP36]}}}
+        assert with_deps.exit_code != 0
+        assert "qualified" in with_deps.output
+
+
+class TestQualifiedFetch(object):
+
+    def serve(self, index_server):
+        for (_, plat, ver), idx in INDICES.items():
+            index_server.indices[ROUTE.format(plat, ver)] = idx
+        index_server.indices[ROUTE.format("win-x86_64", "cp27")] = {}
+        index_server.indices[ROUTE.format("win-x86_64", "cp36")] = {
+            "a-1.0-1.egg": egg("a", sha="e", size=20)}
+
+    def test_full_index_and_diff(self, index_server, tmp_path):
+        # given
+        self.serve(index_server)
+        full = str(tmp_path / "full.json")
+        output = str(tmp_path / "diff.json")
+        local = str(tmp_path / "local.json")
+        to_json_file({"b-1.0-1.egg": egg("b")}, local)
+
+        # when
+        gen_full_index(index_server.url, ("enthought/free",),
+                       ("rh6-x86_64", "win-x86_64"), ("cp27", "cp36"), full,
+                       qualified=True)
+        full_diff(local, ("enthought/free",), ("rh6-x86_64", "win-x86_64"),
+                  ("cp27", "cp36"), output, remote_url=index_server.url,
+                  qualified=True)
+
+        # then
+        index = QualifiedIndex.from_nested(from_json_file(full))
+        assert len(index) == 4
+        assert index[WIN + ("a-1.0-1.egg",)]["size"] == 20
+        missing = from_json_file(output)["missing"]["enthought/free"]
+        assert missing == {
+            "rh6-x86_64": {"cp27": {"a-1.0-1.egg": egg("a", sha="b")},
+                           "cp36": {"a-1.0-1.egg": egg("a", sha="c")}},
+            "win-x86_64": {"cp36": {"a-1.0-1.egg":
+                                    egg("a", sha="e", size=20)}}}
+        assert get_sizes(("platform",), (full,)) == [
+            (("rh6-x86_64",), 3, 30), (("win-x86_64",), 1, 20)]
+        assert get_sizes(("section", "platform"), (output,)) == [
+            (("missing", "rh6-x86_64"), 2, 20),
+            (("missing", "win-x86_64"), 1, 20)]
+
+    def test_full_diff_qualified_local(self, index_server, tmp_path):
+        # given
+        self.serve(index_server)
+        local = str(tmp_path / "local.json")
+        output = str(tmp_path / "diff.json")
+        to_json_file(QualifiedIndex(INDICES), local)
+
+        # when
+        full_diff(local, ("enthought/free",), ("rh6-x86_64", "win-x86_64"),
+                  ("cp27", "cp36"), output, remote_url=index_server.url,
+                  qualified=True)
+
+        # then
+        assert from_json_file(output) == {"missing": {"enthought/free": {
+            "win-x86_64": {"cp36": {"a-1.0-1.egg":
+                                    egg("a", sha="e", size=20)}}}}}
+
+    def test_unsupported_options(self, tmp_path):
+        # when
+        with pytest.raises(ValueError):
+            full_diff(str(tmp_path / "local.json"), ("enthought/free",),
+                      ("rh6-x86_64",), ("cp36",), str(tmp_path / "out.json"),
+                      with_deps=True, qualified=True)
+        result = CliRunner().invoke(cli, [
+            "full-diff", "-l", str(tmp_path / "local.json"),
+            "-r", "enthought/free", "-p", "rh6-x86_64", "-v", "cp36",
+            "-o", str(tmp_path / "out.json"), "--with-deps",
+            "--qualified"])
+
+        # then
+        assert result.exit_code != 0
+        assert "--qualified" in result.output
@@ -0,0 +1,107 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import from_json_file, index_diff, to_json_file
+from brood_diff.records import EggRecord, compact_index, expand_index
+from brood_diff.utils import get_repo_size_by_platform
+
+import os
+import tempfile
+
+
+class TestEggRecord(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_round_trip(self):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-free-rh6-36.json"))
+
+        # when
+        compact = compact_index(idx)
+
+        # then
+        assert expand_index(compact) == idx
+        for key, egg in idx.items():
+            assert compact[key] == egg
+            assert dict(compact[key]) == egg
+            assert list(compact[key]) == list(egg)
+
+    def test_compact_storage(self):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-free-rh6-36.json"))
+
+        # when
+        first, second = list(compact_index(idx).values())[:2]
+
+        # then
+        assert isinstance(first.sha256, bytes)
+        assert len(first.sha256) == 32
+        assert isinstance(first.md5, bytes)
+        assert first.python_tag is second.python_tag
+        assert first.platform_abi is second.platform_abi
+
+    def test_unknown_and_missing_fields(self):
+        # given
+        egg = {"name": "foo", "size": 3, "md5": "NOT-HEX", "extra": 1,
+               "url": "https://eds/foo.egg"}
+
+        # when
+        record = EggRecord.from_dict(egg)
+
+        # then
+        assert record.to_dict() == egg
+        assert "sha256" not in record
+        assert record.get("sha256") is None
+        assert record["url"] == "https://eds/foo.egg"
+
+    def test_json_file_identical(self):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-gpl-rh6-36.json"))
+        _, dict_path = tempfile.mkstemp(suffix=".json")
+        _, compact_path = tempfile.mkstemp(suffix=".json")
+
+        # when
+        to_json_file(idx, dict_path, sort=True)
+        to_json_file(compact_index(idx), compact_path, sort=True)
+
+        # then
+        with open(dict_path) as f1, open(compact_path) as f2:
+            assert f1.read() == f2.read()
+
+    def test_index_diff_on_compact(self):
+        # given
+        remote_idx = from_json_file(os.path.join(self.test_data,
+                                                 "idx-e-gpl-rh6-36.json"))
+        local_idx = from_json_file(os.path.join(self.test_data,
+                                                "idx-e-gpl-rh6-36-edit.json"))
+
+        # when
+        expected = index_diff(local_idx, remote_idx, detect_changed=True)
+        result = index_diff(compact_index(local_idx),
+                            compact_index(remote_idx), detect_changed=True)
+
+        # then
+        assert expand_index(result["missing"]) == expected["missing"]
+        assert expand_index(result["changed"]) == expected["changed"]
+
+    def test_repo_size_on_compact(self, monkeypatch):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-gpl-rh6-36.json"))
+        monkeypatch.setattr("brood_diff.indices.get_index",
+                            lambda *args, **kwargs: idx)
+
+        # when
+        sizes = get_repo_size_by_platform(("enthought/gpl",),
+                                          ("rh6-x86_64",), ("cp36",))
+
+        # then
+        total = sum(egg["size"] for egg in idx.values())
+        assert sizes["rh6-x86_64"] == total / 1_000_000_000
@@ -0,0 +1,184 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import cli, from_json_file
+from brood_diff.scan import (
+    DuplicateEgg, egg_record, read_spec, scan_directory
+)
+
+import hashlib
+import os
+import zipfile
+
+import pytest
+from click.testing import CliRunner
+
+SPEC = """\
+metadata_version = '1.3'
+name = 'Chaco'
+version = '4.7.1'
+build = 2
+
+arch = 'amd64'
+platform = 'linux2'
+osdist = 'RedHat_6'
+python = '3.6'
+python_tag = 'cp36'
+abi_tag = 'cp36m'
+platform_tag = 'linux_x86_64'
+platform_abi = 'gnu'
+
+packages = [
+  'enable 4.7.1',
+  'traits 4.6.0-1',
+]
+"""
+
+
+def make_egg(path, spec=SPEC, payload=b""):
+    with zipfile.ZipFile(path, "w") as egg:
+        if spec is not None:
+            egg.writestr("EGG-INFO/spec/depend", spec)
+        egg.writestr("chaco/__init__.py", payload)
+    return path
+
+
+def make_store(root, count=3):
+    os.makedirs(str(root / "sub"))
+    paths = []
+    for i in range(count):
+        directory = root / "sub" if i % 2 else root
+        spec = SPEC.replace("name = 'Chaco'", "name = 'pkg{}'".format(i))
+        paths.append(make_egg(str(directory / "pkg{}-4.7.1-2.egg".format(i)),
+                              spec=spec))
+    return paths
+
+
+class TestEggRecord(object):
+
+    def test_record_from_spec(self, tmp_path):
+        # given
+        path = make_egg(str(tmp_path / "chaco-4.7.1-2.egg"))
+        with open(path, "rb") as f:
+            content = f.read()
+
+        # when
+        record = egg_record(path)
+
+        # then
+        assert record["name"] == "chaco"
+        assert record["version"] == "4.7.1"
+        assert record["build"] == 2
+        assert record["full_version"] == "4.7.1-2"
+        assert record["python_tag"] == "cp36"
+        assert record["platform_abi"] == "gnu"
+        assert record["packages"] == ["enable 4.7.1", "traits 4.6.0-1"]
+        assert record["md5"] == hashlib.md5(content).hexdigest()
+        assert record["sha256"] == hashlib.sha256(content).hexdigest()
+
+    def test_record_without_spec(self, tmp_path):
+        # given
+        path = make_egg(str(tmp_path / "chaco-4.7.1-2.egg"), spec=None)
+
+        # when
+        record = egg_record(path)
+
+        # then
+        assert read_spec(path) == {}
+        assert record["name"] == "chaco"
+        assert record["version"] == "4.7.1"
+        assert record["build"] == 2
+        assert record["python_tag"] is None
+        assert record["packages"] == []
+
+
+class TestScanDirectory(object):
+
+    def test_scan(self, tmp_path):
+        # given
+        store = tmp_path / "store"
+        paths = make_store(store)
+
+        # when
+        index, stats = scan_directory(str(store))
+
+        # then
+        assert sorted(index) == sorted(os.path.basename(p) for p in paths)
+        assert stats == {"hashed": 3, "cached": 0}
+        for path in paths:
+            record = index[os.path.basename(path)]
+            assert record["size"] == os.path.getsize(path)
+            assert record["mtime"] == float(int(os.path.getmtime(path)))
+
+    def test_rescan_only_hashes_changed_files(self, tmp_path):
+        # given
+        store = tmp_path / "store"
+        paths = make_store(store)
+        cache = str(tmp_path / "scan.json")
+        first, _ = scan_directory(str(store), cache_path=cache)
+
+        # when
+        unchanged, unchanged_stats = scan_directory(str(store),
+                                                    cache_path=cache)
+        make_egg(paths[1], payload=b"rebuilt")
+        changed, changed_stats = scan_directory(str(store), cache_path=cache)
+
+        # then
+        assert unchanged == first
+        assert unchanged_stats == {"hashed": 0, "cached": 3}
+        assert changed_stats == {"hashed": 1, "cached": 2}
+        name = os.path.basename(paths[1])
+        assert changed[name]["sha256"] != first[name]["sha256"]
+
+    def test_process_pool(self, tmp_path):
+        # given
+        store = tmp_path / "store"
+        make_store(store, count=4)
+
+        # when
+        serial, _ = scan_directory(str(store))
+        pooled, stats = scan_directory(str(store), jobs=2)
+
+        # then
+        assert pooled == serial
+        assert stats == {"hashed": 4, "cached": 0}
+
+    def test_cli(self, tmp_path):
+        # given
+        store = tmp_path / "store"
+        make_store(store)
+        output = str(tmp_path / "index.json")
+        args = ["scan-index", "-d", str(store), "-o", output,
+                "--scan-cache", str(tmp_path / "scan.json"), "-j", "1"]
+
+        # when
+        first = CliRunner().invoke(cli, args)
+        second = CliRunner().invoke(cli, args)
+
+        # then
+        assert first.exit_code == 0, first.output
+        assert "Scanned 3 eggs: 3 hashed, 0 unchanged" in first.output
+        assert "Scanned 3 eggs: 0 hashed, 3 unchanged" in second.output
+        index = from_json_file(output)
+        assert list(index) == sorted(index)
+        assert index["pkg0-4.7.1-2.egg"]["name"] == "pkg0"
+
+    def test_duplicate_file_names(self, tmp_path):
+        # given
+        store = tmp_path / "store"
+        make_store(store)
+        make_egg(str(store / "sub" / "pkg0-4.7.1-2.egg"))
+        output = str(tmp_path / "index.json")
+
+        # when
+        with pytest.raises(DuplicateEgg) as excinfo:
+            scan_directory(str(store))
+        result = CliRunner().invoke(cli, [
+            "scan-index", "-d", str(store), "-o", output, "--no-scan-cache"])
+
+        # then
+        assert excinfo.value.paths == (
+            "pkg0-4.7.1-2.egg", os.path.join("sub", "pkg0-4.7.1-2.egg"))
+        assert result.exit_code != 0
+        assert os.path.join("sub", "pkg0-4.7.1-2.egg") in result.output
+        assert not os.path.exists(output)
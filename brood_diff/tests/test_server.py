@@ -0,0 +1,97 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.cache import IndexCache
+from brood_diff.client import Client
+from brood_diff.diff import INDEX_ROUTE, from_json_file, get_index
+from brood_diff.server import IndexServer, index_path
+
+import os
+import tempfile
+import time
+
+import pytest
+import requests
+
+
+class TestIndexServer(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def index(self):
+        return from_json_file(os.path.join(self.test_data,
+                                           "idx-e-gpl-rh6-36.json"))
+
+    def test_routes(self):
+        # given
+        idx = self.index()
+
+        # when
+        with IndexServer() as server, Client(retries=0) as client:
+            server.add_index("enthought/gpl", "rh6-x86_64", "cp36", idx)
+            v1 = get_index(server.url, "enthought", "gpl", "rh6-x86_64",
+                           "cp36", client=client)
+            v0 = get_index(server.url, "enthought", "gpl", "rh6-x86_64",
+                           "cp36", legacy=True, client=client)
+            with pytest.raises(requests.HTTPError) as execinfo:
+                get_index(server.url, "entought", "gpl", "rh6-x86_64",
+                          "cp36", client=client)
+
+        # then
+        assert v1 == v0 == idx
+        assert "Client Error" in str(execinfo.value)
+        assert server.statuses == [200, 200, 404]
+
+    def test_conditional(self):
+        # given
+        idx = self.index()
+        cache = IndexCache(tempfile.mkdtemp())
+
+        # when
+        with IndexServer() as server, Client(retries=0,
+                                             cache=cache) as client:
+            server.add_index("enthought/gpl", "rh6-x86_64", "cp36", idx)
+            for _ in range(2):
+                get_index(server.url, "enthought", "gpl", "rh6-x86_64",
+                          "cp36", client=client)
+            server.conditional = False
+            cached = get_index(server.url, "enthought", "gpl", "rh6-x86_64",
+                               "cp36", client=client)
+
+        # then
+        assert cached == idx
+        assert server.statuses == [200, 304, 200]
+
+    def test_errors(self):
+        # given
+        idx = self.index()
+
+        # when
+        with IndexServer(error_rate=1.0, error_status=503) as server, \
+                Client(retries=2, backoff=0.0) as client:
+            server.add_index("enthought/gpl", "rh6-x86_64", "cp36", idx)
+            with pytest.raises(requests.HTTPError):
+                get_index(server.url, "enthought", "gpl", "rh6-x86_64",
+                          "cp36", client=client)
+
+        # then
+        assert server.statuses == [503, 503, 503]
+
+    def test_latency_and_bandwidth(self):
+        # given
+        body = b"{}".ljust(200 * 1024)
+
+        # when
+        with IndexServer(latency=0.05, bandwidth=1024 * 1024) as server:
+            server.add_index("enthought/gpl", "rh6-x86_64", "cp36", body)
+            start = time.perf_counter()
+            r = requests.get(server.url + index_path(
+                INDEX_ROUTE, "enthought/gpl", "rh6-x86_64", "cp36"))
+            seconds = time.perf_counter() - start
+
+        # then
+        assert r.content == body
+        assert seconds >= 0.05 + 0.15
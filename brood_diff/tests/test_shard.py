@@ -0,0 +1,197 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.deps import DependencyIndex
+from brood_diff.diff import cli, from_json_file, index_diff
+from brood_diff.shard import (
+    dependency_ids, dependency_levels, pack, shard_path, split_diff
+)
+
+import os
+import random
+
+import pytest
+from click.testing import CliRunner
+
+
+def egg(name, size, packages=()):
+    return {"name": name, "version": "1.0", "build": 1,
+            "full_version": "1.0-1", "python_tag": "cp36", "size": size,
+            "packages": ["{} 1.0".format(dep) for dep in packages]}
+
+
+def make_index(*records):
+    return {"{}-1.0-1.egg".format(record["name"]): record
+            for record in records}
+
+
+class TestPack(object):
+
+    def test_first_fit_decreasing(self):
+        # given
+        eggs = make_index(egg("a", 6), egg("b", 5), egg("c", 4), egg("d", 3),
+                          egg("e", 2))
+
+        # when
+        shards = pack(eggs, 10)
+
+        # then
+        assert shards == [["a-1.0-1.egg", "c-1.0-1.egg"],
+                          ["b-1.0-1.egg", "d-1.0-1.egg", "e-1.0-1.egg"]]
+
+    def test_dependencies_in_same_or_earlier_shard(self):
+        # given
+        rng = random.Random(0)
+        records = []
+        for i in range(500):
+            deps = ["p{}".format(j) for j in rng.sample(range(i), min(i, 3))]
+            records.append(egg("p{}".format(i), rng.randint(1, 100), deps))
+        eggs = make_index(*records)
+
+        # when
+        shards = pack(eggs, 300)
+
+        # then
+        shard_of = {key: i for i, keys in enumerate(shards) for key in keys}
+        assert len(shard_of) == len(eggs)
+        for i, keys in enumerate(shards):
+            assert sum(eggs[key]["size"] for key in keys) <= 300
+            for key in keys:
+                for requirement in eggs[key]["packages"]:
+                    dep = "{}-1.0-1.egg".format(requirement.split()[0])
+                    assert shard_of[dep] <= i
+
+    def test_oversized_egg_gets_own_shard(self):
+        # given
+        eggs = make_index(egg("big", 50), egg("small", 5))
+
+        # when
+        shards = pack(eggs, 10)
+
+        # then
+        assert sorted(shards) == [["big-1.0-1.egg"], ["small-1.0-1.egg"]]
+
+    def test_cycle_is_tolerated(self):
+        # given
+        eggs = make_index(egg("a", 1, ["b"]), egg("b", 1, ["a"]),
+                          egg("c", 1, ["a"]))
+        keys = list(eggs)
+
+        # when
+        deps = dependency_ids(keys, eggs)
+        levels = dependency_levels(deps)
+
+        # then
+        assert deps == [[1], [0], [0]]
+        assert levels[2] > max(levels[0], levels[1])
+
+    def test_dependency_ids_resolve_as_dependency_index(self):
+        # given
+        eggs = make_index(egg("a", 1, ["B", "c"]), egg("d", 1, ["e"]))
+        eggs.update({
+            "b-1.0-1.egg": dict(egg("b", 1), python_tag="cp27"),
+            "b-1.0-2.egg": dict(egg("b", 1), build=2, python_tag="cp27"),
+            "c-1.0-1.egg": dict(egg("c", 1), python_tag=None),
+            "c-1.0-3.egg": dict(egg("c", 1), build=3, python_tag="cp27"),
+            "e-1.0-2.egg": dict(egg("e", 1), build=2, full_version="1.0-2"),
+            "f-1.0-1.egg": egg("f", 1, ["b", "e 1.0-2", "g 1.0"])})
+        keys = list(eggs)
+        dep_index = DependencyIndex(eggs)
+
+        # when
+        deps = dependency_ids(keys, eggs)
+
+        # then
+        for key, egg_deps in zip(keys, deps):
+            tag = eggs[key]["python_tag"]
+            expected = [keys.index(dep_index.resolve(requirement, tag))
+                        for requirement in eggs[key]["packages"]
+                        if dep_index.resolve(requirement, tag)]
+            assert [keys[dep] for dep in egg_deps] == [
+                keys[dep] for dep in expected]
+        assert [keys[dep] for dep in deps[0]] == ["b-1.0-2.egg",
+                                                  "c-1.0-1.egg"]
+
+    def test_small_eggs_keep_dependency_order(self):
+        # given
+        rng = random.Random(1)
+        records = []
+        for i in range(2000):
+            deps = ["p{}".format(j) for j in rng.sample(range(i), min(i, 2))]
+            size = rng.choice((rng.randint(1, 15), rng.randint(16, 400)))
+            records.append(egg("p{}".format(i), size, deps))
+        eggs = make_index(*records)
+
+        # when
+        shards = pack(eggs, 1000)
+
+        # then
+        shard_of = {key: i for i, keys in enumerate(shards) for key in keys}
+        total = sum(record["size"] for record in records)
+        assert len(shard_of) == len(eggs)
+        assert len(shards) <= -(-total // 1000) * 1.1
+        for i, keys in enumerate(shards):
+            assert sum(eggs[key]["size"] for key in keys) <= 1000
+            for key in keys:
+                for requirement in eggs[key]["packages"]:
+                    dep = "{}-1.0-1.egg".format(requirement.split()[0])
+                    assert shard_of[dep] <= i
+
+    def test_bad_capacity(self):
+        with pytest.raises(ValueError):
+            pack(make_index(egg("a", 1)), 0)
+
+
+class TestShardOutput(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_shard_path(self):
+        assert shard_path("/a/diff.json", 2) == "/a/diff-002.json"
+        assert shard_path("diff.json.xz", 12) == "diff-012.json.xz"
+        assert shard_path("diff", 1, 4) == "diff-0001"
+
+    def test_split_diff_manifest(self):
+        # given
+        remote = from_json_file(os.path.join(self.test_data,
+                                             "idx-e-free-rh6-36.json"))
+        diff = index_diff({}, remote)
+
+        # when
+        shards = split_diff(diff, 50 * 10 ** 6)
+
+        # then
+        assert sum(len(shard["missing"]) for shard in shards) == len(remote)
+        for shard in shards:
+            manifest = shard["manifest"]
+            assert manifest["shards"] == len(shards)
+            assert manifest["eggs"] == len(shard["missing"])
+            assert manifest["bytes"] == sum(
+                egg["size"] for egg in shard["missing"].values())
+            assert manifest["bytes"] <= 50 * 10 ** 6 or manifest["oversized"]
+
+    def test_gen_diff_shard_size(self, tmp_path):
+        # given
+        remote = os.path.join(self.test_data, "idx-e-gpl-rh6-36.json")
+        local = str(tmp_path / "local.json")
+        with open(local, "w") as f:
+            f.write("{}")
+        output = str(tmp_path / "diff.json")
+
+        # when
+        result = CliRunner().invoke(cli, ["gen-diff", "-l", local,
+                                          "-r", remote, "-o", output,
+                                          "--shard-size", "20MB"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        manifest = from_json_file(output)
+        missing = {}
+        for entry in manifest["shards"]:
+            shard = from_json_file(str(tmp_path / entry["path"]))
+            missing.update(shard["missing"])
+        assert missing == from_json_file(remote)
+        assert manifest["eggs"] == len(missing)
@@ -0,0 +1,129 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.cache import IndexCache
+from brood_diff.diff import (
+    from_json_file, index_diff, index_resource, to_json_file
+)
+from brood_diff.sizes import SizeTable, add_indices, add_path
+from brood_diff.snapshot import write_snapshot
+from brood_diff.utils import cli, get_sizes
+
+from collections import Counter, defaultdict
+import json
+import os
+
+from click.testing import CliRunner
+
+
+class TestSizes(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_group_by_record_dimensions(self, tmp_path):
+        # given
+        path = os.path.join(self.test_data, "idx-e-free-rh6-x86_64-36.json")
+        idx = from_json_file(path)
+        snap_path = str(tmp_path / "idx.snap")
+        write_snapshot(idx, snap_path)
+        expected_counts, expected_bytes = Counter(), defaultdict(int)
+        for key, egg in idx.items():
+            group = (egg.get("python_tag"), key.rsplit("-", 2)[0])
+            expected_counts[group] += 1
+            expected_bytes[group] += egg["size"]
+
+        # when
+        groups = get_sizes(("python_tag", "name"), (path,))
+        snap_groups = get_sizes(("python_tag", "name"), (snap_path,))
+
+        # then
+        assert {labels: (eggs, total) for labels, eggs, total in groups} == {
+            group: (expected_counts[group], expected_bytes[group])
+            for group in expected_counts}
+        assert sorted(snap_groups, key=repr) == sorted(groups, key=repr)
+
+    def test_group_by_fixed_and_row_dimensions(self):
+        # given
+        free = from_json_file(os.path.join(self.test_data,
+                                           "idx-e-free-rh6-36.json"))
+        gpl = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-gpl-rh6-36.json"))
+        table = SizeTable(("repo", "product", "source"))
+        indices = {("enthought/free", "rh6-x86_64", "cp36"): free,
+                   ("enthought/gpl", "rh6-x86_64", "cp36"): gpl}
+
+        # when
+        add_indices(table, indices)
+        by_repo = table.group(("repo",))
+        by_repo_product = table.group(("repo", "product"))
+        total = table.group()
+
+        # then
+        assert by_repo == [
+            (("enthought/free",), len(free),
+             sum(egg["size"] for egg in free.values())),
+            (("enthought/gpl",), len(gpl),
+             sum(egg["size"] for egg in gpl.values()))]
+        assert sum(eggs for _, eggs, _ in by_repo_product) == len(table)
+        assert {labels[0] for labels, _, _ in by_repo_product} == {
+            "enthought/free", "enthought/gpl"}
+        assert total == [((), len(free) + len(gpl),
+                          sum(size for _, _, size in by_repo))]
+
+    def test_diff_sections(self, tmp_path):
+        # given
+        local = from_json_file(os.path.join(self.test_data,
+                                            "idx-e-gpl-rh6-36-edit.json"))
+        remote = from_json_file(os.path.join(self.test_data,
+                                             "idx-e-gpl-rh6-36.json"))
+        diff = index_diff(local, remote, detect_changed=True)
+        diff["dependencies"] = {"a-1.0-1.egg": ["b 1.0"]}
+        path = str(tmp_path / "diff.json")
+        to_json_file(diff, path)
+        table = SizeTable(("section",))
+
+        # when
+        add_path(table, path)
+        groups = table.group(("section",))
+
+        # then
+        expected = [((section,), len(diff[section]),
+                     sum(egg["size"] for egg in diff[section].values()))
+                    for section in ("missing", "changed") if diff[section]]
+        assert groups == expected
+
+    def test_offline_cli(self, tmp_path):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-gpl-rh6-36.json"))
+        cache_dir = str(tmp_path / "cache")
+        resource = index_resource("https://packages.enthought.com",
+                                  "enthought", "gpl", "rh6-x86_64", "cp36")
+        IndexCache(cache_dir).store(resource, json.dumps(idx).encode(),
+                                    {"ETag": '"1"'})
+        output = str(tmp_path / "sizes.json")
+        runner = CliRunner()
+
+        # when
+        result = runner.invoke(cli, [
+            "get-size", "--offline", "--cache-dir", cache_dir,
+            "-r", "enthought/gpl", "-p", "rh6-x86_64", "-v", "cp36",
+            "-g", "platform", "-g", "python_tag", "-o", output])
+        missing = runner.invoke(cli, [
+            "get-size", "--offline", "--cache-dir", cache_dir,
+            "-r", "enthought/free", "-p", "rh6-x86_64", "-v", "cp36"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        sizes = from_json_file(output)
+        assert sizes["group_by"] == ["platform", "python_tag"]
+        assert {group["python_tag"] for group in sizes["groups"]} == {
+            egg.get("python_tag") for egg in idx.values()}
+        assert sum(group["eggs"] for group in sizes["groups"]) == len(idx)
+        assert sum(group["bytes"] for group in sizes["groups"]) == sum(
+            egg["size"] for egg in idx.values())
+        assert missing.exit_code != 0
+        assert "not in the cache" in missing.output
@@ -0,0 +1,105 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import cli, from_json_file, load_index, merge_json
+from brood_diff.snapshot import Snapshot, is_snapshot, write_snapshot
+from brood_diff.utils import get_index_size
+
+from click.testing import CliRunner
+import math
+import os
+import tempfile
+
+
+class TestSnapshot(object):
+    # potentially useful paths for tests
+    thisdir = os.path.abspath(os.path.dirname(__file__))
+    srcdir = os.path.abspath(os.path.join(thisdir, os.pardir))
+    rootdir = os.path.abspath(os.path.join(srcdir, os.pardir))
+    test_data = os.path.join(rootdir, "test_data")
+
+    def test_round_trip(self):
+        # given
+        idx = from_json_file(os.path.join(self.test_data,
+                                          "idx-e-free-rh6-36.json"))
+        _, path = tempfile.mkstemp(suffix=".snap")
+
+        # when
+        write_snapshot(idx, path)
+
+        # then
+        assert is_snapshot(path)
+        with Snapshot(path) as snapshot:
+            assert len(snapshot) == len(idx)
+            assert list(snapshot) == sorted(idx)
+            assert dict(snapshot.iter_items()) == idx
+            for i, key in enumerate(snapshot):
+                assert snapshot[key] == idx[key]
+                assert snapshot.sizes[i] == idx[key]["size"]
+                assert snapshot.mtimes[i] == idx[key]["mtime"]
+                assert snapshot.builds[i] == idx[key]["build"]
+                assert snapshot.sha256(i).hex() == idx[key]["sha256"]
+            assert "not-an-egg-1.0-1.egg" not in snapshot
+
+    def test_missing_columns(self):
+        # given
+        idx = {"b-1.0-1.egg": {"name": "b"}, "a-1.0-1.egg": {"size": 5}}
+        _, path = tempfile.mkstemp(suffix=".snap")
+
+        # when
+        write_snapshot(idx, path)
+
+        # then
+        with Snapshot(path) as snapshot:
+            assert list(snapshot) == ["a-1.0-1.egg", "b-1.0-1.egg"]
+            assert list(snapshot.sizes) == [5, -1]
+            assert math.isnan(snapshot.mtimes[1])
+            assert snapshot.sha256(0) is None
+            assert dict(snapshot.iter_items()) == idx
+
+    def test_convert_and_gen_diff(self):
+        # given
+        remote = os.path.join(self.test_data, "idx-e-gpl-rh6-36.json")
+        local = os.path.join(self.test_data, "idx-e-gpl-rh6-36-edit.json")
+        tmp = tempfile.mkdtemp()
+        remote_snap = os.path.join(tmp, "remote.snap")
+        local_snap = os.path.join(tmp, "local.snap")
+        json_out = os.path.join(tmp, "json.json")
+        snap_out = os.path.join(tmp, "snap.json")
+        runner = CliRunner()
+
+        # when
+        for src, dst in ((remote, remote_snap), (local, local_snap)):
+            result = runner.invoke(cli, ["convert", "-i", src, "-o", dst])
+            assert result.exit_code == 0, result.output
+        runner.invoke(cli, ["gen-diff", "-l", local, "-r", remote,
+                            "-o", json_out])
+        runner.invoke(cli, ["gen-diff", "-l", local_snap, "-r", remote_snap,
+                            "-o", snap_out, "--detect-changed"])
+
+        # then
+        json_diff = from_json_file(json_out)
+        snap_diff = from_json_file(snap_out)
+        assert snap_diff["missing"] == json_diff["missing"]
+        assert "psycopg2-2.7.3.2-1.egg" in snap_diff["missing"]
+        assert snap_diff["changed"] == {}
+
+    def test_merge_and_size_accept_snapshots(self):
+        # given
+        paths = [os.path.join(self.test_data, name)
+                 for name in ("idx-e-free-rh6-x86_64-36.json",
+                              "idx-e-gpl-rh6-x86_64-36.json")]
+        _, snap_path = tempfile.mkstemp(suffix=".snap")
+        write_snapshot(from_json_file(paths[1]), snap_path)
+        _, expected_path = tempfile.mkstemp(suffix=".json")
+        _, out_path = tempfile.mkstemp(suffix=".json")
+
+        # when
+        merge_json(paths, expected_path)
+        merge_json([paths[0], snap_path], out_path)
+        sizes = get_index_size((paths[1], snap_path))
+
+        # then
+        assert from_json_file(out_path) == from_json_file(expected_path)
+        assert sizes[paths[1]] == sizes[snap_path] > 0
+        assert isinstance(load_index(snap_path), Snapshot)
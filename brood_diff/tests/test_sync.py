@@ -0,0 +1,78 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import from_json_file
+from brood_diff.syncstate import SyncState, sync_index
+
+import os
+import tempfile
+
+ROUTE = "/api/v1/json/indices/enthought/free/rh6-x86_64/{}/eggs"
+
+
+def egg(name, sha="a", mtime=1.0):
+    return {"name": name, "size": 10, "mtime": mtime, "sha256": sha * 64}
+
+
+class TestSync(object):
+    """ Test incremental sync against a local index server."""
+
+    def sync(self, server, state_dir, **kwargs):
+        _, output = tempfile.mkstemp(suffix=".json")
+        status = sync_index(state_dir, ("enthought/free",), ("rh6-x86_64",),
+                            ("cp27", "cp36"), output,
+                            remote_url=server.url, **kwargs)
+        return status, from_json_file(output)
+
+    def test_incremental_sync(self, index_server):
+        # given
+        state_dir = tempfile.mkdtemp()
+        cp27 = {"a-1.0-1.egg": egg("a"), "b-1.0-1.egg": egg("b")}
+        cp36 = {"c-1.0-1.egg": egg("c")}
+        index_server.indices[ROUTE.format("cp27")] = cp27
+        index_server.indices[ROUTE.format("cp36")] = cp36
+
+        # when
+        first_status, first = self.sync(index_server, state_dir)
+        cp27["b-1.0-1.egg"] = egg("b", sha="f")
+        cp27["d-1.0-1.egg"] = egg("d")
+        second_status, second = self.sync(index_server, state_dir)
+        third_status, third = self.sync(index_server, state_dir)
+
+        # then
+        assert set(first["missing"]) == {"a-1.0-1.egg", "b-1.0-1.egg",
+                                         "c-1.0-1.egg"}
+        assert set(first_status.values()) == {"new"}
+        assert list(second["missing"]) == ["d-1.0-1.egg"]
+        assert list(second["changed"]) == ["b-1.0-1.egg"]
+        assert second_status[("enthought/free", "rh6-x86_64",
+                              "cp36")] == "unchanged"
+        assert third == {"missing": {}, "changed": {}}
+        assert set(third_status.values()) == {"unchanged"}
+        assert index_server.statuses[-2:] == [304, 304]
+
+    def test_no_commit_and_local_seed(self, index_server):
+        # given
+        state_dir = tempfile.mkdtemp()
+        index_server.indices[ROUTE.format("cp27")] = {
+            "a-1.0-1.egg": egg("a"), "b-1.0-1.egg": egg("b", mtime=2.0)}
+        index_server.indices[ROUTE.format("cp36")] = {}
+        _, local = tempfile.mkstemp(suffix=".json")
+        with open(local, "w") as f:
+            f.write('{"a-1.0-1.egg": {"sha256": "%s"}}' % ("a" * 64))
+
+        # when
+        _, dry = self.sync(index_server, state_dir, local_idx_json=local,
+                           commit=False)
+        _, seeded = self.sync(index_server, state_dir, local_idx_json=local)
+
+        # then
+        assert dry == seeded
+        assert list(seeded["missing"]) == ["b-1.0-1.egg"]
+        state = SyncState(state_dir)
+        combo = ("enthought/free", "rh6-x86_64", "cp27")
+        assert state.validators(combo)["etag"]
+        with state.snapshot(combo) as snapshot:
+            assert list(snapshot) == ["a-1.0-1.egg", "b-1.0-1.egg"]
+        assert os.path.exists(os.path.join(state_dir, "enthought", "free",
+                                           "rh6-x86_64", "cp36.snap"))
@@ -0,0 +1,147 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+from brood_diff.diff import (
+    cli, egg_changed, from_json_file, index_diff, to_json_file
+)
+from brood_diff.watch import WatchState, watch_diff
+
+import os
+import threading
+
+from click.testing import CliRunner
+
+ROUTE = "/api/v1/json/indices/enthought/free/rh6-x86_64/{}/eggs"
+COMBOS = [("enthought/free", "rh6-x86_64", "cp27"),
+          ("enthought/free", "rh6-x86_64", "cp36")]
+
+
+def egg(name, sha="a"):
+    return {"name": name, "size": 10, "mtime": 1.0, "sha256": sha * 64}
+
+
+class TestWatchState(object):
+
+    def test_incremental_update_matches_full_diff(self):
+        # given
+        local = {"a-1.0-1.egg": egg("a"), "b-1.0-1.egg": egg("b")}
+        cp27 = {"a-1.0-1.egg": egg("a"), "c-1.0-1.egg": egg("c")}
+        cp36 = {"b-1.0-1.egg": egg("b", sha="f"), "c-1.0-1.egg": egg("c")}
+        state = WatchState(COMBOS, local, egg_changed)
+
+        # when
+        first = (state.update(COMBOS[0], cp27, {}) +
+                 state.update(COMBOS[1], cp36, {"etag": '"1"'}))
+        unchanged = state.update(COMBOS[1], dict(cp36), {"etag": '"2"'})
+        cp36_next = {"c-1.0-1.egg": egg("c", sha="e"),
+                     "d-1.0-1.egg": egg("d")}
+        second = state.update(COMBOS[1], cp36_next, {})
+
+        # then
+        assert first == 2
+        assert unchanged == 0
+        assert state.validators(COMBOS[1]) == {}
+        assert second == 3
+        expected = index_diff(local, dict(cp27, **cp36_next),
+                              detect_changed=True)
+        assert state.diff() == expected
+        assert state.missing["c-1.0-1.egg"]["sha256"] == "e" * 64
+
+    def test_set_local(self):
+        # given
+        state = WatchState(COMBOS[:1], {})
+        state.update(COMBOS[0], {"a-1.0-1.egg": egg("a"),
+                                 "b-1.0-1.egg": egg("b")}, {})
+
+        # when
+        modified = state.set_local({"a-1.0-1.egg": egg("a")})
+
+        # then
+        assert modified == 1
+        assert state.diff() == {"missing": {"b-1.0-1.egg": egg("b")}}
+
+
+class TestWatchDiff(object):
+
+    def test_polls_rewrite_only_on_change(self, index_server, tmp_path):
+        # given
+        local = str(tmp_path / "local.json")
+        output = str(tmp_path / "diff.json")
+        to_json_file({"a-1.0-1.egg": egg("a")}, local)
+        cp27 = {"a-1.0-1.egg": egg("a"), "b-1.0-1.egg": egg("b")}
+        index_server.indices[ROUTE.format("cp27")] = cp27
+        polls, diffs = [], []
+
+        def report(poll):
+            polls.append(poll)
+            diffs.append(from_json_file(output) if os.path.exists(output)
+                         else None)
+            if poll["poll"] == 1:
+                # cp36 is only served from the second poll on
+                index_server.indices[ROUTE.format("cp36")] = {
+                    "c-1.0-1.egg": egg("c")}
+            elif poll["poll"] == 3:
+                cp27["d-1.0-1.egg"] = egg("d")
+            elif poll["poll"] == 4:
+                to_json_file({"a-1.0-1.egg": egg("a"),
+                              "b-1.0-1.egg": egg("b")}, local)
+                os.utime(local, ns=(0, 0))
+
+        # when
+        watch_diff(local, ("enthought/free",), ("rh6-x86_64",),
+                   ("cp27", "cp36"), output, interval=0, polls=5,
+                   remote_url=index_server.url, report=report)
+
+        # then
+        assert [poll["written"] for poll in polls] == [
+            False, True, False, True, True]
+        assert list(polls[0]["failures"]) == [COMBOS[1]]
+        assert polls[2]["updated"] == []
+        assert index_server.statuses.count(304) == 6
+        assert diffs[1] == {"missing": {"b-1.0-1.egg": egg("b"),
+                                        "c-1.0-1.egg": egg("c")}}
+        assert set(diffs[3]["missing"]) == {"b-1.0-1.egg", "c-1.0-1.egg",
+                                            "d-1.0-1.egg"}
+        assert set(diffs[4]["missing"]) == {"c-1.0-1.egg", "d-1.0-1.egg"}
+        assert [name for name in os.listdir(str(tmp_path))
+                if name.startswith(".")] == []
+
+    def test_stop(self, index_server, tmp_path):
+        # given
+        local = str(tmp_path / "local.json")
+        to_json_file({}, local)
+        index_server.indices[ROUTE.format("cp27")] = {}
+        stop = threading.Event()
+        polls = []
+
+        def report(poll):
+            polls.append(poll)
+            stop.set()
+
+        # when
+        watch_diff(local, ("enthought/free",), ("rh6-x86_64",), ("cp27",),
+                   str(tmp_path / "diff.json"), interval=60,
+                   remote_url=index_server.url, stop=stop, report=report)
+
+        # then
+        assert len(polls) == 1
+
+    def test_cli(self, index_server, tmp_path):
+        # given
+        local = str(tmp_path / "local.json")
+        output = str(tmp_path / "diff.json")
+        to_json_file({}, local)
+        index_server.indices[ROUTE.format("cp27")] = {"a-1.0-1.egg": egg("a")}
+
+        # when
+        result = CliRunner().invoke(cli, [
+            "watch", "-l", local, "-r", "enthought/free", "-p", "rh6-x86_64",
+            "-v", "cp27", "-o", output, "-u", index_server.url,
+            "--interval", "0", "--polls", "2"])
+
+        # then
+        assert result.exit_code == 0, result.output
+        assert "poll 1: 1 updated, 1 diff entries modified, diff written" \
+            in result.output
+        assert "poll 2: 0 updated, 0 diff entries modified\n" in result.output
+        assert from_json_file(output) == {"missing": {"a-1.0-1.egg": egg("a")}}
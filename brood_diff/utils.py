@@ -6,25 +6,43 @@ Utility functions for the brood_diff library.
 """
 
 import contextlib
+import json
 import os
 import shutil
 import stat
 import tempfile
-from collections import defaultdict
 from itertools import product
 
-from typing import Tuple
+from typing import List, Mapping, Optional, Sequence, Tuple
 
 import click
 
-from brood_diff.diff import get_index
-from brood_diff import valid
+from brood_diff.cache import cache_from_options, cache_options
+from brood_diff.client import Client, DEFAULT_JOBS, client_options
+from brood_diff.diff import report_limiter
+from brood_diff.indices import FetchError, fetch_indices, index_resource
+from brood_diff.jsonio import write_json
+from brood_diff.limiter import limiter_from_options, limiter_options
+from brood_diff.sizes import (
+    DIMENSIONS, GB, SizeTable, add_indices, add_path, format_labels
+)
+from brood_diff import profiling, valid
 
 
 @click.group()
-def cli():
+@click.option('--profile', 'profile_path', type=str, default=None,
+              help=("<path> Write a json report of the time spent per phase "
+                    "and per fetched index, bytes downloaded, entries "
+                    "processed and peak memory to this file at exit."))
+@click.option('--cprofile', 'cprofile_path', type=str, default=None,
+              help=("<path> Also run the command under cProfile and dump "
+                    "its stats to this file."))
+@click.pass_context
+def cli(ctx, profile_path, cprofile_path):
     """ Utility functions for interacting with Brood indices."""
-    pass
+    if profile_path or cprofile_path:
+        profiling.start(profile_path, cprofile_path)
+        ctx.call_on_close(profiling.finish)
 
 
 # cli wrappers #
@@ -40,14 +58,86 @@ def cli():
               callback=valid.validate_versions,
               help=("<python-version> See list-versions for "
                     "supported python version tags"))
-def cli_get_repo_size(repository, platform, version):
+@client_options()
+@cache_options
+@click.option('--index', '-i', 'index_paths', multiple=True, type=str,
+              help=("<path> json index, diff or snapshot file to size. May "
+                    "be given multiple times. Brood is only queried if "
+                    "-r is also given."))
+@click.option('--group-by', '-g', multiple=True,
+              type=click.Choice(DIMENSIONS),
+              help=("<dimension> Group sizes by this dimension. May be given "
+                    "multiple times to group by a combination."
+                    "\nDefault: source with -i, platform otherwise"))
+@click.option('--offline', is_flag=True, default=False,
+              help=("Size the indices stored in the cache by earlier "
+                    "fetches instead of querying Brood."))
+@click.option('--output', '-o', type=str, default=None,
+              help="<path> Also write the sizes as json to this file.")
+@click.option('--dedup/--no-dedup', default=False,
+              help=("Count eggs with the same sha256 once, as a transfer "
+                    "of the unique blobs would carry them."
+                    "\nDefault: --no-dedup"))
+@limiter_options
+def cli_get_repo_size(repository, platform, version, jobs, timeout, retries,
+                      cache_dir, no_cache, max_cache_size, index_paths,
+                      group_by, offline, output, dedup, adaptive, rate,
+                      latency_target, verbose):
     """ Query Brood indices and calculate repo size using the egg metadata.
-    Reports total size of repo per platform in Gb.
+    Reports total size and egg count per platform in Gb.
+
+    With -i/--index, sizes local index files, diffs or snapshots instead and
+    reports the total of each file. --group-by groups the totals by any
+    combination of source, section (missing or changed eggs of a diff),
+    repo, platform, python_tag, product and package name.
+
+    With --dedup an egg binary listed several times, e.g. under several
+    platforms of a qualified diff, is counted once, in the first group
+    holding it.
     """
-    sizes = get_repo_size_by_platform(repository, platform, version)
-    click.secho("Repos: {}".format(repository), fg='green')
-    for key in sizes.keys():
-        click.secho("{} has size {} Gb".format(key, sizes[key]), fg='green')
+    if not group_by:
+        group_by = ("source",) if index_paths else ("platform",)
+    indices = None
+    if repository or not index_paths:
+        if offline and no_cache:
+            raise click.BadParameter(
+                "--offline reads the cache and cannot be used with "
+                "--no-cache", param_hint="--offline")
+        url = "https://packages.enthought.com"
+        cache = cache_from_options(cache_dir, no_cache, max_cache_size)
+        if offline:
+            indices, failures = load_cached_indices(
+                url, repository, platform, version, cache)
+        else:
+            limiter = limiter_from_options(adaptive, jobs, rate,
+                                           latency_target)
+            client = Client(pool_size=jobs, timeout=timeout,
+                            retries=retries, cache=cache, limiter=limiter)
+            try:
+                indices, failures = fetch_indices(
+                    url, repository, platform, version, jobs=jobs,
+                    client=client, compact=True)
+            finally:
+                client.close()
+                report_limiter(limiter, verbose)
+        if failures:
+            raise click.ClickException(str(FetchError(failures)))
+        click.secho("Repos: {}".format(repository), fg='green')
+
+    groups = get_sizes(group_by, index_paths, indices, dedup=dedup)
+    for labels, eggs, total in groups:
+        click.secho("{} has size {} Gb in {} eggs".format(
+            format_labels(labels), total / GB, eggs), fg='green')
+    if len(groups) > 1:
+        click.secho("Total size {} Gb in {} eggs".format(
+            sum(group[2] for group in groups) / GB,
+            sum(group[1] for group in groups)), fg='green')
+    if output:
+        write_json({"group_by": list(group_by),
+                    "dedup": dedup,
+                    "groups": [dict(zip(group_by, labels), eggs=eggs,
+                                    bytes=total)
+                               for labels, eggs, total in groups]}, output)
 
 
 @contextlib.contextmanager
@@ -68,33 +158,104 @@ def _remove_readonly(func, path, _):
 
 def get_repo_size_by_platform(repos: Tuple[str],
                               plats: Tuple[str],
-                              vers: Tuple[str]) -> dict:
+                              vers: Tuple[str],
+                              jobs: int = DEFAULT_JOBS,
+                              client: Optional[Client] = None,
+                              url: str = "https://packages.enthought.com"
+                              ) -> dict:
     """ Sum the size egg metadata for a given repo by platform.
 
     INPUTS:
     repos: tuple of strings in Hatcher/Brood org/repo format
     plats: tuple of platform strings
     vers: tuple of python version strings
+    jobs: number of indices to fetch concurrently
+    client: optional shared Client used for the requests
+    url: EDS instance to query, the Enthought production url by default
 
     RETURNS:
     dict containing repo sizes in Gb by platform
+
+    Indices are held as compact EggRecords while they are summed. Raises
+    FetchError if any of the indices could not be fetched.
     """
+    indices, failures = fetch_indices(url, repos, plats, vers, jobs=jobs,
+                                      client=client, compact=True)
+    if failures:
+        raise FetchError(failures)
+    groups = get_sizes(("platform",), indices=indices)
+    return {plat: total / GB for (plat,), _, total in groups}
+
+
+def get_index_size(paths: Tuple[str]) -> dict:
+    """ Sum the size egg metadata of local index files.
 
-    sizes = defaultdict(int)
-    for repo, plat, ver in product(repos, plats, vers):
-        org, repo = repo.split("/")
-        idx = get_index(url="https://packages.enthought.com",
-                        org=org,
-                        repo=repo,
-                        plat=plat,
-                        pyver=ver)
-        for key in idx.keys():
-            sizes[plat] += idx[key]['size']
-
-    for key in sizes.keys():
-        sizes[key] /= 1_000_000_000
+    INPUTS:
+    paths: tuple of paths to json indices, diffs or snapshots
+
+    RETURNS:
+    dict containing index sizes in Gb by path
+
+    Snapshots are summed from their size column without decoding any
+    records. The size of a diff is that of its missing and changed eggs.
+    """
+    groups = get_sizes(("source",), paths)
+    sizes = {path: 0.0 for path in paths}
+    sizes.update((path, total / GB) for (path,), _, total in groups)
     return sizes
 
 
+def get_sizes(group_by: Sequence[str], index_paths: Tuple[str] = (),
+              indices: Optional[Mapping[tuple, Mapping]] = None,
+              dedup: bool = False) -> List[Tuple[tuple, int, int]]:
+    """ Egg counts and byte totals grouped by dimensions.
+
+    INPUTS:
+    group_by: dimensions to group by, see sizes.DIMENSIONS
+    index_paths: paths to json indices, diffs or snapshots
+    indices: fetched indices keyed by (org/repo, platform, python-tag)
+    dedup: count the eggs sharing a sha256 once, in the group of the first
+    of them
+
+    RETURNS:
+    list of (labels, eggs, bytes) tuples, one per group in order of first
+    appearance, labels holding the group's label for each dimension
+    """
+    table = SizeTable(group_by)
+    seen = set() if dedup else None
+    with profiling.phase("load"):
+        for path in index_paths:
+            add_path(table, path, seen)
+        if indices:
+            add_indices(table, indices, seen)
+    profiling.count("sized eggs", len(table))
+    with profiling.phase("sum"):
+        return table.group(group_by)
+
+
+def load_cached_indices(url: str, org_repos: Tuple[str], plats: Tuple[str],
+                        pyvers: Tuple[str], cache
+                        ) -> Tuple[dict, dict]:
+    """ Read the index of every org/repo, platform and python-tag
+    combination from cache, without making any request.
+
+    Returns a tuple (indices, failures) as fetch_indices does, failures
+    mapping each combination that is not cached to a LookupError.
+    """
+    indices, failures = {}, {}
+    for combo in product(org_repos, plats, pyvers):
+        org_repo, plat, ver = combo
+        org, repo = org_repo.split("/")
+        resource = index_resource(url, org, repo, plat, ver)
+        body = cache.load(resource)
+        if body is None:
+            failures[combo] = LookupError(
+                "{} is not in the cache".format(resource))
+            continue
+        with profiling.phase("decode"):
+            indices[combo] = json.loads(body.decode("utf-8"))
+    return indices, failures
+
+
 if __name__ == '__main__':
     cli()
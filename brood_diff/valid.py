@@ -1,6 +1,7 @@
 # (C) Copyright 2018 Enthought, Inc., Austin, TX
 # All rights reserved.
 #
+import re
 
 import click
 
@@ -22,6 +23,20 @@ VERS = ["cp27",
         "cp36",
         "pp27"]
 
+# Multipliers for human readable sizes, e.g. 4GB or 512MiB.
+SIZE_UNITS = {"": 1,
+              "b": 1,
+              "kb": 10 ** 3,
+              "mb": 10 ** 6,
+              "gb": 10 ** 9,
+              "tb": 10 ** 12,
+              "kib": 2 ** 10,
+              "mib": 2 ** 20,
+              "gib": 2 ** 30,
+              "tib": 2 ** 40}
+
+SIZE_RE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([a-zA-Z]*)\s*$")
+
 
 def validate_platforms(ctx: click.Context,
                        param: click.core.Option,
@@ -41,7 +56,7 @@ def validate_platform(ctx: click.Context,
                       param: click.core.Option,
                       value: str):
     """ Validate User CLI input for single value."""
-    if value in PLATS:
+    if value is None or value in PLATS:
         return value
     else:
         raise click.BadParameter(
@@ -67,7 +82,7 @@ def validate_version(ctx: click.Context,
                      param: click.core.Option,
                      value: str):
     """ Validate User CLI input."""
-    if value in VERS:
+    if value is None or value in VERS:
         return value
     else:
         raise click.BadParameter(
@@ -97,10 +112,28 @@ def validate_org_repo(ctx: click.Context,
     Repositories are formatted using the EDS/Hatcher format <org/repo> - e.g.
         enthought/free
     """
-    if "/" in value and len(value.split("/")) == 2:
+    if value is None or ("/" in value and len(value.split("/")) == 2):
         return value
     else:
         raise click.BadParameter(
             ("Invalid repository format: {}. Repositories must use the"
              " EDS/Hatcher format <org/repo>."
              " e.g. enthought/free".format(value)))
+
+
+def validate_size(ctx: click.Context,
+                  param: click.core.Option,
+                  value):
+    """ Validate User CLI input for a size in bytes, e.g. 4GB or 512MiB.
+    Returns the size as an int number of bytes.
+    """
+    if value is None or isinstance(value, int):
+        return value
+    match = SIZE_RE.match(value)
+    unit = match.group(2).lower() if match else None
+    if unit is not None and unit in SIZE_UNITS:
+        return int(float(match.group(1)) * SIZE_UNITS[unit])
+    else:
+        raise click.BadParameter(
+            ("Invalid size: {}. Sizes must be a number of bytes with an"
+             " optional unit, e.g. 4GB or 512MiB.".format(value)))
@@ -0,0 +1,211 @@
+# (C) Copyright 2018 Enthought, Inc., Austin, TX
+# All rights reserved.
+#
+"""
+Incrementally maintained diff for the watch command.
+
+WatchState holds the latest fetched index of every org/repo, platform and
+python-tag along with its ETag/Last-Modified validators, the local index
+and the diff between the merged remote indices and the local index. When a
+poll brings a new version of one index, only the eggs added, removed or
+changed in that index are looked up again in the merged remote view and
+their diff entries updated, so the cost of a poll follows the size of the
+change rather than of the indices. Unchanged indices cost a conditional
+request and nothing else.
+
+Memory stays flat across polls: each index replaces its previous version
+and nothing else is kept per poll.
+
+watch_diff, the driver of the watch command, polls the indices and keeps a
+diff file up to date with a WatchState.
+"""
+import os
+import threading
+from itertools import count, product
+from typing import Callable, Iterable, Mapping, Optional, Tuple
+
+from brood_diff import profiling
+from brood_diff.client import Client, DEFAULT_JOBS
+from brood_diff.indices import (
+    egg_changed, fan_out, fetch_combo_since, iter_index
+)
+from brood_diff.jsonio import write_json
+from brood_diff.records import compact_index
+
+
+# Default number of seconds between the polls of the watch command.
+DEFAULT_WATCH_INTERVAL = 300.0
+
+
+class WatchState(object):
+    """ Remote indices, local index and their diff, updated in place.
+
+    combos is the ordered list of (org/repo, platform, python-tag); an egg
+    found in several indices takes its metadata from the last one, as in
+    merge_indices. changed is the egg_changed predicate, or None to report
+    missing eggs only.
+    """
+
+    def __init__(self, combos: Iterable[tuple], local_index: Mapping,
+                 changed: Optional[Callable[[Mapping, Mapping], bool]] = None):
+        self.combos = list(combos)
+        self.local_index = local_index
+        self.changed = changed
+        self.indices = {}
+        self._validators = {}
+        self.missing = {}
+        self.changed_eggs = {}
+
+    @property
+    def complete(self) -> bool:
+        """ Whether every index has been fetched at least once."""
+        return len(self.indices) == len(self.combos)
+
+    def diff(self) -> dict:
+        """ The current diff, in the index_diff layout."""
+        if self.changed is None:
+            return {"missing": self.missing}
+        return {"missing": self.missing, "changed": self.changed_eggs}
+
+    def validators(self, combo: tuple) -> dict:
+        """ Validators the current index of combo was fetched with."""
+        return self._validators.get(combo, {})
+
+    def update(self, combo: tuple, index: Mapping,
+               validators: Mapping) -> int:
+        """ Replace the index of combo and update the diff for the eggs
+        that differ from its previous version. Returns the number of diff
+        entries added, removed or replaced."""
+        previous = self.indices.get(combo, {})
+        affected = [key for key, egg in index.items()
+                    if previous.get(key) != egg]
+        affected.extend(key for key in previous if key not in index)
+        self.indices[combo] = index
+        self._validators[combo] = dict(validators)
+        return sum(self._refresh(key) for key in affected)
+
+    def set_local(self, local_index: Mapping) -> int:
+        """ Replace the local index and recompute the whole diff. Returns
+        the number of diff entries added, removed or replaced."""
+        self.local_index = local_index
+        keys = set(self.missing) | set(self.changed_eggs)
+        for index in self.indices.values():
+            keys.update(index)
+        return sum(self._refresh(key) for key in keys)
+
+    def remote_egg(self, key: str) -> Optional[Mapping]:
+        """ Metadata of an egg in the merged remote indices, or None."""
+        for combo in reversed(self.combos):
+            index = self.indices.get(combo)
+            if index is not None and key in index:
+                return index[key]
+        return None
+
+    def _refresh(self, key: str) -> bool:
+        """ Bring the diff entries of key up to date. Returns whether they
+        changed."""
+        egg = self.remote_egg(key)
+        local_egg = self.local_index.get(key) if egg is not None else None
+        section = None
+        if egg is not None:
+            if local_egg is None:
+                section = self.missing
+            elif self.changed is not None and self.changed(local_egg, egg):
+                section = self.changed_eggs
+        modified = False
+        for entries in (self.missing, self.changed_eggs):
+            if entries is section:
+                if entries.get(key) is not egg:
+                    modified = modified or entries.get(key) != egg
+                    entries[key] = egg
+            elif entries.pop(key, None) is not None:
+                modified = True
+        return modified
+
+
+def watch_diff(local_idx_json: str, org_repos: Tuple[str],
+               plats: Tuple[str], vers: Tuple[str], output: str,
+               interval: float = DEFAULT_WATCH_INTERVAL,
+               polls: Optional[int] = None,
+               sort: bool = True,
+               legacy: bool = False,
+               remote_url: str = "https://packages.enthought.com",
+               jobs: int = DEFAULT_JOBS,
+               client: Optional[Client] = None,
+               detect_changed: bool = False,
+               stop: Optional[threading.Event] = None,
+               report: Optional[Callable[[dict], None]] = None
+               ) -> WatchState:
+    """ Keep output up to date with the full_diff of the local index
+    against the remote indices, polling every interval seconds until polls
+    polls have run, or forever if polls is None, or until stop is set.
+
+    Indices are fetched conditionally on the validators of their current
+    version, and an updated index only has its added, removed and changed
+    eggs diffed again (see WatchState). The local index is reloaded
+    when its file changes. output is written atomically after the first
+    poll that completes the remote side and after every poll that modifies
+    the diff. A fetch failure keeps the previous version of the index.
+
+    report, if given, is called after every poll with {"poll": n,
+    "updated": [combos], "failures": {combo: exception}, "modified": n,
+    "written": bool}. Returns the WatchState.
+    """
+    stop = stop if stop is not None else threading.Event()
+    combos = list(product(org_repos, plats, vers))
+    local_stamp = _file_stamp(local_idx_json)
+    with profiling.phase("load"):
+        local_idx = compact_index(iter_index(local_idx_json))
+    state = WatchState(combos, local_idx,
+                       egg_changed if detect_changed else None)
+    own_client = client is None
+    if own_client:
+        client = Client(pool_size=jobs)
+    written = False
+    try:
+        for poll in count(1):
+            fetched, failures = fan_out(combos, fetch_combo_since, jobs,
+                                        client, url=remote_url,
+                                        legacy=legacy, state=state)
+            modified = 0
+            stamp = _file_stamp(local_idx_json)
+            if stamp != local_stamp:
+                try:
+                    with profiling.phase("load"):
+                        local_idx = compact_index(iter_index(local_idx_json))
+                except (OSError, ValueError):
+                    # e.g. caught mid-write; retried on the next poll
+                    pass
+                else:
+                    local_stamp = stamp
+                    with profiling.phase("diff"):
+                        modified += state.set_local(local_idx)
+            updated = [combo for combo, (idx, _) in fetched.items()
+                       if idx is not None]
+            with profiling.phase("diff"):
+                for combo in updated:
+                    modified += state.update(combo, *fetched[combo])
+            write = state.complete and (modified or not written)
+            if write:
+                with profiling.phase("write"):
+                    write_json(state.diff(), output, sort=sort, atomic=True)
+                written = True
+            if report is not None:
+                report({"poll": poll, "updated": updated,
+                        "failures": failures, "modified": modified,
+                        "written": write})
+            if polls is not None and poll >= polls or stop.wait(interval):
+                break
+    finally:
+        if own_client:
+            client.close()
+    return state
+
+
+def _file_stamp(path: str) -> Optional[tuple]:
+    """ (size, mtime) of a file, or None if it cannot be read."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns